@@ -1,19 +1,26 @@
 import streamlit as st
-import pandas as pd
-from google.cloud import aiplatform
-from google.cloud import translate_v2 as translate
-import io
-import html
-import re
-import emoji
-
-# Initialize Google Cloud AI Platform
-PROJECT_ID = 'ford-180395bd732cdd9af050c1f7'  # Your project ID
-REGION = 'us-central1'  # Your region
-aiplatform.init(project=PROJECT_ID, location=REGION)
-
-# Initialize the Translator client
-translate_client = translate.Client()
+import tempfile
+from translation_cache import get_translation_cache
+from excel_streaming import get_sheet_names, get_sheet_columns, translate_workbook_streaming
+from failure_log import FailureLog
+from normalization import NormalizationReport
+from translation_engine import (
+    translate_sheets, retry_failed_output, job_settings, BACKEND_V2, BACKEND_V3_NMT, BACKEND_LOCAL, BACKEND_MODELS,
+)
+from ui_helpers import (
+    uploaded_file_hash, get_result, store_result, open_job_checkpoint,
+    metrics_panel, render_metrics, metrics_downloads, render_failures,
+)
+
+# Translation backends offered per job; the local model runs offline on this machine's CPU at no cost
+BACKENDS = {
+    'Google Translate v2': BACKEND_V2,
+    'Google Translate v3 (NMT)': BACKEND_V3_NMT,
+    'Local model (CPU, offline)': BACKEND_LOCAL,
+}
+
+# On-disk translation memory shared by all runs
+translation_cache = get_translation_cache()
 
 # List of common languages for user selection
 LANGUAGES = {
@@ -54,42 +61,6 @@ LANGUAGES = {
     'Vietnamese': 'vi'
 }
 
-def convert_emoticons(text):
-    return emoji.demojize(text)
-
-def remove_usernames(text):
-    return re.sub(r'@\w+', '', text)
-
-def remove_hyperlinks(text):
-    return re.sub(r'http\S+|www\S+|https\S+', '', text)
-
-def clean_extra_spaces(text):
-    return re.sub(r'\s+', ' ', text).strip()
-
-def standardize_quotes(text):
-    return text.replace('“', '"').replace('”', '"')
-
-# def remove_special_characters(text):
-#     return re.sub(r'[^a-zA-Z0-9\s.,!?\'"()]+', '', text)
-
-# Function to translate text to English with post-processing
-def translate_text(text, source_language):
-    try:
-        result = translate_client.translate(text, target_language='en', source_language=source_language)
-        translated_text = html.unescape(result['translatedText'])
-        
-        # Apply post-processing
-        translated_text = convert_emoticons(translated_text)
-        translated_text = remove_usernames(translated_text)
-        translated_text = remove_hyperlinks(translated_text)
-        translated_text = clean_extra_spaces(translated_text)
-        translated_text = standardize_quotes(translated_text)
-        # translated_text = remove_special_characters(translated_text)
-
-        return translated_text
-    except Exception as e:
-        return f"Error: {str(e)}"
-
 # Streamlit Application
 st.title("CIA Language Translation App")
 st.markdown("Description: This is an advanced AI-powered language translator that can Auto-detect and translate Multi-Sheet, Multi-Language MS Excel files")
@@ -98,51 +69,117 @@ st.write("Upload an Excel file with multiple sheets containing text for translat
 # Language selection dropdown
 source_language = st.selectbox("Select source language:", list(LANGUAGES.keys()))
 
+# Backend of this job; its client or model is created on the first cache miss
+BACKEND = BACKENDS[st.selectbox("Select translation backend:", list(BACKENDS))]
+MODEL = BACKEND_MODELS[BACKEND]
+
+# 'Auto Detect' identifies each cell's language locally and skips cells that are already in English
+detect_locally = LANGUAGES[source_language] is None
+
+# Dropping links, @handles, extra whitespace and trailing emoji before translation lowers the billed characters
+normalize = st.checkbox("Normalize texts before translation")
+
+# Translation cache status
+with st.sidebar:
+    cache_stats = translation_cache.stats()
+    st.caption(f"Translation cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if st.button("Clear cached translations"):
+        translation_cache.invalidate(MODEL)
+
+# Timing, API usage and cost metrics, updated as the translation runs
+performance_panel = metrics_panel()
+
 # File uploader
 uploaded_file = st.file_uploader("Choose an Excel file", type=['xlsx'])
 
 if uploaded_file is not None:
-    # Load the Excel file to get sheet names
-    excel_file = pd.ExcelFile(uploaded_file)
-    sheet_names = excel_file.sheet_names
+    # Read the sheet names without loading the workbook into memory
+    sheet_names = get_sheet_names(uploaded_file)
 
     # Select multiple sheets to translate
     selected_sheets = st.multiselect("Select sheets for translation:", sheet_names)
 
+    # Only free-text columns are translated; these overrides adjust the automatic detection
+    sheet_columns = get_sheet_columns(uploaded_file, selected_sheets)
+    column_names = sorted({str(column) for columns in sheet_columns.values() for column in columns})
+    include_columns = st.multiselect("Always translate these columns:", column_names)
+    exclude_columns = st.multiselect("Never translate these columns:", column_names)
+
+    # Results are remembered per file content and settings, so reruns and downloads cost no API calls
+    file_hash = uploaded_file_hash(uploaded_file)
+    result_key = (file_hash, tuple(selected_sheets), source_language, normalize, BACKEND, tuple(include_columns), tuple(exclude_columns))
+
     # Submit button to trigger translation
     if st.button("Submit"):
         if selected_sheets:
-            # Create a dictionary to hold all sheets
-            all_sheets = {}
-
-            # Load all sheets into the dictionary
-            for sheet in sheet_names:
-                df = pd.read_excel(uploaded_file, sheet_name=sheet)
-
-                # If this sheet is selected, translate all columns
-                if sheet in selected_sheets:
-                    for column in df.columns:
-                        df[column] = df[column].astype(str).apply(lambda x: translate_text(x, LANGUAGES[source_language]))
-                    all_sheets[sheet] = df  # Save the translated DataFrame
-                else:
-                    all_sheets[sheet] = df  # Save the original DataFrame
-
-            # Create a BytesIO buffer for the Excel file
-            output_buffer = io.BytesIO()
-            with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                for sheet_name, data in all_sheets.items():
-                    data.to_excel(writer, index=False, sheet_name=sheet_name)
-
-            # Set the buffer position to the beginning
-            output_buffer.seek(0)
-
-            # Download button for the translated output
-            st.download_button(
-                label="Download Translated File",
-                data=output_buffer,
-                file_name=f'translated_{uploaded_file.name}',
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            totals = {'cells': 0, 'distinct': 0}
+            normalization_report = NormalizationReport() if normalize else None
+            # Failed cells stay empty and are listed here, so they can be retried on their own
+            failures = FailureLog()
+            # Data rows of each sheet already translated, to place the failures of later chunks
+            sheet_rows = {}
+
+            # Completed batches are checkpointed so an interrupted run resumes where it stopped
+            settings = job_settings(
+                LANGUAGES[source_language], 'en', BACKEND, include_columns, exclude_columns, detect_locally=detect_locally
             )
+            settings['sheets'] = sorted(selected_sheets)
+            checkpoint = open_job_checkpoint(file_hash, settings)
+
+            # Translate one chunk of rows: every distinct value of the chunk once, broadcast back
+            def translate_chunk(sheet_name, chunk):
+                row_offset = sheet_rows.get(sheet_name, 0)
+                sheet_rows[sheet_name] = row_offset + len(chunk)
+                plan = translate_sheets(
+                    {sheet_name: chunk}, LANGUAGES[source_language], 'en', BACKEND,
+                    include=include_columns, exclude=exclude_columns, checkpoint=checkpoint, detect_locally=detect_locally,
+                    normalize=normalize, normalization_report=normalization_report,
+                    failures=failures, row_offset=row_offset,
+                )
+                totals['cells'] += plan.total_cells
+                totals['distinct'] += len(plan.uniques)
+                render_metrics(performance_panel)
+                return chunk
+
+            # Stream the workbook chunk by chunk into a write-only workbook spooled to disk
+            with tempfile.TemporaryFile() as output_buffer:
+                translate_workbook_streaming(uploaded_file, output_buffer, selected_sheets, translate_chunk)
+
+                # Set the buffer position to the beginning
+                output_buffer.seek(0)
+                summary = f"Translated {totals['cells']} text cells ({totals['distinct']} distinct values after per-chunk dedup)"
+                if normalization_report is not None:
+                    summary += f". {normalization_report.summary()}"
+                store_result(result_key, (summary, output_buffer.read(), failures))
+            checkpoint.remove()
 
         else:
             st.warning("Please select at least one sheet to translate.")
+
+    result = get_result(result_key)
+    if result is not None:
+        summary, output_bytes, failures = result
+        output_name = f'translated_{uploaded_file.name}'
+        st.info(summary)
+
+        # Download button for the translated output
+        st.download_button(
+            label="Download Translated File",
+            data=output_bytes,
+            file_name=output_name,
+            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+        # Only the failed cells are sent again; the rest of the workbook is kept as it is
+        if failures and render_failures(failures, output_name, f'{file_hash}_failures'):
+            with st.spinner(f"Retrying {len(failures)} failed cells..."):
+                output_bytes, remaining = retry_failed_output(
+                    output_name, output_bytes, failures, LANGUAGES[source_language], BACKEND, detect_locally=detect_locally,
+                )
+            summary += f". Retried {len(failures)} failed cells, {len(failures) - len(remaining)} translated"
+            store_result(result_key, (summary, output_bytes, remaining))
+            st.rerun()
+
+# Pipeline metrics of this server process, including the run above
+render_metrics(performance_panel)
+metrics_downloads()
@@ -1,23 +1,49 @@
 import streamlit as st
 import pandas as pd
 import io
-import html
-import re
-import emoji
 import os
-from google.cloud import aiplatform
-from google.cloud import translate_v2 as translate
-from docx import Document
-import PyPDF2
-from pptx import Presentation
+import tempfile
+from batch_upload import batch_summary, expand_inputs, inputs_hash, retry_failed_archive, translate_inputs
+from cell_filters import select_text_columns
+from checkpoint import open_checkpoint
+from csv_streaming import get_csv_columns, read_csv, translate_csv_streaming
+from document_extraction import iter_document_segments
+from translation_cache import get_translation_cache
+from translation_memory import load_translation_memory
+from failure_log import FailureLog
+from normalization import NormalizationReport
+from translation_engine import (
+    translate_document_segments, translate_sheets, translate_sheets_multi, retry_failed_output, job_settings,
+    BACKEND_V2, BACKEND_V3_NMT, BACKEND_LOCAL, BACKEND_MODELS, LAYOUT_COLUMNS, LAYOUT_SHEETS,
+)
+from metrics import get_metrics
+from ui_helpers import (
+    uploaded_file_hash, cached_extract_text_from_file, metrics_panel, render_metrics, metrics_downloads,
+    submit_job, render_jobs, poll_jobs, render_sheet_preview, render_text_preview,
+)
 
-# Initialize Google Cloud AI Platform
-PROJECT_ID = 'ford-180395bd732cdd9af050c1f7'  # Your project ID
-REGION = 'us-central1'  # Your region
-aiplatform.init(project=PROJECT_ID, location=REGION)
+# Rows of a CSV file shown before translation; the file itself is streamed in chunks
+CSV_PREVIEW_ROWS = 100
 
-# Initialize the Translator client
-translate_client = translate.Client()
+# Rows or lines shown in the preview of a running job, and document lines between two progress reports
+JOB_PREVIEW_ROWS = 20
+JOB_PROGRESS_LINES = 50
+
+# Layouts of a workbook translated into several languages
+LAYOUTS = {
+    'A column per language next to each translated column': LAYOUT_COLUMNS,
+    'A copy of every sheet per language': LAYOUT_SHEETS,
+}
+
+# Translation backends offered per job; the local model runs offline on this machine's CPU at no cost
+BACKENDS = {
+    'Google Translate v2': BACKEND_V2,
+    'Google Translate v3 (NMT)': BACKEND_V3_NMT,
+    'Local model (CPU, offline)': BACKEND_LOCAL,
+}
+
+# On-disk translation memory shared by all runs
+translation_cache = get_translation_cache()
 
 # List of common languages for user selection
 LANGUAGES = {
@@ -58,80 +84,205 @@ LANGUAGES = {
     'Vietnamese': 'vi'
 }
 
-def convert_emoticons(text):
-    return emoji.demojize(text)
-
-def remove_usernames(text):
-    return re.sub(r'@\w+', '', text)
-
-def remove_hyperlinks(text):
-    return re.sub(r'http\S+|www\S+|https\S+', '', text)
-
-def clean_extra_spaces(text):
-    return re.sub(r'\s+', ' ', text).strip()
-
-def standardize_quotes(text):
-    return text.replace('“', '"').replace('”', '"')
-
-def remove_special_characters(text):
-    return re.sub(r'[^a-zA-Z0-9\s.,!?\'"()]+', '', text)
-
-# Function to translate text to English with post-processing
-def translate_text(text, source_language):
-    try:
-        result = translate_client.translate(text, target_language='en', source_language=source_language)
-        translated_text = html.unescape(result['translatedText'])
-        
-        # Apply post-processing
-        translated_text = convert_emoticons(translated_text)
-        translated_text = remove_usernames(translated_text)
-        translated_text = remove_hyperlinks(translated_text)
-        translated_text = clean_extra_spaces(translated_text)
-        translated_text = standardize_quotes(translated_text)
-        translated_text = remove_special_characters(translated_text)
-
-        return translated_text
-    except Exception as e:
-        return f"Error: {str(e)}"
-
-# Function to extract text from various file types
-def extract_text_from_file(file):
-    if file.name.endswith('.xlsx'):
-        return pd.read_excel(file, sheet_name=None)  # Read all sheets into a dict
-    elif file.name.endswith('.csv'):
-        return pd.read_csv(file)  # Read CSV
-    elif file.name.endswith('.docx'):
-        doc = Document(file)
-        return '\n'.join([para.text for para in doc.paragraphs])
-    elif file.name.endswith('.pdf'):
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ''
-        for page in pdf_reader.pages:
-            text += page.extract_text() + '\n'
-        return text
-    elif file.name.endswith('.pptx'):
-        ppt = Presentation(file)
-        text = ''
-        for slide in ppt.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + '\n'
-        return text
-    else:
-        return None
-
 # Streamlit Application
 st.title("Multi-Document Language Translation App")
-st.write("Upload a document with text for translation.")
+st.write("Upload one or more documents, or a .zip archive of them, for translation.")
 
 # Language selection dropdown
 source_language = st.selectbox("Select source language:", list(LANGUAGES.keys()))
 
-# File uploader for multiple file types
-uploaded_file = st.file_uploader("Choose a file", type=['xlsx', 'csv', 'docx', 'pdf', 'pptx'])
+# Target languages; spreadsheets are parsed once and translated into all of them, documents into the first
+target_language_names = st.multiselect(
+    "Select target languages:", [name for name, code in LANGUAGES.items() if code], default=['English']
+)
+TARGETS = [LANGUAGES[name] for name in target_language_names] or ['en']
+TARGET = TARGETS[0]
+
+# Backend of this job; its client or model is created on the first cache miss
+BACKEND = BACKENDS[st.selectbox("Select translation backend:", list(BACKENDS))]
+MODEL = BACKEND_MODELS[BACKEND]
+
+# 'Auto Detect' identifies each cell's language locally and skips cells that are already in the target language
+detect_locally = LANGUAGES[source_language] is None
+
+# Dropping links, @handles, extra whitespace and trailing emoji before translation lowers the billed characters
+normalize = st.checkbox("Normalize texts before translation")
+
+# Function to wrap the content of an uploaded file so it can be read again in a background job
+def named_buffer(name, content):
+    buffer = io.BytesIO(content)
+    buffer.name = name
+    return buffer
+
+# Function to open the checkpoints of a job, one per target language
+def open_target_checkpoints(input_hash, include_columns=(), exclude_columns=(), targets=None):
+    return {
+        target: open_checkpoint(
+            input_hash,
+            job_settings(LANGUAGES[source_language], target, BACKEND, include_columns, exclude_columns, True, detect_locally),
+        )
+        for target in targets or TARGETS
+    }
+
+# Function to build a job that translates again only the failed cells of a finished job's result
+def retry_failed_job(previous, source_language_code, backend, detect):
+    def run(job):
+        file_name, data, mime = previous.result
+        options = {'remove_special': True, 'detect_locally': detect}
+        if file_name.endswith('.zip'):
+            output_buffer = io.BytesIO()
+            remaining = retry_failed_archive(
+                io.BytesIO(data), output_buffer, previous.failures, source_language_code, backend, **options
+            )
+            output_bytes = output_buffer.getvalue()
+        else:
+            output_bytes, remaining = retry_failed_output(
+                file_name, data, previous.failures, source_language_code, backend, **options
+            )
+        job.publish(len(previous.failures) - len(remaining))
+        job.summary = f"Retried {len(previous.failures)} failed cells, {len(previous.failures) - len(remaining)} translated"
+        job.failures = remaining
+        job.retry = retry_failed_job(job, source_language_code, backend, detect)
+        return file_name, output_bytes, mime
+    return run
+
+# Translation cache status
+with st.sidebar:
+    cache_stats = translation_cache.stats()
+    st.caption(f"Translation cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if st.button("Clear cached translations"):
+        translation_cache.invalidate(MODEL)
+
+# Timing, API usage and cost metrics, updated as the translation runs
+performance_panel = metrics_panel()
+
+# File uploader for multiple file types; several files or a .zip archive are translated as one batch
+uploaded_files = st.file_uploader(
+    "Choose files or a .zip archive", type=['xlsx', 'csv', 'docx', 'pdf', 'pptx', 'zip'], accept_multiple_files=True
+)
+single_upload = len(uploaded_files) == 1 and not uploaded_files[0].name.endswith('.zip')
+uploaded_file = uploaded_files[0] if single_upload else None
+
+if uploaded_files and not single_upload:
+    # Every file goes into one shared queue: each distinct text is translated once across all files
+    batch_inputs = expand_inputs(uploaded_files)
+    st.write(f"{len(batch_inputs)} files to translate:")
+    st.write(", ".join(name for name, _ in batch_inputs))
+
+    batch_hash = inputs_hash(batch_inputs)
+    result_key = (batch_hash, source_language, TARGET, normalize, BACKEND)
+    if len(TARGETS) > 1:
+        st.warning(f"Batches are translated into the first selected language only ({target_language_names[0]}).")
+
+    # Translate the batch in the background; progress counts distinct texts
+    def run(job):
+        # Completed batches are checkpointed so an interrupted or cancelled run resumes where it stopped
+        checkpoint = open_target_checkpoints(batch_hash, targets=[TARGET])[TARGET]
+        normalization_report = NormalizationReport() if normalize else None
+        # Failed spreadsheet cells stay empty and are listed by archive member, so they can be retried on their own
+        job.failures = FailureLog()
+        with tempfile.TemporaryFile() as output_buffer:
+            counts = translate_inputs(
+                batch_inputs, output_buffer, LANGUAGES[source_language], TARGET, BACKEND,
+                remove_special=True, checkpoint=checkpoint, detect_locally=detect_locally, normalize=normalize,
+                normalization_report=normalization_report, failures=job.failures,
+                on_progress=lambda done, total: job.publish(done, total),
+            )
+            output_buffer.seek(0)
+            output_bytes = output_buffer.read()
+        job.summary = f"Translated {batch_summary(counts)}"
+        if normalization_report is not None:
+            job.summary += f". {normalization_report.summary()}"
+        checkpoint.remove()
+        job.retry = retry_failed_job(job, LANGUAGES[source_language], BACKEND, detect_locally)
+        return 'translated_files.zip', output_bytes, 'application/zip'
+
+    if batch_inputs and st.button("Submit"):
+        submit_job(result_key, f"{len(batch_inputs)} files", run)
+
+elif uploaded_file is not None and uploaded_file.name.endswith('.csv'):
+    # CSV files are streamed chunk by chunk in their detected encoding instead of being loaded whole
+    file_hash = uploaded_file_hash(uploaded_file)
+    st.write(f"First {CSV_PREVIEW_ROWS} rows:")
+    st.dataframe(read_csv(uploaded_file, nrows=CSV_PREVIEW_ROWS))
+
+    # Only free-text columns are translated; these overrides adjust the automatic detection
+    column_names = [str(column) for column in get_csv_columns(uploaded_file)]
+    include_columns = st.multiselect("Always translate these columns:", column_names)
+    exclude_columns = st.multiselect("Never translate these columns:", column_names)
+
+    result_key = (file_hash, source_language, tuple(TARGETS), normalize, BACKEND, tuple(include_columns), tuple(exclude_columns))
+    file_name = uploaded_file.name
+    content = uploaded_file.getvalue()
+
+    # Translate the file in the background; progress counts rows, estimated from the line breaks
+    def run(job):
+        checkpoints = open_target_checkpoints(file_hash, include_columns, exclude_columns)
+        totals = {'rows': 0, 'cells': 0, 'distinct': 0}
+        # With several target languages, every chunk gets the translated columns chosen for the first one
+        language_columns = {}
+        normalization_report = NormalizationReport() if normalize else None
+        output_name = f'translated_{os.path.splitext(file_name)[0]}.csv'
+        output_descriptor, output_path = tempfile.mkstemp(suffix='.csv')
+        os.close(output_descriptor)
+        # Failed cells stay empty and are listed here, so they can be retried on their own
+        job.failures = FailureLog()
+
+        # The rows written so far; the file always ends with a whole chunk when a new one starts
+        def build_partial():
+            with open(output_path, 'rb') as output_file:
+                return output_name, output_file.read(), 'text/csv'
+
+        # Translate one chunk of rows: every distinct value of the chunk once, broadcast back
+        def translate_chunk(chunk):
+            job.publish(totals['rows'], build_partial=build_partial)
+            if len(TARGETS) == 1:
+                plan = translate_sheets(
+                    {'Sheet1': chunk}, LANGUAGES[source_language], TARGET, BACKEND,
+                    include=include_columns, exclude=exclude_columns, remove_special=True, checkpoint=checkpoints[TARGET],
+                    detect_locally=detect_locally, normalize=normalize, normalization_report=normalization_report,
+                    failures=job.failures, row_offset=totals['rows'],
+                )
+            else:
+                language_columns.setdefault(
+                    'Sheet1', [column for column, _ in select_text_columns(chunk, include_columns, exclude_columns)]
+                )
+                _, plan = translate_sheets_multi(
+                    {'Sheet1': chunk}, LANGUAGES[source_language], TARGETS, BACKEND,
+                    include=include_columns, exclude=exclude_columns, language_columns=language_columns,
+                    remove_special=True, checkpoints=checkpoints, detect_locally=detect_locally, normalize=normalize,
+                    normalization_report=normalization_report, failures=job.failures, row_offset=totals['rows'],
+                    check_cancelled=job.raise_if_cancelled,
+                )
+            totals['rows'] += len(chunk)
+            totals['cells'] += plan.total_cells
+            totals['distinct'] += len(plan.uniques)
+            job.publish(totals['rows'], max(job.total, totals['rows']), preview={'Sheet1': chunk.head(JOB_PREVIEW_ROWS)})
+            return chunk
+
+        try:
+            source = named_buffer(file_name, content)
+            rows = translate_csv_streaming(source, output_path, translate_chunk)
+            output_name, output_bytes, mime = build_partial()
+        finally:
+            os.remove(output_path)
+        job.summary = (f"Translated {totals['cells']} text cells in {rows} rows into {', '.join(TARGETS)} "
+                       f"({totals['distinct']} distinct values after per-chunk dedup)")
+        if normalization_report is not None:
+            job.summary += f". {normalization_report.summary()}"
+        for checkpoint in checkpoints.values():
+            checkpoint.remove()
+        job.retry = retry_failed_job(job, LANGUAGES[source_language], BACKEND, detect_locally)
+        return output_name, output_bytes, mime
 
-if uploaded_file is not None:
-    extracted_text = extract_text_from_file(uploaded_file)
+    if st.button("Submit"):
+        submit_job(result_key, file_name, run, total=max(content.count(b'\n') - 1, 1))
+
+elif uploaded_file is not None:
+    # Parse the file once per content hash; reruns reuse the parsed content
+    file_hash = uploaded_file_hash(uploaded_file)
+    extracted_text = cached_extract_text_from_file(file_hash, uploaded_file)
+    file_name = uploaded_file.name
 
     # Handle different cases based on file type
     if isinstance(extracted_text, dict):  # If it's an Excel file with multiple sheets
@@ -139,62 +290,152 @@ if uploaded_file is not None:
         sheet_data = {}
         for sheet_name, df in extracted_text.items():
             st.write(f"**{sheet_name}**")
-            st.dataframe(df)
-            sheet_data[sheet_name] = df  # Store original data for processing later
+            render_sheet_preview(df, f'{file_hash}_{sheet_name}')
+            sheet_data[sheet_name] = df  # Shared parsed sheets, only read here; the job translates a copy
 
-        # Submit button to trigger translation
-        if st.button("Submit"):
-            # Translate all sheets
-            for sheet_name, df in sheet_data.items():
-                for column in df.columns:
-                    df[column] = df[column].astype(str).apply(lambda x: translate_text(x, LANGUAGES[source_language]))
-                sheet_data[sheet_name] = df  # Update the translated DataFrame
-            
-            # Create a BytesIO buffer for the Excel file
+        # Only free-text columns are translated; these overrides adjust the automatic detection
+        column_names = sorted({str(column) for df in sheet_data.values() for column in df.columns})
+        include_columns = st.multiselect("Always translate these columns:", column_names)
+        exclude_columns = st.multiselect("Never translate these columns:", column_names)
+
+        # Several target languages go into new columns next to the originals or into a copy of every sheet
+        layout = LAYOUTS[st.radio("Translations of several languages:", list(LAYOUTS))] if len(TARGETS) > 1 else None
+
+        # Recurring exports: the translated output of the previous period answers the rows that did not change
+        with st.expander("Reuse a previous translation"):
+            previous_output_file = st.file_uploader("Previous translated output", type=['xlsx', 'csv'])
+            previous_input_file = st.file_uploader("Its input file (to align the two cell by cell)", type=['xlsx', 'csv'])
+        previous_files = [
+            (uploaded.name, uploaded.getvalue()) if uploaded is not None else None
+            for uploaded in (previous_output_file, previous_input_file)
+        ]
+
+        # Jobs are remembered per file content and settings, so reruns do not translate the file again
+        result_key = (
+            file_hash, source_language, tuple(TARGETS), layout, normalize, BACKEND, tuple(include_columns),
+            tuple(exclude_columns), tuple(uploaded_file_hash(uploaded) if uploaded is not None else None
+                                          for uploaded in (previous_output_file, previous_input_file)),
+        )
+        output_name = f'translated_{os.path.splitext(file_name)[0]}.xlsx'
+
+        # Serialize the sheets as they are, with the cells translated so far
+        def build_workbook(output_sheets):
             output_buffer = io.BytesIO()
-            with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                for sheet_name, data in sheet_data.items():
+            with get_metrics().timed('write', file_type='xlsx'), pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
+                for sheet_name, data in output_sheets.items():
                     data.to_excel(writer, index=False, sheet_name=sheet_name)
+            return output_name, output_buffer.getvalue(), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
 
-            # Set the buffer position to the beginning
-            output_buffer.seek(0)
+        # Translate the workbook in the background; progress counts distinct values
+        def run(job):
+            checkpoints = open_target_checkpoints(file_hash, include_columns, exclude_columns)
+            job_sheets = {sheet_name: df.copy() for sheet_name, df in sheet_data.items()}
 
-            # Construct the output file name
-            original_file_name = os.path.splitext(uploaded_file.name)[0]  # Get the original file name without extension
-            output_file_name = f'translated_{original_file_name}.xlsx'  # Add the translated prefix
+            # The previous translations answer the texts they know; cell alignment applies to the first target language
+            memories = {}
+            if previous_files[0] is not None:
+                for i, target in enumerate(TARGETS):
+                    previous_output, previous_input = [
+                        named_buffer(*previous_file) if previous_file is not None else None
+                        for previous_file in previous_files
+                    ]
+                    memories[target] = load_translation_memory(previous_output, previous_input if i == 0 else None, target)
 
-            # Download button for the translated output
-            st.download_button(
-                label="Download Translated File",
-                data=output_buffer,
-                file_name=output_file_name,
-                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+            # Report a finished slice of values with the first rows of every sheet as they are now
+            def on_progress(done, total):
+                preview = {sheet_name: data.head(JOB_PREVIEW_ROWS) for sheet_name, data in job_sheets.items()}
+                job.publish(done, total, preview=preview, build_partial=lambda: build_workbook(job_sheets))
+
+            # Translate every distinct value across all sheets once and broadcast it back; failed cells stay empty
+            normalization_report = NormalizationReport() if normalize else None
+            job.failures = FailureLog()
+            output_sheets = job_sheets
+            if layout is None:
+                plan = translate_sheets(
+                    job_sheets, LANGUAGES[source_language], TARGET, BACKEND,
+                    include=include_columns, exclude=exclude_columns, remove_special=True, checkpoint=checkpoints[TARGET],
+                    detect_locally=detect_locally, normalize=normalize, normalization_report=normalization_report,
+                    on_progress=on_progress, failures=job.failures, memory=memories.get(TARGET),
+                )
+            else:
+                # All target languages at once; progress counts the languages that are done
+                job.publish(0, len(TARGETS))
+                finished_targets = []
+
+                def on_target_done(target):
+                    finished_targets.append(target)
+                    job.publish(len(finished_targets))
+
+                output_sheets, plan = translate_sheets_multi(
+                    job_sheets, LANGUAGES[source_language], TARGETS, BACKEND,
+                    include=include_columns, exclude=exclude_columns, layout=layout, remove_special=True,
+                    checkpoints=checkpoints, detect_locally=detect_locally, normalize=normalize,
+                    normalization_report=normalization_report, on_target_done=on_target_done, failures=job.failures,
+                    memories=memories, check_cancelled=job.raise_if_cancelled,
+                )
+            job.summary = f"Translation plan: {plan.summary()}, translated into {', '.join(TARGETS)}"
+            if normalization_report is not None:
+                job.summary += f". {normalization_report.summary()}"
+            for target, memory in memories.items():
+                memory.track(plan.uniques)
+                job.summary += f". {target}: {memory.summary()}"
+            for checkpoint in checkpoints.values():
+                checkpoint.remove()
+            job.retry = retry_failed_job(job, LANGUAGES[source_language], BACKEND, detect_locally)
+            return build_workbook(output_sheets)
+
+        # Submit button to trigger translation
+        if st.button("Submit"):
+            submit_job(result_key, file_name, run)
 
     elif isinstance(extracted_text, str):  # If it's a text extracted from docx, pdf, or pptx
         st.write("Extracted Text:")
-        st.text_area("Text for Translation", extracted_text, height=300)
+        render_text_preview("Text for Translation", extracted_text, f'{file_hash}_text')
+
+        result_key = (file_hash, source_language, TARGET, normalize, BACKEND)
+        if len(TARGETS) > 1:
+            st.warning(f"Documents are translated into the first selected language only ({target_language_names[0]}).")
+        content = uploaded_file.getvalue()
+
+        # Translate the document in the background, window by window as its pages are extracted; progress counts lines
+        def run(job):
+            checkpoint = open_target_checkpoints(file_hash, targets=[TARGET])[TARGET]
+            source = named_buffer(file_name, content)
+            lines = []
+            normalization_report = NormalizationReport() if normalize else None
+
+            def build_partial():
+                return 'translated_text.txt', '\n'.join(lines).encode('utf-8'), 'text/plain'
+
+            translated_segments = translate_document_segments(
+                iter_document_segments(source), LANGUAGES[source_language], TARGET, BACKEND,
+                remove_special=True, checkpoint=checkpoint, detect_locally=detect_locally, normalize=normalize,
+                normalization_report=normalization_report,
+            )
+            for _, translated_text in translated_segments:
+                lines.append(translated_text)
+                if len(lines) % JOB_PROGRESS_LINES == 0:
+                    job.publish(len(lines), preview='\n'.join(lines[-JOB_PREVIEW_ROWS:]), build_partial=build_partial)
+            job.publish(len(lines), len(lines), preview='\n'.join(lines[-JOB_PREVIEW_ROWS:]))
+            job.summary = f"Translated {len(lines)} lines"
+            if normalization_report is not None:
+                job.summary += f". {normalization_report.summary()}"
+            checkpoint.remove()
+            return build_partial()
 
         # Submit button to trigger translation
         if st.button("Submit"):
-            # Translate the text
-            translated_text = translate_text(extracted_text, LANGUAGES[source_language])
-            st.write("Translated Text:")
-            st.text_area("Translated Text", translated_text, height=300)
-
-            # Download button for the translated output
-            if st.button("Download Translated Text"):
-                # Create a text file for download
-                output_buffer = io.BytesIO()
-                output_buffer.write(translated_text.encode('utf-8'))
-                output_buffer.seek(0)
-                
-                st.download_button(
-                    label="Download Translated File",
-                    data=output_buffer,
-                    file_name='translated_text.txt',
-                    mime='text/plain'
-                )
-    
+            submit_job(result_key, file_name, run, total=extracted_text.count('\n') + 1)
+
     else:
         st.error("Unsupported file type or empty file.")
+
+# Background jobs of this server process; they keep running when the page is left or reloaded
+render_jobs()
+
+# Pipeline metrics of this server process, including the runs above
+render_metrics(performance_panel)
+metrics_downloads()
+
+# Refresh the page while jobs are running
+poll_jobs()
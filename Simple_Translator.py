@@ -1,62 +1,47 @@
 import streamlit as st
 import pandas as pd
-from google.cloud import aiplatform
-from google.cloud import translate_v2 as translate
 import io
-import html
-import re
-import emoji
 import os
-
-# Initialize Google Cloud AI Platform
-PROJECT_ID = 'ford-180395bd732cdd9af050c1f7'  # Your project ID
-REGION = 'us-central1'  # Your region
-aiplatform.init(project=PROJECT_ID, location=REGION)
-
-# Initialize the Translator client
-translate_client = translate.Client()
-
-def convert_emoticons(text):
-    return emoji.demojize(text)
-
-def remove_usernames(text):
-    return re.sub(r'@\w+', '', text)
-
-def remove_hyperlinks(text):
-    return re.sub(r'http\S+|www\S+|https\S+', '', text)
-
-def clean_extra_spaces(text):
-    return re.sub(r'\s+', ' ', text).strip()
-
-def standardize_quotes(text):
-    return text.replace('“', '"').replace('”', '"')
-
-# def remove_special_characters(text):
-#     return re.sub(r'[^a-zA-Z0-9\s.,!?\'"()]+', '', text)
-
-# Function to translate text to English with post-processing
-def translate_to_english(verbatim):
-    try:
-        result = translate_client.translate(verbatim, target_language='en')
-        translated_text = html.unescape(result['translatedText'])
-        
-        # Apply post-processing
-        translated_text = convert_emoticons(translated_text)
-        translated_text = remove_usernames(translated_text)
-        translated_text = remove_hyperlinks(translated_text)
-        translated_text = clean_extra_spaces(translated_text)
-        translated_text = standardize_quotes(translated_text)
-        #translated_text = remove_special_characters(translated_text)
-
-        return translated_text
-    except Exception as e:
-        return f"Error: {str(e)}"
+import numpy as np
+from cell_filters import translatable_mask
+from failure_log import CellFailure, FailureLog
+from translation_cache import get_translation_cache
+from translation_engine import translate_texts, retry_failed_cells, BACKEND_V2, BACKEND_MODELS
+from metrics import get_metrics
+from ui_helpers import (
+    uploaded_file_hash, cached_extract_text_from_file, get_result, store_result,
+    metrics_panel, render_metrics, metrics_downloads, render_sheet_preview, render_failures,
+)
+
+# Translation backend; its client is created on the first cache miss
+BACKEND = BACKEND_V2
+
+# On-disk translation memory shared by all runs
+translation_cache = get_translation_cache()
+MODEL = BACKEND_MODELS[BACKEND]
+
+# Function to write the translated sheet as a workbook
+def translated_workbook(df):
+    output_buffer = io.BytesIO()
+    with get_metrics().timed('write', file_type='xlsx'), pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='Translations')
+    return output_buffer.getvalue()
 
 # Streamlit Application
 st.title("CIA Language Translation App")
 st.markdown("Description: This is a Multi-Sheet, Multi-Language Auto-detect capabled Translation App")
 st.write("Upload an Excel file with multiple sheets containing a 'Verbatim' column for translation.")
 
+# Translation cache status
+with st.sidebar:
+    cache_stats = translation_cache.stats()
+    st.caption(f"Translation cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if st.button("Clear cached translations"):
+        translation_cache.invalidate(MODEL)
+
+# Timing, API usage and cost metrics, updated as the translation runs
+performance_panel = metrics_panel()
+
 # File uploader
 uploaded_file = st.file_uploader("Choose an Excel file", type=['xlsx'])
 
@@ -64,40 +49,66 @@ if uploaded_file is not None:
     # Extract the original file name without the extension
     original_file_name = os.path.splitext(uploaded_file.name)[0]
     
-    # Load the Excel file to get sheet names
-    excel_file = pd.ExcelFile(uploaded_file)
-    sheet_names = excel_file.sheet_names
+    # Parse the workbook once per file content; reruns reuse the parsed sheets
+    file_hash = uploaded_file_hash(uploaded_file)
+    sheets = cached_extract_text_from_file(file_hash, uploaded_file)
+    sheet_names = list(sheets)
 
     # Select a sheet to translate
     selected_sheet = st.selectbox("Select a sheet for translation:", sheet_names)
 
     if selected_sheet:
         # Load the selected sheet
-        df = pd.read_excel(uploaded_file, sheet_name=selected_sheet)
+        df = sheets[selected_sheet]
 
         # Check if 'Verbatim' column exists
         if 'Verbatim' in df.columns:
-            # Translate the 'Verbatim' column
-            df['Translation'] = df['Verbatim'].apply(translate_to_english)
+            # Reruns (widget changes, downloads) reuse the result instead of calling the API again
+            result_key = (file_hash, selected_sheet, BACKEND)
+            result = get_result(result_key)
+            if result is None:
+                # The parsed sheets are shared between reruns, so the translation goes into a copy
+                df = df.copy()
+                # Translate the free-text cells of the 'Verbatim' column; numbers, IDs and blanks are copied as is
+                mask = translatable_mask(df['Verbatim'])
+                verbatims = df.loc[mask, 'Verbatim'].tolist()
+                translations, errors = translate_texts(verbatims, target_language='en', backend=BACKEND, detect_locally=True)
+                df['Translation'] = df['Verbatim']
+                df.loc[mask, 'Translation'] = translations
+
+                # Failed cells stay empty and are listed here, so they can be retried on their own
+                failures = FailureLog()
+                rows = np.flatnonzero(mask)
+                for i, error in errors.items():
+                    failures.add(CellFailure(
+                        'Translations', 'Translation', int(rows[i]), verbatims[i], 'en', type(error).__name__, str(error),
+                    ))
+
+                result = (df, translated_workbook(df), failures)
+                store_result(result_key, result)
+            df, output_bytes, failures = result
 
             # Display the DataFrame with translations
             st.write(f"Translations completed for sheet: {selected_sheet}")
-            st.dataframe(df)
-
-            # Create a BytesIO buffer for the Excel file
-            output_buffer = io.BytesIO()
-            with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                df.to_excel(writer, index=False, sheet_name='Translations')
-
-            # Set the buffer position to the beginning
-            output_buffer.seek(0)
+            render_sheet_preview(df, f'{file_hash}_{selected_sheet}_translated')
 
             # Download button for the translated output
             st.download_button(
                 label="Download Translated File",
-                data=output_buffer,
+                data=output_bytes,
                 file_name=f'{original_file_name}_translated_{selected_sheet}.xlsx',
                 mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
+
+            # Only the failed cells are sent again
+            if failures and render_failures(failures, f'{original_file_name}_translated_{selected_sheet}.xlsx', f'{file_hash}_{selected_sheet}'):
+                with st.spinner(f"Retrying {len(failures)} failed cells..."):
+                    remaining = retry_failed_cells({'Translations': df}, failures, backend=BACKEND, detect_locally=True)
+                store_result(result_key, (df, translated_workbook(df), remaining))
+                st.rerun()
         else:
             st.error("The selected sheet does not contain a 'Verbatim' column.")
+
+# Pipeline metrics of this server process, including the run above
+render_metrics(performance_panel)
+metrics_downloads()
@@ -1,21 +1,31 @@
 import streamlit as st
-import pandas as pd
 import io
-import html
-import re
-import emoji
 import os
-from google.cloud import translate_v3 as translate
-from docx import Document
-import PyPDF2
-from pptx import Presentation
+import tempfile
+from collections import Counter
+from csv_streaming import get_csv_columns, read_csv, translate_csv_streaming
+from translation_cache import get_translation_cache
+from normalization import NormalizationReport
+from segmenter import translate_long_text
+from failure_log import FailureLog
+from translation_engine import (
+    translate_texts, translate_sheets, retry_failed_cells, retry_failed_output, write_sheets, with_error_strings,
+    job_settings, BACKEND_V3_LLM, BACKEND_MODELS, PROJECT_ID, REGION,
+)
+from ui_helpers import (
+    uploaded_file_hash, cached_extract_text_from_file, get_result, store_result, open_job_checkpoint,
+    metrics_panel, render_metrics, metrics_downloads, render_sheet_preview, render_text_preview, render_failures,
+)
 
-# Initialize Google Cloud Project and Region
-PROJECT_ID = 'ford-180395bd732cdd9af050c1f7'  # Your project ID
-REGION = 'us-central1'
+# Translation backend; the v3 client is created on the first cache miss
+BACKEND = BACKEND_V3_LLM
 
-# Initialize the Translator client for v3
-translate_client_v3 = translate.TranslationServiceClient()
+# On-disk translation memory shared by all runs
+translation_cache = get_translation_cache()
+MODEL = BACKEND_MODELS[BACKEND]
+
+# Rows of a CSV file shown before translation; the file itself is streamed in chunks
+CSV_PREVIEW_ROWS = 100
 
 # List of common languages for user selection
 # Removed 'Auto Detect' as it's not supported by Translation LLM
@@ -56,97 +66,75 @@ LANGUAGES = {
     'Vietnamese': 'vi'
 }
 
-# --- Text Pre/Post-processing Functions (kept as is) ---
-def convert_emoticons(text):
-    return emoji.demojize(text)
-
-def remove_usernames(text):
-    return re.sub(r'@\w+', '', text)
+# --- Updated Translation Function using translate_v3 and Translation LLM ---
+def translate_texts_with_llm(texts, source_language_code, project_id, region, checkpoint=None, detect_locally=False,
+                             normalization_report=None, error_counts=None):
+    """
+    Translates a list of texts to English using the Translation LLM model (v3 API).
+    Texts are packed into as few requests as the v3 limits allow and the
+    results are mapped back in order. Includes post-processing steps.
+    Requires an explicit source_language_code. Completed batches are recorded
+    in `checkpoint` when one is given. With `detect_locally`, each text's
+    language is identified offline and texts are sent in per-language groups;
+    source_language_code is then only the fallback for unclear texts. With a
+    `normalization_report`, texts are normalized before they are sent and the
+    characters saved are added to it. Failed texts hold an error message; with
+    `error_counts`, a Counter, their error classes are also counted there so
+    the caller can report them once.
+    """
+    # Return empty string for non-string or empty inputs
+    texts = [text if isinstance(text, str) else "" for text in texts]
 
-def remove_hyperlinks(text):
-    return re.sub(r'http\S+|www\S+|https\S+', '', text)
+    if not source_language_code:
+        return ["Error: Source language must be explicitly selected for Translation LLM." if text else "" for text in texts]
 
-def clean_extra_spaces(text):
-    return re.sub(r'\s+', ' ', text).strip()
+    # The engine references the Translation LLM as a 'general' model, not a project-specific one.
+    translations, errors = translate_texts(
+        texts, source_language_code, 'en', BACKEND, remove_special=True, checkpoint=checkpoint,
+        project_id=project_id, region=region, detect_locally=detect_locally,
+        normalize=normalization_report is not None, normalization_report=normalization_report,
+    )
 
-def standardize_quotes(text):
-    return text.replace('“', '"').replace('”', '"')
+    if error_counts is not None:
+        error_counts.update(type(error).__name__ for error in errors.values())
 
-def remove_special_characters(text):
-    return re.sub(r'[^a-zA-Z0-9\s.,!?\'"()]+', '', text)
+    return with_error_strings(translations, errors, 'Translation Error')
 
-# --- Updated Translation Function using translate_v3 and Translation LLM ---
-# --- Updated Translation Function using translate_v3 and Translation LLM ---
-def translate_text_with_llm(text, source_language_code, project_id, region):
+def translate_document_with_llm(text, source_language_code, project_id, region, checkpoint=None, detect_locally=False,
+                                normalization_report=None, error_counts=None):
     """
-    Translates text to English using the Translation LLM model (v3 API).
-    Includes post-processing steps.
-    Requires an explicit source_language_code.
+    Translates a long document text with the Translation LLM. The text is split
+    at paragraph and sentence boundaries into size-bounded segments that are
+    translated in parallel and put back together in order.
     """
-    if not text or not isinstance(text, str):
-        return "" # Return empty string for non-string or empty inputs
-
-    if not source_language_code:
-        return "Error: Source language must be explicitly selected for Translation LLM."
+    return translate_long_text(
+        text,
+        lambda segments: translate_texts_with_llm(
+            segments, source_language_code, project_id, region, checkpoint, detect_locally, normalization_report,
+            error_counts,
+        ),
+    )
 
-    parent = f"projects/{project_id}/locations/{region}"
-    
-    # *** CRITICAL CHANGE HERE ***
-    # Reference the Translation LLM as a 'general' model, not a project-specific one.
-    model_path = f"projects/{project_id}/locations/{region}/models/general/translation-llm"
-
-    try:
-        request_body = {
-            "parent": parent,
-            "contents": [text],
-            "target_language_code": 'en',
-            "source_language_code": source_language_code, # Explicitly required
-            "model": model_path,
-        }
-
-        response = translate_client_v3.translate_text(request=request_body)
-        translated_text = response.translations[0].translated_text
-        
-        # Apply post-processing
-        translated_text = html.unescape(translated_text)
-        translated_text = convert_emoticons(translated_text)
-        translated_text = remove_usernames(translated_text)
-        translated_text = remove_hyperlinks(translated_text)
-        translated_text = clean_extra_spaces(translated_text)
-        translated_text = standardize_quotes(translated_text)
-        translated_text = remove_special_characters(translated_text)
-
-        return translated_text
-    except Exception as e:
-        st.error(f"Error during LLM translation: {str(e)}")
-        return f"Translation Error: {str(e)}"
-
-# Function to extract text from various file types (kept as is)
-def extract_text_from_file(file):
-    if file.name.endswith('.xlsx'):
-        return pd.read_excel(file, sheet_name=None)
-    elif file.name.endswith('.csv'):
-        file_content = file.read().decode('utf-8')
-        return {'Sheet1': pd.read_csv(io.StringIO(file_content))}
-    elif file.name.endswith('.docx'):
-        doc = Document(file)
-        return '\n'.join([para.text for para in doc.paragraphs])
-    elif file.name.endswith('.pdf'):
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ''
-        for page in pdf_reader.pages:
-            text += page.extract_text() + '\n'
-        return text
-    elif file.name.endswith('.pptx'):
-        ppt = Presentation(file)
-        text = ''
-        for slide in ppt.slides:
-            for shape in slide.shapes:
-                if hasattr(shape, "text"):
-                    text += shape.text + '\n'
-        return text
-    else:
-        return None
+# Function to translate again only the failed cells of a stored spreadsheet result and store the updated file
+def retry_stored_result(result_key, result, file_name):
+    summary, sheets, output_bytes, failures = result
+    options = {
+        'remove_special': True, 'project_id': PROJECT_ID, 'region': REGION, 'detect_locally': detect_locally,
+    }
+    with st.spinner(f"Retrying {len(failures)} failed cells..."):
+        if sheets is None:
+            # A streamed CSV output is not held as sheets; only its failed cells are rewritten
+            output_bytes, remaining = retry_failed_output(
+                file_name, output_bytes, failures, source_language_code, BACKEND, **options
+            )
+        else:
+            remaining = retry_failed_cells(sheets, failures, source_language_code, BACKEND, **options)
+            output_buffer = io.BytesIO()
+            write_sheets(sheets, output_buffer)
+            output_bytes = output_buffer.getvalue()
+    summary += f". Retried {len(failures)} failed cells, {len(failures) - len(remaining)} translated"
+    store_result(result_key, (summary, sheets, output_bytes, remaining))
+    st.rerun()
 
 # Streamlit Application
 st.title("Multi-Document Language Translation App (Powered by Translation LLM and Google Translate V3)")
@@ -158,11 +146,91 @@ st.warning("Note: The Translation LLM requires you to explicitly select the sour
 source_language_display = st.selectbox("Select source language:", list(LANGUAGES.keys()))
 source_language_code = LANGUAGES[source_language_display]
 
+# Mixed-language files: identify each cell's language locally and send one group per language,
+# using the selected language only for cells whose language is unclear
+detect_locally = st.checkbox("Detect the language of each cell locally (mixed-language files)")
+
+# Dropping links, @handles, extra whitespace and trailing emoji before translation lowers the billed characters
+normalize = st.checkbox("Normalize texts before translation")
+
+# Translation cache status
+with st.sidebar:
+    cache_stats = translation_cache.stats()
+    st.caption(f"Translation cache: {cache_stats['entries']} entries, {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    if st.button("Clear cached translations"):
+        translation_cache.invalidate(MODEL)
+
+# Timing, API usage and cost metrics, updated as the translation runs
+performance_panel = metrics_panel()
+
 # File uploader for multiple file types
 uploaded_file = st.file_uploader("Choose a file", type=['xlsx', 'csv', 'docx', 'pdf', 'pptx'])
 
-if uploaded_file is not None:
-    extracted_content = extract_text_from_file(uploaded_file)
+if uploaded_file is not None and uploaded_file.name.endswith('.csv'):
+    # CSV files are streamed chunk by chunk in their detected encoding instead of being loaded whole
+    file_hash = uploaded_file_hash(uploaded_file)
+    st.write(f"First {CSV_PREVIEW_ROWS} rows (Original):")
+    st.dataframe(read_csv(uploaded_file, nrows=CSV_PREVIEW_ROWS).astype(str))
+
+    # Only free-text columns are translated; these overrides adjust the automatic detection
+    column_names = [str(column) for column in get_csv_columns(uploaded_file)]
+    include_columns = st.multiselect("Always translate these columns:", column_names)
+    exclude_columns = st.multiselect("Never translate these columns:", column_names)
+
+    result_key = (file_hash, source_language_code, detect_locally, normalize, BACKEND, tuple(include_columns), tuple(exclude_columns))
+
+    if st.button("Translate CSV"):
+        # Completed batches are checkpointed so an interrupted run resumes where it stopped
+        checkpoint = open_job_checkpoint(
+            file_hash, job_settings(source_language_code, 'en', BACKEND, include_columns, exclude_columns, True, detect_locally)
+        )
+        normalization_report = NormalizationReport() if normalize else None
+        # Failed cells stay empty and are listed here, so they can be retried on their own
+        failures = FailureLog()
+        totals = {'rows': 0}
+
+        # Translate one chunk of rows: every distinct value of the chunk once, broadcast back
+        def translate_chunk(chunk):
+            translate_sheets(
+                {'Sheet1': chunk}, source_language_code, 'en', BACKEND, include=include_columns, exclude=exclude_columns,
+                failures=failures, row_offset=totals['rows'], remove_special=True, checkpoint=checkpoint,
+                project_id=PROJECT_ID, region=REGION, detect_locally=detect_locally, normalize=normalize,
+                normalization_report=normalization_report,
+            )
+            totals['rows'] += len(chunk)
+            render_metrics(performance_panel)
+            return chunk
+
+        with st.spinner("Translating... This may take a while for large files."):
+            with tempfile.TemporaryFile() as output_buffer:
+                rows = translate_csv_streaming(uploaded_file, output_buffer, translate_chunk)
+                output_buffer.seek(0)
+                summary = f"Translated {rows} rows"
+                if normalization_report is not None:
+                    summary += f". {normalization_report.summary()}"
+                store_result(result_key, (summary, None, output_buffer.read(), failures))
+        checkpoint.remove()
+
+    result = get_result(result_key)
+    if result is not None:
+        summary, _, output_bytes, failures = result
+        output_name = f'translated_{os.path.splitext(uploaded_file.name)[0]}.csv'
+        st.info(summary)
+        st.success("Translation complete!")
+
+        st.download_button(
+            label="Download Translated File",
+            data=output_bytes,
+            file_name=output_name,
+            mime='text/csv'
+        )
+        if failures and render_failures(failures, output_name, f'{file_hash}_csv'):
+            retry_stored_result(result_key, result, output_name)
+
+elif uploaded_file is not None:
+    # Parse the file once per content hash; reruns reuse the parsed content
+    file_hash = uploaded_file_hash(uploaded_file)
+    extracted_content = cached_extract_text_from_file(file_hash, uploaded_file)
 
     if isinstance(extracted_content, dict):
         st.write("Extracted sheets/dataframes:")
@@ -170,70 +238,110 @@ if uploaded_file is not None:
 
         for sheet_name, df in extracted_content.items():
             st.write(f"**{sheet_name} (Original)**")
-            st.dataframe(df.astype(str)) # Convert to string for display to avoid pyarrow issues
-            processed_data[sheet_name] = df.copy()
+            render_sheet_preview(df, f'{file_hash}_{sheet_name}_original')
+            processed_data[sheet_name] = df
+
+        # Only free-text columns are translated; these overrides adjust the automatic detection
+        column_names = sorted({str(column) for df in processed_data.values() for column in df.columns})
+        include_columns = st.multiselect("Always translate these columns:", column_names)
+        exclude_columns = st.multiselect("Never translate these columns:", column_names)
+
+        # Results are remembered per file content and settings, so reruns and downloads cost no API calls
+        result_key = (file_hash, source_language_code, detect_locally, normalize, BACKEND, tuple(include_columns), tuple(exclude_columns))
 
         if st.button("Translate Excel/CSV"):
+            # Completed batches are checkpointed so an interrupted run resumes where it stopped
+            checkpoint = open_job_checkpoint(
+                file_hash, job_settings(source_language_code, 'en', BACKEND, include_columns, exclude_columns, True, detect_locally)
+            )
+            normalization_report = NormalizationReport() if normalize else None
+            failures = FailureLog()
+            # The parsed sheets are shared between reruns, so the translation goes into a copy
+            processed_data = {sheet_name: df.copy() for sheet_name, df in processed_data.items()}
             with st.spinner("Translating... This may take a while for large files."):
-                for sheet_name, df_to_process in processed_data.items():
-                    for column in df_to_process.columns:
-                        df_to_process[column] = df_to_process[column].astype(str).apply(
-                            lambda x: translate_text_with_llm(x, source_language_code, PROJECT_ID, REGION)
-                        )
-                    processed_data[sheet_name] = df_to_process
+                # Translate every distinct value across all sheets once and broadcast it back; failed cells stay empty
+                plan = translate_sheets(
+                    processed_data, source_language_code, 'en', BACKEND, include=include_columns,
+                    exclude=exclude_columns, failures=failures, remove_special=True, checkpoint=checkpoint,
+                    project_id=PROJECT_ID, region=REGION, detect_locally=detect_locally, normalize=normalize,
+                    normalization_report=normalization_report,
+                )
+            checkpoint.remove()
 
+            # CSV uploads take the streaming path above, so this is always a workbook
+            output_buffer = io.BytesIO()
+            write_sheets(processed_data, output_buffer)
+
+            summary = f"Translation plan: {plan.summary()}"
+            if normalization_report is not None:
+                summary += f". {normalization_report.summary()}"
+            store_result(result_key, (summary, processed_data, output_buffer.getvalue(), failures))
+
+        result = get_result(result_key)
+        if result is not None:
+            summary, processed_data, output_bytes, failures = result
+            st.info(summary)
             st.success("Translation complete!")
 
             for sheet_name, df_translated in processed_data.items():
                 st.write(f"**{sheet_name} (Translated)**")
-                st.dataframe(df_translated.astype(str)) # Convert to string for display
-
-            output_buffer = io.BytesIO()
-            if uploaded_file.name.endswith('.xlsx'):
-                with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
-                    for sheet_name, data in processed_data.items():
-                        data.to_excel(writer, index=False, sheet_name=sheet_name)
-                mime_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                original_file_name = os.path.splitext(uploaded_file.name)[0]
-                output_file_name = f'translated_{original_file_name}.xlsx'
-            elif uploaded_file.name.endswith('.csv'):
-                df_translated = list(processed_data.values())[0]
-                df_translated.to_csv(output_buffer, index=False, encoding='utf-8')
-                mime_type = 'text/csv'
-                original_file_name = os.path.splitext(uploaded_file.name)[0]
-                output_file_name = f'translated_{original_file_name}.csv'
-
-            output_buffer.seek(0)
+                render_sheet_preview(df_translated, f'{file_hash}_{sheet_name}_translated')
 
+            output_name = f'translated_{os.path.splitext(uploaded_file.name)[0]}.xlsx'
             st.download_button(
                 label="Download Translated File",
-                data=output_buffer,
-                file_name=output_file_name,
-                mime=mime_type
+                data=output_bytes,
+                file_name=output_name,
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
             )
+            if failures and render_failures(failures, output_name, f'{file_hash}_xlsx'):
+                retry_stored_result(result_key, result, output_name)
 
     elif isinstance(extracted_content, str):
         st.write("Extracted Text:")
-        st.text_area("Original Text", extracted_content, height=300)
+        render_text_preview("Original Text", extracted_content, f'{file_hash}_original')
+
+        result_key = (file_hash, source_language_code, detect_locally, normalize, BACKEND)
 
         if st.button("Translate Text"):
+            checkpoint = open_job_checkpoint(
+                file_hash, job_settings(source_language_code, 'en', BACKEND, remove_special=True, detect_locally=detect_locally)
+            )
+            # Failed segments keep an error message in the text; they are reported once for the whole document
+            error_counts = Counter()
+            normalization_report = NormalizationReport() if normalize else None
             with st.spinner("Translating..."):
-                translated_text = translate_text_with_llm(extracted_content, source_language_code, PROJECT_ID, REGION)
-            
+                translated_text = translate_document_with_llm(
+                    extracted_content, source_language_code, PROJECT_ID, REGION, checkpoint, detect_locally,
+                    normalization_report, error_counts,
+                )
+                summary = normalization_report.summary() if normalization_report is not None else None
+                store_result(result_key, (translated_text, error_counts, summary))
+            checkpoint.remove()
+
+        result = get_result(result_key)
+        if result is not None:
+            translated_text, error_counts, summary = result
+            if summary:
+                st.info(summary)
+            if error_counts:
+                st.warning(f"{sum(error_counts.values())} segments failed to translate (" + ", ".join(
+                    f"{count} {error_class}" for error_class, count in error_counts.most_common()
+                ) + ") and hold an error message")
             st.success("Translation complete!")
             st.write("Translated Text:")
-            st.text_area("Translated Text", translated_text, height=300)
+            render_text_preview("Translated Text", translated_text, f'{file_hash}_translated')
 
-            output_buffer = io.BytesIO()
-            output_buffer.write(translated_text.encode('utf-8'))
-            output_buffer.seek(0)
-            
             st.download_button(
                 label="Download Translated Text",
-                data=output_buffer,
+                data=translated_text.encode('utf-8'),
                 file_name='translated_text.txt',
                 mime='text/plain'
             )
     
     else:
-        st.error("Unsupported file type or no text extracted from the file.")
\ No newline at end of file
+        st.error("Unsupported file type or no text extracted from the file.")
+
+# Pipeline metrics of this server process, including the run above
+render_metrics(performance_panel)
+metrics_downloads()
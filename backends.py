@@ -0,0 +1,270 @@
+"""
+Translation backends behind one interface.
+
+Every backend translates one request's worth of texts per call, states its
+request limits and capabilities, and creates its client or model on first use,
+so importing this module touches neither the network nor a model.
+"""
+import os
+import threading
+
+from batching import (
+    translate_batch_v2, translate_batch_v3,
+    V2_MAX_SEGMENTS, V2_MAX_CHARS, V2_MODEL, V3_MAX_SEGMENTS, V3_MAX_CHARS, V3_NMT_MODEL, V3_LLM_MODEL,
+)
+from dispatcher import DEFAULT_MAX_WORKERS
+from language_id import detect_language
+from metrics import COST_PER_MILLION_CHARACTERS
+from rate_limiter import get_rate_limiter
+from segmenter import split_paragraph
+
+# Google Cloud project used by the v3 API
+PROJECT_ID = os.environ.get('TRANSLATION_PROJECT_ID', 'ford-180395bd732cdd9af050c1f7')
+REGION = os.environ.get('TRANSLATION_REGION', 'us-central1')
+
+# Offline stand-in clients (see mock_backend.py), for running the apps without Google Cloud credentials
+USE_MOCK_CLIENTS = os.environ.get('TRANSLATION_MOCK_CLIENTS', '') not in ('', '0')
+
+# Local CPU model: a MarianMT checkpoint per language pair, run in batches of LOCAL_BATCH_SIZE texts
+LOCAL_MODEL_TEMPLATE = os.environ.get('TRANSLATION_LOCAL_MODEL', 'Helsinki-NLP/opus-mt-{source}-{target}')
+LOCAL_BATCH_SIZE = int(os.environ.get('TRANSLATION_LOCAL_BATCH_SIZE', 16))
+LOCAL_MAX_CHARS = 20000
+
+# Longest input a MarianMT model takes; longer texts are split at sentences and translated piece by piece
+LOCAL_MAX_TOKENS = 512
+LOCAL_SEGMENT_CHARS = 1000
+
+# Available translation backends and the model name each one is cached under
+BACKEND_V2 = 'v2'
+BACKEND_V3_NMT = 'v3-nmt'
+BACKEND_V3_LLM = 'v3-llm'
+BACKEND_LOCAL = 'local'
+BACKEND_MODELS = {
+    BACKEND_V2: V2_MODEL,
+    BACKEND_V3_NMT: V3_NMT_MODEL,
+    BACKEND_V3_LLM: V3_LLM_MODEL,
+    BACKEND_LOCAL: f'local/{LOCAL_MODEL_TEMPLATE}',
+}
+if USE_MOCK_CLIENTS:
+    # Keep stand-in translations apart from real ones in the shared cache
+    BACKEND_MODELS = {
+        backend: model if backend == BACKEND_LOCAL else f'{model}/mock' for backend, model in BACKEND_MODELS.items()
+    }
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# Function to get the shared v2 Translate client, created on first use
+def get_translate_client():
+    with _clients_lock:
+        if 'v2' not in _clients:
+            if USE_MOCK_CLIENTS:
+                from mock_backend import MockTranslateClient
+                _clients['v2'] = MockTranslateClient()
+            else:
+                from google.cloud import translate_v2 as translate
+                _clients['v2'] = translate.Client()
+        return _clients['v2']
+
+
+# Function to get the shared v3 TranslationServiceClient, created on first use
+def get_translate_client_v3():
+    with _clients_lock:
+        if 'v3' not in _clients:
+            if USE_MOCK_CLIENTS:
+                from mock_backend import MockTranslationServiceClient
+                _clients['v3'] = MockTranslationServiceClient()
+            else:
+                from google.cloud import translate_v3 as translate
+                _clients['v3'] = translate.TranslationServiceClient()
+        return _clients['v3']
+
+
+# Function to replace the shared clients, e.g. with mock clients in benchmarks
+def set_clients(v2_client=None, v3_client=None):
+    with _clients_lock:
+        for key, client in (('v2', v2_client), ('v3', v3_client)):
+            if client is not None:
+                _clients[key] = client
+
+
+class TranslationBackend:
+    """
+    Interface of a translation backend. `translate_batch` translates at most
+    `max_segments` texts of at most `max_chars` characters in one call; the
+    engine packs the batches and runs up to `max_workers` of them at once.
+    Cloud backends wait for the process-wide rate limiter of their quota,
+    where `job` identifies the caller for fair sharing.
+    """
+    name = None
+    max_segments = V2_MAX_SEGMENTS
+    max_chars = V2_MAX_CHARS
+    max_workers = DEFAULT_MAX_WORKERS
+    requires_source_language = False
+    local = False
+
+    @property
+    def model(self):
+        return BACKEND_MODELS[self.name]
+
+    def translate_batch(self, texts, source_language, target_language, job=None):
+        raise NotImplementedError
+
+    # Function to detect the language of each text; backends without a detection API identify it locally
+    def detect_languages(self, texts):
+        return [detect_language(text) for text in texts]
+
+    def capabilities(self):
+        return {
+            'name': self.name,
+            'model': self.model,
+            'max_segments': self.max_segments,
+            'max_chars': self.max_chars,
+            'max_workers': self.max_workers,
+            'requires_source_language': self.requires_source_language,
+            'local': self.local,
+            'cost_per_million_characters': COST_PER_MILLION_CHARACTERS.get(self.model, 0.0),
+        }
+
+
+class GoogleV2Backend(TranslationBackend):
+    name = BACKEND_V2
+
+    def translate_batch(self, texts, source_language, target_language, job=None):
+        with get_rate_limiter('v2').limit(texts, job):
+            return translate_batch_v2(get_translate_client(), texts, source_language, target_language)
+
+    def detect_languages(self, texts):
+        results = get_translate_client().detect_language(list(texts))
+        return [None if result['language'] == 'und' else result['language'] for result in results]
+
+
+class GoogleV3Backend(TranslationBackend):
+    max_segments = V3_MAX_SEGMENTS
+    max_chars = V3_MAX_CHARS
+
+    def __init__(self, name, model_name, project_id=PROJECT_ID, region=REGION, requires_source_language=False):
+        self.name = name
+        self.model_name = model_name
+        self.project_id = project_id
+        self.region = region
+        self.requires_source_language = requires_source_language
+
+    def translate_batch(self, texts, source_language, target_language, job=None):
+        with get_rate_limiter('v3').limit(texts, job):
+            return translate_batch_v3(
+                get_translate_client_v3(), texts, source_language, self.project_id, self.region,
+                target_language_code=target_language, model=self.model_name,
+            )
+
+    def detect_languages(self, texts):
+        client = get_translate_client_v3()
+        languages = []
+        for text in texts:
+            response = client.detect_language(request={
+                "parent": f"projects/{self.project_id}/locations/{self.region}",
+                "content": text,
+                "mime_type": "text/plain",
+            })
+            languages.append(response.languages[0].language_code if response.languages else None)
+        return languages
+
+
+class LocalModelBackend(TranslationBackend):
+    """
+    Offline MarianMT models run on the CPU with batched inference. Each
+    language pair needs its own model, so the source language must be known,
+    either selected or identified locally per text.
+    """
+    name = BACKEND_LOCAL
+    max_segments = LOCAL_BATCH_SIZE
+    max_chars = LOCAL_MAX_CHARS
+    # The model already uses every core; parallel batches would only contend for them
+    max_workers = 1
+    requires_source_language = True
+    local = True
+
+    def __init__(self, model_template=LOCAL_MODEL_TEMPLATE):
+        self.model_template = model_template
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _load(self, source_language, target_language):
+        model_name = self.model_template.format(
+            source=source_language.split('-')[0].lower(), target=target_language.split('-')[0].lower()
+        )
+        with self._lock:
+            if model_name not in self._models:
+                from transformers import MarianMTModel, MarianTokenizer
+                self._models[model_name] = (
+                    MarianTokenizer.from_pretrained(model_name), MarianMTModel.from_pretrained(model_name).eval()
+                )
+            return self._models[model_name]
+
+    # Function to split a text into pieces the model takes whole, so nothing is cut off
+    @staticmethod
+    def _fit(tokenizer, text, max_tokens):
+        # A token covers at least one character, so short texts fit without tokenizing them
+        if len(text) < max_tokens:
+            return [text]
+        pieces = []
+        pending = split_paragraph(text, LOCAL_SEGMENT_CHARS) or [text]
+        while pending:
+            piece = pending.pop(0)
+            if len(tokenizer(piece)['input_ids']) <= max_tokens:
+                pieces.append(piece)
+                continue
+            halves = split_paragraph(piece, max(1, len(piece) // 2))
+            if len(halves) < 2:
+                raise ValueError(f"Text too long for the local model ({len(piece)} characters without a break)")
+            pending[0:0] = halves
+        return pieces
+
+    def translate_batch(self, texts, source_language, target_language, job=None):
+        import torch
+
+        tokenizer, model = self._load(source_language, target_language)
+        max_tokens = min(tokenizer.model_max_length, LOCAL_MAX_TOKENS)
+        pieces = []
+        owners = []
+        for i, text in enumerate(texts):
+            for piece in self._fit(tokenizer, text, max_tokens):
+                pieces.append(piece)
+                owners.append(i)
+
+        translated_pieces = []
+        for start in range(0, len(pieces), LOCAL_BATCH_SIZE):
+            inputs = tokenizer(pieces[start:start + LOCAL_BATCH_SIZE], return_tensors='pt', padding=True)
+            with torch.no_grad():
+                outputs = model.generate(**inputs)
+            translated_pieces.extend(tokenizer.batch_decode(outputs, skip_special_tokens=True))
+
+        translations = [[] for _ in texts]
+        for i, translated_piece in zip(owners, translated_pieces):
+            translations[i].append(translated_piece)
+        return [' '.join(parts) for parts in translations]
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+# Function to get the shared instance of a backend, created on first use
+def get_backend(name, project_id=PROJECT_ID, region=REGION):
+    key = (name, project_id, region) if name in (BACKEND_V3_NMT, BACKEND_V3_LLM) else (name,)
+    with _backends_lock:
+        if key not in _backends:
+            if name == BACKEND_V2:
+                _backends[key] = GoogleV2Backend()
+            elif name == BACKEND_V3_NMT:
+                _backends[key] = GoogleV3Backend(BACKEND_V3_NMT, V3_NMT_MODEL, project_id, region)
+            elif name == BACKEND_V3_LLM:
+                _backends[key] = GoogleV3Backend(
+                    BACKEND_V3_LLM, V3_LLM_MODEL, project_id, region, requires_source_language=True
+                )
+            elif name == BACKEND_LOCAL:
+                _backends[key] = LocalModelBackend()
+            else:
+                raise ValueError(f"Unknown translation backend: {name}")
+        return _backends[key]
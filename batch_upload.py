@@ -0,0 +1,240 @@
+"""
+Translation of many files in one job, e.g. a monthly drop of regional exports.
+
+Uploaded files and the members of .zip archives are expanded into one list of
+inputs. The free-text cells of every spreadsheet and the lines of every
+document then share one work queue: each distinct text is translated once
+across all files and batched with texts of the other files, and the
+translated files are written into a single ZIP archive. Failed spreadsheet
+cells can be recorded by archive member, sheet, column and row and retried
+later with retry_failed_archive.
+"""
+import hashlib
+import io
+import logging
+import os
+import posixpath
+import zipfile
+
+import pandas as pd
+
+from csv_streaming import read_csv
+from document_extraction import DOCUMENT_EXTENSIONS, iter_document_segments
+from failure_log import FailureLog
+from metrics import get_metrics
+from segmenter import split_paragraph
+from translation_engine import (
+    BACKEND_V2, PROGRESS_SLICE_SIZE, SUPPORTED_EXTENSIONS, output_path_for, retry_failed_output, translate_texts,
+)
+from translation_plan import apply_translation_plan, build_translation_plan
+
+logger = logging.getLogger(__name__)
+
+
+# Function to read a path or an uploaded file as (name, content)
+def _read_input(file):
+    if isinstance(file, str):
+        with open(file, 'rb') as input_file:
+            return os.path.basename(file), input_file.read()
+    file.seek(0)
+    return file.name, file.read()
+
+
+# Function to turn an archive member name into a safe relative path
+def _member_path(name):
+    parts = [part for part in posixpath.normpath(name.replace('\\', '/')).split('/') if part not in ('', '.', '..')]
+    return '/'.join(parts)
+
+
+# Function to expand files and .zip archives into the (name, content) of every file that can be translated
+def expand_inputs(files):
+    """
+    Accepts paths and file-like objects with a `name`. Archive members keep
+    their folder inside the archive; unsupported files, nested archives and
+    Office lock files are skipped. Names are made unique.
+    """
+    inputs = []
+    for file in files:
+        name, content = _read_input(file)
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(io.BytesIO(content)) as archive:
+                for member in archive.infolist():
+                    member_name = _member_path(member.filename)
+                    base_name = posixpath.basename(member_name)
+                    if (member.is_dir() or member_name.startswith('__MACOSX/') or base_name.startswith('~$')
+                            or not member_name.endswith(SUPPORTED_EXTENSIONS)):
+                        if not member.is_dir():
+                            logger.info("Skipping %s in %s", member.filename, name)
+                        continue
+                    inputs.append((member_name, archive.read(member)))
+        elif name.endswith(SUPPORTED_EXTENSIONS):
+            inputs.append((name, content))
+        else:
+            logger.info("Skipping unsupported file %s", name)
+
+    # Files of the same name from different uploads must not overwrite each other in the output archive
+    seen = set()
+    unique_inputs = []
+    for name, content in inputs:
+        stem, extension = os.path.splitext(name)
+        unique_name = name
+        copy = 1
+        while unique_name in seen:
+            copy += 1
+            unique_name = f'{stem} ({copy}){extension}'
+        seen.add(unique_name)
+        unique_inputs.append((unique_name, content))
+    return unique_inputs
+
+
+# Function to fingerprint a set of inputs, e.g. to key the checkpoint of a batch job
+def inputs_hash(inputs):
+    digest = hashlib.sha256()
+    for name, content in inputs:
+        digest.update(name.encode('utf-8'))
+        digest.update(hashlib.sha256(content).digest())
+    return digest.hexdigest()
+
+
+# Function to parse one input into its sheets (spreadsheets) or its line segments (documents)
+def _load_input(name, content):
+    buffer = io.BytesIO(content)
+    buffer.name = name
+    if name.endswith(DOCUMENT_EXTENSIONS):
+        return None, list(iter_document_segments(buffer))
+    with get_metrics().timed('extract', file_type=os.path.splitext(name)[1].lstrip('.').lower()):
+        if name.endswith('.xlsx'):
+            return pd.read_excel(buffer, sheet_name=None), None
+        return {'Sheet1': read_csv(buffer)}, None
+
+
+# Function to name the output of one input inside the output archive
+def _output_name(name):
+    output_name = posixpath.basename(output_path_for(name))
+    directory = posixpath.dirname(name)
+    return f'{directory}/{output_name}' if directory else output_name
+
+
+# Function to serialize one translated input for the output archive
+def _output_file(name, sheets, document_lines):
+    output_name = _output_name(name)
+    output_buffer = io.BytesIO()
+    with get_metrics().timed('write', file_type=os.path.splitext(output_name)[1].lstrip('.')):
+        if document_lines is not None:
+            output_buffer.write('\n'.join(document_lines).encode('utf-8'))
+        elif name.endswith('.csv'):
+            sheets['Sheet1'].to_csv(output_buffer, index=False, encoding='utf-8')
+        else:
+            with pd.ExcelWriter(output_buffer, engine='openpyxl') as writer:
+                for sheet_name, data in sheets.items():
+                    data.to_excel(writer, index=False, sheet_name=sheet_name)
+    return output_name, output_buffer.getvalue()
+
+
+# Function to translate many files through one shared queue and write the results into a ZIP archive
+def translate_inputs(inputs, destination, source_language=None, target_language='en', backend=BACKEND_V2,
+                     include=(), exclude=(), error_prefix='Error', on_progress=None,
+                     progress_slice=PROGRESS_SLICE_SIZE, failures=None, **options):
+    """
+    `inputs` is a list of (name, content) as returned by expand_inputs and
+    `destination` a path or binary file object for the archive. Every
+    distinct spreadsheet value and document segment of all inputs is
+    translated once, and batches are filled across files.
+    With `on_progress`, the texts are translated `progress_slice` at a time
+    and `on_progress(done, total)` is called after every slice. With a
+    `failures` log, failed spreadsheet cells are left empty and recorded
+    there by archive member; document lines keep the error message.
+    Returns counts of the files, text cells, document lines and distinct texts.
+    """
+    sheets = {}
+    documents = {}
+    for name, content in inputs:
+        try:
+            file_sheets, segments = _load_input(name, content)
+        except Exception:
+            logger.exception("Failed to read %s", name)
+            continue
+        if segments is not None:
+            documents[name] = [split_paragraph(segment.text) for segment in segments]
+        else:
+            for sheet_name, df in file_sheets.items():
+                sheets[(name, sheet_name)] = df
+
+    plan = build_translation_plan(sheets, include=include, exclude=exclude)
+    document_texts = [chunk for chunks in documents.values() for line in chunks for chunk in line]
+    texts = list(dict.fromkeys(list(plan.uniques) + document_texts))
+    translated = {}
+    text_errors = {}
+    step = progress_slice if on_progress is not None else max(len(texts), 1)
+    for start in range(0, len(texts), step):
+        translations, errors = translate_texts(
+            texts[start:start + step], source_language, target_language, backend, **options
+        )
+        translated.update(zip(texts[start:start + step], translations))
+        text_errors.update((texts[start + i], error) for i, error in errors.items())
+        if on_progress is not None:
+            on_progress(len(translated), len(texts))
+
+    # Failed cells and lines hold the error message, unless the failed cells are recorded out of band
+    marked = {text: f"{error_prefix}: {str(error)}" for text, error in text_errors.items()}
+    if failures is None:
+        apply_translation_plan(plan, sheets, [marked.get(text, translated[text]) for text in plan.uniques])
+    else:
+        apply_translation_plan(plan, sheets, [translated[text] for text in plan.uniques])
+        failures.add_plan_failures(
+            plan,
+            {i: text_errors[text] for i, text in enumerate(plan.uniques) if text in text_errors},
+            target_language,
+            sheet_name_for=lambda key: key[1],
+            file_name_for=lambda key: _output_name(key[0]),
+        )
+    with zipfile.ZipFile(destination, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, _ in inputs:
+            if name in documents:
+                lines = [' '.join(marked.get(chunk, translated[chunk]) for chunk in line) for line in documents[name]]
+                output_name, output_bytes = _output_file(name, None, lines)
+            else:
+                file_sheets = {sheet_name: df for (file_name, sheet_name), df in sheets.items() if file_name == name}
+                if not file_sheets:
+                    continue
+                output_name, output_bytes = _output_file(name, file_sheets, None)
+            archive.writestr(output_name, output_bytes)
+
+    return {
+        'files': len(documents) + len({file_name for file_name, _ in sheets}),
+        'cells': plan.total_cells,
+        'document_lines': sum(len(chunks) for chunks in documents.values()),
+        'distinct': len(texts),
+        'failed': len(text_errors),
+    }
+
+
+# Function to translate again the failed spreadsheet cells of an archive written by translate_inputs
+def retry_failed_archive(source, destination, failures, source_language=None, backend=BACKEND_V2, **options):
+    """
+    `source` and `destination` are paths or binary file objects of the
+    archive before and after the retry; members without failed cells are
+    copied as they are. Returns a FailureLog of the cells that failed again.
+    """
+    logs = failures.by_file()
+    remaining = FailureLog()
+    with zipfile.ZipFile(source) as archive, \
+            zipfile.ZipFile(destination, 'w', compression=zipfile.ZIP_DEFLATED) as output_archive:
+        for member in archive.infolist():
+            content = archive.read(member)
+            if member.filename in logs:
+                content, member_remaining = retry_failed_output(
+                    member.filename, content, logs[member.filename], source_language, backend, **options
+                )
+                for failure in member_remaining:
+                    remaining.add(failure)
+            output_archive.writestr(member, content)
+    return remaining
+
+
+# Function to describe the counts returned by translate_inputs
+def batch_summary(counts):
+    return (
+        f"{counts['files']} files: {counts['cells']} text cells and {counts['document_lines']} document lines, "
+        f"{counts['distinct']} distinct texts translated across files, {counts['failed']} failed"
+    )
@@ -0,0 +1,100 @@
+import html
+
+from dispatcher import run_concurrently, DEFAULT_MAX_WORKERS, DEFAULT_MAX_RETRIES
+
+# Per-request limits of the Google Cloud Translation APIs.
+# v2 accepts at most 128 text segments per request, v3 at most 1024; both
+# recommend keeping a single request under 30k characters.
+V2_MAX_SEGMENTS = 128
+V2_MAX_CHARS = 30000
+V3_MAX_SEGMENTS = 1024
+V3_MAX_CHARS = 30000
+
+# Model names used to tell translations of the different backends apart
+V2_MODEL = 'v2/nmt'
+V3_NMT_MODEL = 'general/nmt'
+V3_LLM_MODEL = 'general/translation-llm'
+
+
+# Function to split a list of texts into batches that respect the request limits
+def make_batches(texts, max_segments, max_chars):
+    """
+    Groups the positions of `texts` into batches of at most `max_segments`
+    items and `max_chars` characters. Empty texts are left out, and a text
+    longer than `max_chars` is sent on its own.
+    """
+    batches = []
+    current = []
+    current_chars = 0
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        if current and (len(current) >= max_segments or current_chars + len(text) > max_chars):
+            batches.append(current)
+            current = []
+            current_chars = 0
+        current.append(i)
+        current_chars += len(text)
+    if current:
+        batches.append(current)
+    return batches
+
+
+# Function to translate a batch of texts with the v2 client in one API call
+def translate_batch_v2(client, texts, source_language=None, target_language='en'):
+    results = client.translate(texts, target_language=target_language, source_language=source_language)
+    return [html.unescape(result['translatedText']) for result in results]
+
+
+# Function to translate a batch of texts with the v3 client in one API call
+def translate_batch_v3(client, texts, source_language_code, project_id, region, target_language_code='en', model=None):
+    request_body = {
+        "parent": f"projects/{project_id}/locations/{region}",
+        "contents": texts,
+        "target_language_code": target_language_code,
+    }
+    if source_language_code:
+        # Without a source language the v3 NMT model detects it per text
+        request_body["source_language_code"] = source_language_code
+    if model:
+        request_body["model"] = f"projects/{project_id}/locations/{region}/models/{model}"
+
+    response = client.translate_text(request=request_body)
+    return [html.unescape(translation.translated_text) for translation in response.translations]
+
+
+# Function to translate a list of texts batch by batch and map the results back
+def translate_in_batches(texts, translate_batch, max_segments, max_chars,
+                         max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES, on_batch_done=None):
+    """
+    Translates `texts` with as few calls to `translate_batch` as the limits allow.
+    Up to `max_workers` batches are in flight at once and transient errors are
+    retried with backoff. Returns (translations, errors): translations is in the
+    same order as `texts` with None for cells whose batch failed, errors maps
+    those positions to the exception that was raised. Empty texts are returned
+    unchanged. `on_batch_done(batch_texts, translations)` is called for every
+    batch that succeeds, as soon as it does.
+    """
+    translations = [text if not text else None for text in texts]
+    errors = {}
+    batches = make_batches(texts, max_segments, max_chars)
+
+    def report(batch, translated, error):
+        if on_batch_done is not None and error is None:
+            on_batch_done([texts[i] for i in batch], translated)
+
+    results = run_concurrently(
+        lambda batch: translate_batch([texts[i] for i in batch]),
+        batches,
+        max_workers=max_workers,
+        max_retries=max_retries,
+        on_result=report,
+    )
+    for batch, (translated, error) in zip(batches, results):
+        if error is not None:
+            for i in batch:
+                errors[i] = error
+            continue
+        for i, translated_text in zip(batch, translated):
+            translations[i] = translated_text
+    return translations, errors
@@ -0,0 +1,221 @@
+"""
+Offline end-to-end benchmark of the translation pipeline.
+
+Scales the bundled verbatims workbook (or any --workbook) up, translates it
+and a synthetic document built from its texts with the mock clients, and
+reports rows/sec, API calls, characters sent, peak memory and wall time per
+backend. With --baseline, exits with status 1 when a case got slower than the
+baseline by more than --tolerance.
+
+Usage:
+    python benchmark.py --scales 1 5 20
+    python benchmark.py --backends v2 v3-llm --output results.json
+    python benchmark.py --baseline results.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from openpyxl import Workbook, load_workbook
+
+from cell_filters import is_translatable
+from mock_backend import (
+    DEFAULT_MOCK_CHAR_LATENCY, DEFAULT_MOCK_ERROR_RATE, DEFAULT_MOCK_LATENCY,
+    MockStats, MockTranslateClient, MockTranslationServiceClient,
+)
+from dispatcher import DEFAULT_MAX_WORKERS
+from rate_limiter import get_rate_limiter
+from translation_cache import TranslationCache
+from translation_engine import (
+    BACKEND_MODELS, BACKEND_V2, BACKEND_V3_LLM, BACKEND_V3_NMT, set_clients, translate_document, translate_file,
+)
+
+BUNDLED_WORKBOOK = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '10582 Verbatims Transit Courier 2023 Q4 December on 22JUL24 (1).xlsx'
+)
+
+# Number of workbook texts per paragraph of the synthetic document
+DOCUMENT_PARAGRAPH_TEXTS = 5
+
+
+# Function to write `scale` copies of a workbook's rows, making the texts of every extra copy distinct
+def scale_workbook(source, destination, scale):
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    output = Workbook(write_only=True)
+    rows_written = 0
+    try:
+        for sheet_name in workbook.sheetnames:
+            sheet = output.create_sheet(title=sheet_name)
+            rows = list(workbook[sheet_name].iter_rows(values_only=True))
+            if not rows:
+                continue
+            sheet.append(rows[0])
+            for copy in range(scale):
+                for row in rows[1:]:
+                    if copy:
+                        row = [f'{value} ({copy})' if is_translatable(value) else value for value in row]
+                    sheet.append(row)
+                    rows_written += 1
+    finally:
+        workbook.close()
+    output.save(destination)
+    return rows_written
+
+
+# Function to build a synthetic document from the workbook's texts, `scale` times over
+def make_document_text(source, scale):
+    workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        texts = [
+            value for sheet_name in workbook.sheetnames
+            for row in workbook[sheet_name].iter_rows(min_row=2, values_only=True)
+            for value in row if is_translatable(value)
+        ]
+    finally:
+        workbook.close()
+
+    paragraphs = []
+    for copy in range(scale):
+        for start in range(0, len(texts), DOCUMENT_PARAGRAPH_TEXTS):
+            sentences = [f'{text.rstrip(".")} ({copy}).' for text in texts[start:start + DOCUMENT_PARAGRAPH_TEXTS]]
+            paragraphs.append(' '.join(sentences))
+    return '\n'.join(paragraphs), len(paragraphs)
+
+
+# Function to run one benchmark case with fresh mock clients, cache and checkpoints
+def run_case(case, backend, run, rows, args):
+    stats = MockStats()
+    client_settings = {
+        'latency': args.latency, 'char_latency': args.char_latency, 'error_rate': args.error_rate,
+        'seed': args.seed, 'stats': stats,
+    }
+    set_clients(MockTranslateClient(**client_settings), MockTranslationServiceClient(**client_settings))
+    for quota in ('v2', 'v3'):
+        get_rate_limiter(quota).configure(args.requests_per_minute, args.characters_per_minute)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = TranslationCache(os.path.join(directory, 'cache.sqlite3'))
+        options = {
+            'source_language': args.source_language, 'backend': backend, 'cache': cache, 'max_workers': args.workers,
+        }
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        run(directory, options)
+        wall_time = time.perf_counter() - start
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    calls = stats.snapshot()
+    return {
+        'case': case,
+        'backend': backend,
+        'model': BACKEND_MODELS[backend],
+        'rows': rows,
+        'wall_seconds': round(wall_time, 3),
+        'rows_per_second': round(rows / wall_time, 1) if wall_time else None,
+        'api_calls': calls['calls'],
+        'failed_api_calls': calls['failed_calls'],
+        'characters_sent': calls['characters'],
+        'peak_memory_mb': round(peak_memory / 2 ** 20, 1),
+    }
+
+
+# Function to run the workbook and document cases at every scale for every backend
+def run_benchmarks(args):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in args.scales:
+            workbook_path = os.path.join(directory, f'workbook_x{scale}.xlsx')
+            rows = scale_workbook(args.workbook, workbook_path, scale)
+            document_text, paragraphs = make_document_text(args.workbook, scale)
+
+            for backend in args.backends:
+                def run_workbook(output_dir, options):
+                    translate_file(
+                        workbook_path, output_dir=output_dir, checkpoint_dir=os.path.join(output_dir, 'checkpoints'),
+                        **options
+                    )
+
+                def run_document(output_dir, options):
+                    translate_document(document_text, **options)
+
+                results.append(run_case(f'workbook x{scale}', backend, run_workbook, rows, args))
+                print_result(results[-1])
+                if not args.skip_documents:
+                    results.append(run_case(f'document x{scale}', backend, run_document, paragraphs, args))
+                    print_result(results[-1])
+    return results
+
+
+def print_result(result):
+    print(
+        f"{result['case']:<16} {result['backend']:<7} {result['rows']:>8} rows  {result['wall_seconds']:>8.2f} s  "
+        f"{result['rows_per_second'] or 0:>9.1f} rows/s  {result['api_calls']:>6} calls  "
+        f"{result['characters_sent']:>10} chars  {result['peak_memory_mb']:>7.1f} MB peak"
+    )
+
+
+# Function to list the cases whose throughput fell below the baseline by more than `tolerance`
+def find_regressions(results, baseline, tolerance):
+    previous = {(result['case'], result['backend']): result for result in baseline}
+    regressions = []
+    for result in results:
+        before = previous.get((result['case'], result['backend']))
+        if before and before.get('rows_per_second') and result['rows_per_second'] is not None:
+            if result['rows_per_second'] < before['rows_per_second'] * (1 - tolerance):
+                regressions.append((result, before))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the translation pipeline offline with mock API clients.")
+    parser.add_argument('--workbook', default=BUNDLED_WORKBOOK, help="Workbook to scale up (default: the bundled verbatims)")
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 5, 20], help="Copies of the workbook per case")
+    parser.add_argument('--backends', nargs='+', choices=sorted(BACKEND_MODELS),
+                        default=[BACKEND_V2, BACKEND_V3_NMT, BACKEND_V3_LLM],
+                        help="Backends to compare; the cloud backends use the mock clients, 'local' the real local model")
+    parser.add_argument('--source-language', default='de', help="Source language sent with every request (default: de)")
+    parser.add_argument('--latency', type=float, default=DEFAULT_MOCK_LATENCY, help="Simulated seconds per request")
+    parser.add_argument('--char-latency', type=float, default=DEFAULT_MOCK_CHAR_LATENCY, help="Simulated seconds per character")
+    parser.add_argument('--error-rate', type=float, default=DEFAULT_MOCK_ERROR_RATE, help="Share of requests that fail transiently")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the simulated failures")
+    parser.add_argument('--requests-per-minute', type=float, default=1e9,
+                        help="Request quota of the rate limiter (default: practically unlimited)")
+    parser.add_argument('--characters-per-minute', type=float, default=1e12,
+                        help="Character quota of the rate limiter (default: practically unlimited)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help="Concurrent API requests")
+    parser.add_argument('--skip-documents', action='store_true', help="Only benchmark workbooks")
+    parser.add_argument('--output', help="Write the results to this JSON file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed throughput drop against the baseline")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run_benchmarks(args)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for result, before in regressions:
+            print(
+                f"REGRESSION {result['case']} {result['backend']}: "
+                f"{result['rows_per_second']} rows/s, baseline {before['rows_per_second']} rows/s"
+            )
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import datetime
+import numbers
+import re
+
+import pandas as pd
+
+# Single tokens that contain a digit, e.g. order numbers, VINs, dealer codes or "Q4-2023"
+ID_LIKE_PATTERN = re.compile(r'^(?=.*\d)[\w\-./#:]+$')
+
+# Cells that consist of nothing but a link or an e-mail address
+URL_OR_EMAIL_PATTERN = re.compile(r'^(?:https?://\S+|www\.\S+|[\w.+-]+@[\w-]+\.[\w.-]+)$', re.IGNORECASE)
+
+
+# Function to check for NaN/None/NaT without choking on lists or other objects
+def _is_missing(value):
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+# Function to decide whether a single cell holds free text worth translating
+def is_translatable(value):
+    if isinstance(value, (bool, numbers.Number, datetime.date, datetime.time, datetime.timedelta)):
+        return False
+    if not isinstance(value, str):
+        return False
+    text = value.strip()
+    if not text:
+        return False
+    # Numbers, dates, percentages and punctuation-only cells have no letters to translate
+    if not any(ch.isalpha() for ch in text):
+        return False
+    if ID_LIKE_PATTERN.match(text) or URL_OR_EMAIL_PATTERN.match(text):
+        return False
+    return True
+
+
+# Function to build a boolean mask of the cells of a column that should be translated
+def translatable_mask(series, force=False):
+    """
+    With `force`, every non-empty cell counts as translatable; this is used for
+    columns the user opted in explicitly.
+    """
+    if force:
+        return series.map(lambda value: not _is_missing(value) and str(value).strip() != '').to_numpy(dtype=bool)
+    return series.map(is_translatable).to_numpy(dtype=bool)
+
+
+# Function to check for a column of text cells that hold numbers only, as CSV columns are read as text
+def _is_numeric_text(series):
+    if not series.map(lambda value: isinstance(value, str)).all():
+        return False
+    values = series[series.str.strip() != '']
+    return bool(pd.to_numeric(values, errors='coerce').notna().all())
+
+
+# Function to decide which columns of a sheet contain free text
+def select_text_columns(df, include=(), exclude=()):
+    """
+    Returns a list of (column, force) pairs. Columns named in `exclude` are
+    never translated, columns named in `include` always are. Other columns are
+    translated only if they are not numeric, boolean or datetime typed, or
+    text columns of numbers only.
+    """
+    include = {str(column) for column in include}
+    exclude = {str(column) for column in exclude}
+    selected = []
+    for column in df.columns:
+        if str(column) in exclude:
+            continue
+        if str(column) in include:
+            selected.append((column, True))
+        elif not (
+            pd.api.types.is_numeric_dtype(df[column]) or pd.api.types.is_datetime64_any_dtype(df[column])
+            or _is_numeric_text(df[column])
+        ):
+            selected.append((column, False))
+    return selected
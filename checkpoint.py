@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Where unfinished translation jobs keep their completed translations
+DEFAULT_CHECKPOINT_DIR = os.environ.get(
+    'TRANSLATION_CHECKPOINT_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'translation', 'checkpoints'),
+)
+
+
+# Function to fingerprint a file's content
+def file_hash(path_or_bytes):
+    digest = hashlib.sha256()
+    if isinstance(path_or_bytes, bytes):
+        digest.update(path_or_bytes)
+    else:
+        with open(path_or_bytes, 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to build the key of a job from its input file and settings
+def job_key(input_hash, settings):
+    payload = json.dumps({'input': input_hash, 'settings': settings}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class JobCheckpoint:
+    """
+    Append-only record of the translations a job has completed so far. Every
+    finished batch is appended and flushed to disk, so a job that dies can be
+    started again with the same key and only send the remaining texts.
+    """
+
+    def __init__(self, key, directory=DEFAULT_CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f'{key}.jsonl')
+        self.completed = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        text, translated_text = json.loads(line)
+                    except ValueError:
+                        # A line cut short by a crash; everything before it is intact
+                        continue
+                    self.completed[text] = translated_text
+            logger.info("Resuming from checkpoint %s with %d completed translations", self.path, len(self.completed))
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def get_many(self, texts):
+        with self._lock:
+            return {text: self.completed[text] for text in texts if text in self.completed}
+
+    def record(self, texts, translations):
+        with self._lock:
+            for text, translated_text in zip(texts, translations):
+                self.completed[text] = translated_text
+                self._file.write(json.dumps([text, translated_text], ensure_ascii=False) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def remove(self):
+        """
+        Deletes the checkpoint once the job has finished.
+        """
+        with self._lock:
+            self._file.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+# Function to open the checkpoint of a job, resuming it if one exists
+def open_checkpoint(input_hash, settings, directory=DEFAULT_CHECKPOINT_DIR, resume=True):
+    checkpoint = JobCheckpoint(job_key(input_hash, settings), directory)
+    if not resume and checkpoint.completed:
+        checkpoint.remove()
+        checkpoint = JobCheckpoint(job_key(input_hash, settings), directory)
+    return checkpoint
@@ -0,0 +1,199 @@
+"""
+Streaming CSV input and output in constant memory.
+
+The encoding is sniffed from a sample at the start of the file (byte order
+marks, UTF-8 validity, UTF-16 without a BOM, else cp1252), so vendor exports
+that are not UTF-8 can be read. Files are then read and written chunk by chunk.
+Every cell is read as text, without type or missing-value guessing.
+"""
+import codecs
+import csv
+import io
+import os
+
+import pandas as pd
+
+from excel_streaming import DEFAULT_CHUNK_SIZE, column_names
+from metrics import get_metrics
+
+# Bytes inspected to guess the encoding and delimiter
+SNIFF_SAMPLE_SIZE = 64 * 1024
+
+BOM_ENCODINGS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+CANDIDATE_DELIMITERS = ',;\t|'
+
+# Cells are read as the text they hold, so cells that are not translated are written back unchanged,
+# e.g. '007' stays '007' and a verbatim 'NA' or 'None' is not read as an empty cell
+CELL_TEXT_OPTIONS = {'dtype': str, 'keep_default_na': False, 'na_filter': False}
+
+
+# Function to read a sample from the start of a path or binary file object
+def _read_sample(file, size=SNIFF_SAMPLE_SIZE):
+    if isinstance(file, str):
+        with open(file, 'rb') as binary_file:
+            return binary_file.read(size)
+    file.seek(0)
+    sample = file.read(size)
+    file.seek(0)
+    return sample
+
+
+# Function to guess the encoding of a CSV file from its first bytes
+def sniff_encoding(file):
+    sample = _read_sample(file)
+    for bom, encoding in BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+
+    # UTF-16 without a BOM: mostly-ASCII text has a zero byte in every other position
+    if len(sample) >= 4:
+        even_zeros = sample[0::2].count(0) / len(sample[0::2])
+        odd_zeros = sample[1::2].count(0) / len(sample[1::2])
+        if odd_zeros > 0.4 and even_zeros < 0.1:
+            return 'utf-16-le'
+        if even_zeros > 0.4 and odd_zeros < 0.1:
+            return 'utf-16-be'
+
+    try:
+        # An incremental decoder tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'cp1252'
+
+
+# Function to guess the delimiter from a decoded sample
+def sniff_delimiter(file, encoding):
+    sample = _read_sample(file).decode(encoding, errors='ignore')
+    # Leave out the last line, which the sample may have cut short
+    sample = sample[:sample.rfind('\n')] if '\n' in sample else sample
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=CANDIDATE_DELIMITERS).delimiter
+    except csv.Error:
+        return ','
+
+
+# Function to open a path or binary file object as text in the given encoding
+def _open_text(file, encoding):
+    if isinstance(file, str):
+        return open(file, encoding=encoding, errors='replace', newline='')
+    file.seek(0)
+    return io.TextIOWrapper(file, encoding=encoding, errors='replace', newline='')
+
+
+# Function to close a text wrapper without closing the caller's binary file object
+def _close_text(text_file, file):
+    if isinstance(file, str):
+        text_file.close()
+    else:
+        text_file.detach()
+
+
+# Function to read a CSV file as DataFrames of at most `chunksize` rows
+def iter_csv_chunks(file, chunksize=DEFAULT_CHUNK_SIZE, encoding=None):
+    encoding = encoding or sniff_encoding(file)
+    delimiter = sniff_delimiter(file, encoding)
+    text_file = _open_text(file, encoding)
+    try:
+        with pd.read_csv(text_file, sep=delimiter, chunksize=chunksize, **CELL_TEXT_OPTIONS) as reader:
+            yield from reader
+    finally:
+        _close_text(text_file, file)
+
+
+# Function to read a whole CSV file, e.g. for small uploads and previews
+def read_csv(file, nrows=None, encoding=None, skip_blank_lines=True):
+    encoding = encoding or sniff_encoding(file)
+    text_file = _open_text(file, encoding)
+    try:
+        return pd.read_csv(
+            text_file, sep=sniff_delimiter(file, encoding), nrows=nrows, skip_blank_lines=skip_blank_lines,
+            **CELL_TEXT_OPTIONS
+        )
+    finally:
+        _close_text(text_file, file)
+
+
+# Function to read the header of a CSV file
+def get_csv_columns(file):
+    return list(read_csv(file, nrows=0).columns)
+
+
+# Function to open a path or binary file object for writing UTF-8 text
+def _open_output(destination):
+    if isinstance(destination, str):
+        return open(destination, 'w', encoding='utf-8', newline='')
+    return io.TextIOWrapper(destination, encoding='utf-8', newline='')
+
+
+# Function to copy a CSV file row by row, overwriting single cells and leaving every other cell as it is
+def fill_csv_cells(source, destination, values):
+    """
+    `values` maps (column name, data row) to the new cell text, with column
+    names as iter_csv_chunks reads them; blank lines count as rows. The copy
+    is written to `destination`, a path or binary file object other than
+    `source`.
+    """
+    encoding = sniff_encoding(source)
+    delimiter = sniff_delimiter(source, encoding)
+    text_file = _open_text(source, encoding)
+    output = _open_output(destination)
+    try:
+        reader = csv.reader(text_file, delimiter=delimiter)
+        writer = csv.writer(output, delimiter=delimiter, lineterminator=os.linesep)
+        header = next(reader, None)
+        if header is not None:
+            writer.writerow(header)
+            # Empty headers are named like pandas names them
+            positions = {str(name): i for i, name in enumerate(column_names([name or None for name in header]))}
+            cells = {}
+            for (column, row), value in values.items():
+                cells.setdefault(row, []).append((positions[str(column)], value))
+            for row, fields in enumerate(reader):
+                for position, value in cells.get(row, ()):
+                    fields.extend([''] * (position + 1 - len(fields)))
+                    fields[position] = value
+                writer.writerow(fields)
+        output.flush()
+    finally:
+        _close_text(text_file, source)
+        _close_text(output, destination)
+
+
+# Function to copy a CSV file chunk by chunk through `translate_chunk`, writing UTF-8 as it goes
+def translate_csv_streaming(source, destination, translate_chunk, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    `destination` is a path or a binary file object. Returns the number of
+    data rows written.
+    """
+    metrics = get_metrics()
+    output = _open_output(destination)
+    rows = 0
+    header_written = False
+    try:
+        chunks = iter_csv_chunks(source, chunksize)
+        while True:
+            with metrics.timed('parse', file_type='csv'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            chunk = translate_chunk(chunk)
+            with metrics.timed('write', file_type='csv'):
+                chunk.to_csv(output, index=False, header=not header_written)
+                # Whenever the next chunk is being translated, the file on disk ends with a whole chunk
+                output.flush()
+            header_written = True
+            rows += len(chunk)
+        if not header_written:
+            # A header-only file still gets its header
+            pd.DataFrame(columns=get_csv_columns(source)).to_csv(output, index=False)
+        output.flush()
+    finally:
+        _close_text(output, destination)
+    return rows
@@ -0,0 +1,76 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import get_metrics
+
+try:
+    # Transport errors of the v2 client, which sends its requests through `requests`
+    from requests.exceptions import RequestException
+    REQUESTS_ERRORS = (RequestException,)
+except ImportError:
+    REQUESTS_ERRORS = ()
+
+# Number of requests kept in flight and how often a transient failure is retried
+DEFAULT_MAX_WORKERS = int(os.environ.get('TRANSLATION_MAX_WORKERS', 8))
+DEFAULT_MAX_RETRIES = int(os.environ.get('TRANSLATION_MAX_RETRIES', 5))
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 32.0
+
+# HTTP statuses worth retrying: quota exhaustion and server-side failures
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Errors without a status worth retrying: dropped connections and timeouts
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError) + REQUESTS_ERRORS
+
+
+# Function to decide whether an API error is transient
+def is_retryable(error):
+    # google.api_core exceptions (raised by both the v2 and v3 clients) carry the HTTP status as `code`
+    code = getattr(error, 'code', None)
+    if not isinstance(code, int):
+        # requests' HTTPError carries it on its response
+        code = getattr(getattr(error, 'response', None), 'status_code', None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+# Function to call `fn` and retry transient errors with exponential backoff and full jitter
+def call_with_retry(fn, *args, max_retries=DEFAULT_MAX_RETRIES):
+    attempt = 0
+    while True:
+        try:
+            return fn(*args)
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            get_metrics().increment('api_retries', status=getattr(e, 'code', None) or type(e).__name__)
+            time.sleep(random.uniform(0, min(MAX_RETRY_DELAY, BASE_RETRY_DELAY * 2 ** attempt)))
+            attempt += 1
+
+
+# Function to run `fn` over `items` on a bounded thread pool
+def run_concurrently(fn, items, max_workers=DEFAULT_MAX_WORKERS, max_retries=DEFAULT_MAX_RETRIES, on_result=None):
+    """
+    Calls `fn(item)` for every item with at most `max_workers` calls in flight,
+    retrying transient errors. Returns a list of (result, error) tuples in the
+    order of `items`; error is None on success and the final exception otherwise.
+    `on_result(item, result, error)` is called from the worker thread as soon
+    as each item finishes.
+    """
+    def run(item):
+        try:
+            outcome = call_with_retry(fn, item, max_retries=max_retries), None
+        except Exception as e:
+            outcome = None, e
+        if on_result is not None:
+            on_result(item, *outcome)
+        return outcome
+
+    if max_workers <= 1 or len(items) <= 1:
+        return [run(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(run, items))
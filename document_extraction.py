@@ -0,0 +1,138 @@
+"""
+Streaming extraction of PDF, PPTX and DOCX documents into structured segments.
+
+Documents are read unit by unit (PDF pages, PPTX slides, DOCX paragraphs) and
+yielded in document order as DocumentSegment tuples, one per line of text,
+instead of as one concatenated string. The visually wrapped lines of PDF pages
+are first joined back into paragraphs, so whole sentences are translated. PDF
+pages are parsed in a process pool a few tasks ahead of the consumer, so
+translation of the first pages starts while later ones are still being parsed.
+"""
+import io
+import multiprocessing
+import os
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from metrics import get_metrics
+from segmenter import join_wrapped_lines
+
+DOCUMENT_EXTENSIONS = ('.docx', '.pdf', '.pptx')
+
+# Processes parsing PDF pages, and pages per task; smaller PDFs are parsed in the calling process
+EXTRACT_WORKERS = int(os.environ.get('TRANSLATION_EXTRACT_WORKERS', os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = 8
+
+# Tasks submitted ahead of the one being consumed, per worker; bounds the memory of parsed pages
+TASKS_AHEAD_PER_WORKER = 2
+
+# Workers are started fresh rather than forked: the Streamlit server and job threads may hold locks at fork time
+POOL_CONTEXT = 'spawn'
+
+# One line of a document: unit is 'page', 'slide' or 'paragraph', index counts units and line counts lines in the unit
+# (paragraphs, for PDF pages)
+DocumentSegment = namedtuple('DocumentSegment', ['unit', 'index', 'line', 'text'])
+
+# PdfReader of a pool worker, opened once per process by the initializer
+_worker_reader = None
+
+
+# Function to open a PDF from a path or its bytes
+def _open_pdf(source):
+    import PyPDF2
+    return PyPDF2.PdfReader(source if isinstance(source, str) else io.BytesIO(source))
+
+
+# Function to open the PDF once in each pool worker
+def _init_pdf_worker(source):
+    global _worker_reader
+    _worker_reader = _open_pdf(source)
+
+
+# Function to extract the text of pages [start, stop) in a pool worker
+def _extract_pdf_pages(start, stop):
+    return [_worker_reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+# Function to split the text of one unit into its line segments
+def _unit_segments(unit, index, text):
+    return [DocumentSegment(unit, index, line, line_text) for line, line_text in enumerate(text.split('\n'))]
+
+
+# Function to get a path as is and the content of a file object as bytes, which can be sent to worker processes
+def _picklable_source(file):
+    if isinstance(file, str):
+        return file
+    file.seek(0)
+    return file.read()
+
+
+# Function to yield the segments of a PDF, parsing its pages in parallel
+def iter_pdf_segments(file, max_workers=EXTRACT_WORKERS):
+    source = _picklable_source(file)
+    metrics = get_metrics()
+    reader = _open_pdf(source)
+    page_count = len(reader.pages)
+
+    if max_workers <= 1 or page_count <= PDF_PAGES_PER_TASK:
+        for i in range(page_count):
+            with metrics.timed('extract', file_type='pdf'):
+                text = join_wrapped_lines(reader.pages[i].extract_text() or '')
+            yield from _unit_segments('page', i, text)
+        return
+
+    ranges = deque((start, min(start + PDF_PAGES_PER_TASK, page_count))
+                   for start in range(0, page_count, PDF_PAGES_PER_TASK))
+    with ProcessPoolExecutor(
+        max_workers, mp_context=multiprocessing.get_context(POOL_CONTEXT), initializer=_init_pdf_worker, initargs=(source,)
+    ) as pool:
+        pending = deque()
+        while ranges or pending:
+            # Keep the pool busy while the consumer works on the pages already parsed
+            while ranges and len(pending) < max_workers * TASKS_AHEAD_PER_WORKER:
+                start, stop = ranges.popleft()
+                pending.append((start, pool.submit(_extract_pdf_pages, start, stop)))
+            start, future = pending.popleft()
+            with metrics.timed('extract', file_type='pdf'):
+                texts = future.result()
+            for offset, text in enumerate(texts):
+                yield from _unit_segments('page', start + offset, join_wrapped_lines(text))
+
+
+# Function to yield the segments of a PowerPoint file, slide by slide
+def iter_pptx_segments(file):
+    from pptx import Presentation
+
+    metrics = get_metrics()
+    with metrics.timed('extract', file_type='pptx'):
+        slides = Presentation(file).slides
+    for index, slide in enumerate(slides):
+        with metrics.timed('extract', file_type='pptx'):
+            text = '\n'.join(shape.text for shape in slide.shapes if hasattr(shape, "text"))
+        yield from _unit_segments('slide', index, text)
+
+
+# Function to yield the segments of a Word file, paragraph by paragraph
+def iter_docx_segments(file):
+    from docx import Document
+
+    with get_metrics().timed('extract', file_type='docx'):
+        doc = Document(file)
+    for index, paragraph in enumerate(doc.paragraphs):
+        yield from _unit_segments('paragraph', index, paragraph.text)
+
+
+# Function to yield the segments of a document in order, or None for other file types
+def iter_document_segments(file, max_workers=EXTRACT_WORKERS):
+    """
+    Accepts a path or a file-like object with a `name`. Joining the texts of
+    all segments with newlines gives the document's plain text.
+    """
+    name = file if isinstance(file, str) else file.name
+    if name.endswith('.pdf'):
+        return iter_pdf_segments(file, max_workers)
+    elif name.endswith('.pptx'):
+        return iter_pptx_segments(file)
+    elif name.endswith('.docx'):
+        return iter_docx_segments(file)
+    return None
@@ -0,0 +1,166 @@
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+
+from metrics import get_metrics
+
+# Number of rows held in memory at a time while streaming a sheet
+DEFAULT_CHUNK_SIZE = 5000
+
+
+# Function to open a workbook without loading its cells into memory
+def open_workbook(file):
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    return load_workbook(file, read_only=True, data_only=True)
+
+
+# Function to list the sheet names of a workbook
+def get_sheet_names(file):
+    workbook = open_workbook(file)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+# Function to turn a header row into column names the way pandas.read_excel does
+def column_names(header):
+    """
+    Empty headers become 'Unnamed: <position>' and repeated names are made
+    unique as 'X', 'X.1', 'X.2', ...
+    """
+    names = []
+    counts = {}
+    for i, value in enumerate(header):
+        name = f"Unnamed: {i}" if value is None else value
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        names.append(name)
+        counts[name] = count + 1
+    return names
+
+
+# Function to read the header row of each sheet
+def get_sheet_columns(file, sheet_names):
+    workbook = open_workbook(file)
+    try:
+        columns = {}
+        for sheet_name in sheet_names:
+            header = next(workbook[sheet_name].iter_rows(max_row=1, values_only=True), ())
+            columns[sheet_name] = column_names(header)
+        return columns
+    finally:
+        workbook.close()
+
+
+# Function to read a sheet of an open read-only workbook as DataFrames of at most `chunksize` rows
+def iter_sheet_chunks(workbook, sheet_name, chunksize=DEFAULT_CHUNK_SIZE):
+    rows = workbook[sheet_name].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        return
+    columns = column_names(header)
+    width = len(columns)
+
+    chunk = []
+    emitted = False
+    for row in rows:
+        chunk.append(tuple(row[:width]) + (None,) * (width - len(row)))
+        if len(chunk) >= chunksize:
+            yield pd.DataFrame(chunk, columns=columns)
+            emitted = True
+            chunk = []
+    if chunk or not emitted:
+        # A header-only sheet still yields one empty chunk so its columns are kept
+        yield pd.DataFrame(chunk, columns=columns)
+
+
+class StreamingWorkbookWriter:
+    """
+    Writes DataFrame chunks sheet by sheet through openpyxl's write-only mode,
+    which spools rows to disk instead of keeping the whole workbook in memory.
+    """
+
+    def __init__(self):
+        self.workbook = Workbook(write_only=True)
+        self.sheet = None
+
+    def start_sheet(self, sheet_name, columns):
+        self.sheet = self.workbook.create_sheet(title=sheet_name)
+        if len(columns):
+            self.sheet.append(list(columns))
+
+    def write_chunk(self, df):
+        # Write NaN/NaT as empty cells like pandas.DataFrame.to_excel does
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.sheet.append(row)
+
+    def save(self, destination):
+        self.workbook.save(destination)
+
+
+# Function to overwrite single cells of a workbook, leaving every other cell as it is
+def fill_workbook_cells(source, destination, values):
+    """
+    `values` maps (sheet name, column name, data row) to the new cell value,
+    with column names as iter_sheet_chunks reads them. The workbook is loaded
+    with openpyxl and saved to `destination`, which may be `source`.
+    """
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    workbook = load_workbook(source)
+    positions = {}
+    for (sheet_name, column, row), value in values.items():
+        sheet = workbook[sheet_name]
+        if sheet_name not in positions:
+            header = next(sheet.iter_rows(max_row=1, values_only=True), ())
+            positions[sheet_name] = {str(name): i for i, name in enumerate(column_names(header))}
+        # Row 1 is the header and openpyxl counts from 1
+        sheet.cell(row=row + 2, column=positions[sheet_name][str(column)] + 1, value=value)
+    workbook.save(destination)
+
+
+# Function to copy a workbook chunk by chunk, translating the chunks of the selected sheets
+def translate_workbook_streaming(source, destination, selected_sheets, translate_chunk, chunksize=DEFAULT_CHUNK_SIZE):
+    """
+    Reads `source` with openpyxl in read-only mode and writes every sheet to
+    `destination` through a write-only workbook. Chunks of sheets in
+    `selected_sheets` (all sheets if None) are passed through
+    `translate_chunk(sheet_name, df)` before they are written. Returns the number of data rows per sheet.
+    """
+    metrics = get_metrics()
+    with metrics.timed('parse', file_type='xlsx'):
+        workbook = open_workbook(source)
+    writer = StreamingWorkbookWriter()
+    row_counts = {}
+    try:
+        for sheet_name in workbook.sheetnames:
+            row_counts[sheet_name] = 0
+            started = False
+            chunks = iter_sheet_chunks(workbook, sheet_name, chunksize)
+            while True:
+                with metrics.timed('parse', file_type='xlsx'):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                if selected_sheets is None or sheet_name in selected_sheets:
+                    chunk = translate_chunk(sheet_name, chunk)
+                if not started:
+                    # The header comes from the translated chunk, which may have gained columns
+                    writer.start_sheet(sheet_name, chunk.columns)
+                    started = True
+                with metrics.timed('write', file_type='xlsx'):
+                    writer.write_chunk(chunk)
+                row_counts[sheet_name] += len(chunk)
+            if not started:
+                # Keep empty sheets in the output
+                writer.start_sheet(sheet_name, [])
+    finally:
+        workbook.close()
+    with metrics.timed('write', file_type='xlsx'):
+        writer.save(destination)
+    return row_counts
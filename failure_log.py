@@ -0,0 +1,118 @@
+"""
+Out-of-band record of the cells whose translation failed.
+
+Failed cells are left empty in the output instead of holding an error message,
+and each failure is recorded with its coordinates (sheet, output column, data
+row), source text, target language and error class. The log is saved next to
+the output file, so the failed cells can later be translated again on their
+own (`translate_cli.py --retry-failed`).
+"""
+import json
+import os
+import threading
+from collections import Counter, namedtuple
+
+import numpy as np
+
+# Suffix of the failure log written next to an output file
+FAILURE_LOG_SUFFIX = '.failures.jsonl'
+
+# One failed cell; row counts the data rows of the sheet from 0, below the header, and file names
+# the member of an output archive that holds the sheet (None for a single output file)
+CellFailure = namedtuple(
+    'CellFailure', ['sheet', 'column', 'row', 'text', 'target_language', 'error_class', 'message', 'file'],
+    defaults=(None,),
+)
+
+
+# Function to name the failure log of an output file
+def failure_log_path(output_path):
+    return f'{output_path}{FAILURE_LOG_SUFFIX}'
+
+
+class FailureLog:
+    """
+    Thread-safe list of CellFailure records.
+    """
+
+    def __init__(self, failures=()):
+        self.failures = list(failures)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.failures)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self.failures))
+
+    def add(self, failure):
+        with self._lock:
+            self.failures.append(failure)
+
+    def add_plan_failures(self, plan, errors, target_language, sheet_name_for=None, column_name_for=None,
+                          row_offset=0, file_name_for=None):
+        """
+        Records the cells of a translation plan whose distinct value failed.
+        `errors` maps positions in plan.uniques to exceptions. The output
+        sheet and column default to the planned ones; `row_offset` shifts the
+        rows of a chunk to their place in the whole sheet, and
+        `file_name_for(sheet)` names the archive member of a planned sheet.
+        """
+        if not errors:
+            return
+        failed_codes = np.fromiter(errors, dtype=np.int64)
+        for sheet_name, column, mask, start, stop in plan.slots:
+            codes = plan.codes[start:stop]
+            failed = np.flatnonzero(np.isin(codes, failed_codes))
+            if not len(failed):
+                continue
+            rows = np.flatnonzero(mask)[failed]
+            for row, code in zip(rows, codes[failed]):
+                error = errors[int(code)]
+                self.add(CellFailure(
+                    sheet_name_for(sheet_name) if sheet_name_for else sheet_name,
+                    column_name_for(column) if column_name_for else column,
+                    int(row) + row_offset,
+                    plan.uniques[code],
+                    target_language,
+                    type(error).__name__,
+                    str(error),
+                    file_name_for(sheet_name) if file_name_for else None,
+                ))
+
+    def summary(self):
+        if not self.failures:
+            return "no failed cells"
+        classes = Counter(failure.error_class for failure in self.failures)
+        return f"{len(self.failures)} failed cells (" + ", ".join(
+            f"{count} {error_class}" for error_class, count in classes.most_common()
+        ) + ")"
+
+    def to_jsonl(self):
+        return ''.join(
+            json.dumps(failure._asdict(), ensure_ascii=False, default=str) + '\n' for failure in self
+        )
+
+    # Function to split the log by archive member, as {file: FailureLog}
+    def by_file(self):
+        logs = {}
+        for failure in self:
+            logs.setdefault(failure.file, FailureLog()).add(failure)
+        return logs
+
+    # Function to save the log next to its output, or remove a stale one when nothing failed
+    def save(self, path):
+        if not self.failures:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path, 'w', encoding='utf-8') as log_file:
+            log_file.write(self.to_jsonl())
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding='utf-8') as log_file:
+            return cls(CellFailure(**json.loads(line)) for line in log_file if line.strip())
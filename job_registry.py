@@ -0,0 +1,205 @@
+"""
+Background translation jobs.
+
+Jobs run on a process-wide pool of worker threads and are tracked in a
+registry that the apps poll, so a translation neither freezes the session
+nor depends on the browser tab staying open. Each job reports the units it
+has finished out of its total, from which progress, throughput and ETA are
+derived, can offer a partial result and a preview while it runs, and can be
+cancelled between units of work.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Jobs running at the same time; the API requests of each job are parallelized and rate limited separately
+JOB_WORKERS = int(os.environ.get('TRANSLATION_JOB_WORKERS', 2))
+
+# Finished jobs kept in the registry, so their results can still be downloaded
+MAX_FINISHED_JOBS = 20
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job when it has been cancelled.
+    """
+
+
+class TranslationJob:
+    """
+    State of one background job. The job function calls `publish` as units
+    of work finish; this also stops the job once it has been cancelled. The
+    output of a running job is only touched by its own thread: a partial
+    result requested with `request_partial` is built at the next `publish`.
+    Results are (file name, bytes, mime type); the return value of the job
+    function becomes `result`. A job that records its failed cells in
+    `failures` (a FailureLog) can set `retry` to a job function that
+    translates just those cells of its result again.
+    """
+
+    def __init__(self, job_id, name, total=0):
+        self.id = job_id
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.status = JOB_QUEUED
+        self.error = None
+        self.result = None
+        self.summary = None
+        self.preview = None
+        self.partial_result = None
+        self.failures = None
+        self.retry = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._partial_event = threading.Event()
+
+    def publish(self, done, total=None, preview=None, build_partial=None):
+        """
+        Records that `done` units are finished, replaces the preview when one
+        is given and builds the partial result if it was requested. Raises
+        JobCancelled once the job has been cancelled, keeping what was done
+        as the partial result.
+        """
+        self.done = done
+        if total is not None:
+            self.total = total
+        if preview is not None:
+            self.preview = preview
+        if build_partial is not None and (self._partial_event.is_set() or self._cancel_event.is_set()):
+            self._partial_event.clear()
+            self.partial_result = build_partial()
+        self.raise_if_cancelled()
+
+    def request_partial(self):
+        self._partial_event.set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def raise_if_cancelled(self):
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.name} was cancelled")
+
+    @property
+    def finished_state(self):
+        return self.status in FINISHED_STATES
+
+    @property
+    def progress(self):
+        if self.status == JOB_DONE:
+            return 1.0
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def throughput(self):
+        return self.done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        if self.finished_state or not self.throughput or not self.total:
+            return None
+        return max(0.0, (self.total - self.done) / self.throughput)
+
+    def describe(self):
+        text = f"{self.name}: {self.status}, {self.done}/{self.total} done"
+        if self.throughput:
+            text += f", {self.throughput:.1f}/s"
+        if self.eta is not None:
+            text += f", about {self.eta:.0f}s left"
+        if self.error:
+            text += f" ({self.error})"
+        return text
+
+
+class JobRegistry:
+    def __init__(self, max_workers=JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='translation-job')
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, name, run, total=0):
+        """
+        Queues `run(job)` and returns the job at once.
+        """
+        with self._lock:
+            job = TranslationJob(str(next(self._ids)), name, total)
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def _run(self, job, run):
+        job.started = time.time()
+        job.status = JOB_RUNNING
+        try:
+            job.raise_if_cancelled()
+            job.result = run(job)
+            status = JOB_DONE
+        except JobCancelled:
+            status = JOB_CANCELLED
+        except Exception as e:
+            logger.exception("Job %s failed", job.name)
+            job.error = str(e)
+            status = JOB_FAILED
+        # The finish time is set before the final status, so no other thread sees a finished job without it
+        job.finished = time.time()
+        job.status = status
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.submitted, reverse=True)
+
+    def remove(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job.finished_state:
+                del self._jobs[job_id]
+
+    # Drop the oldest finished jobs beyond MAX_FINISHED_JOBS
+    def _evict(self):
+        finished = sorted((job for job in self._jobs.values() if job.finished_state), key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job.id]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+# Function to get the job registry of this server process
+def get_job_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = JobRegistry()
+        return _registry
@@ -0,0 +1,149 @@
+"""
+Offline language identification for the languages the apps offer.
+
+Non-Latin scripts are recognised by their Unicode ranges; Latin-script
+languages are scored against short lists of very frequent function words.
+Texts that give no clear signal (single words, names, numbers) come back
+as None and are left to the caller's fallback language. A text is only taken
+to be in the target language already, and so left untranslated, when several
+function words and a clear margin over every other language say so.
+"""
+import re
+
+# Unicode ranges of scripts that identify a language on their own; kana is checked
+# before Han so Japanese mixed with kanji is not taken for Chinese
+SCRIPT_RANGES = [
+    ('ar', re.compile(r'[؀-ۿݐ-ݿ]')),
+    ('th', re.compile(r'[฀-๿]')),
+    ('el', re.compile(r'[Ͱ-Ͽ]')),
+    ('ko', re.compile(r'[가-힯ᄀ-ᇿ]')),
+    ('ja', re.compile(r'[぀-ヿ]')),
+    ('zh-CN', re.compile(r'[一-鿿]')),
+]
+CYRILLIC_PATTERN = re.compile(r'[Ѐ-ӿ]')
+WORD_PATTERN = re.compile(r"[^\W\d_]+(?:'[^\W\d_]+)?")
+
+# Very frequent function words of the Latin- and Cyrillic-script languages; content words such as
+# 'service' or 'good' are left out, they turn up in feedback written in any language
+STOPWORDS = {
+    'en': "the and is are was to of in it that this for not with you but have on my they be no",
+    'de': "der die das und ist nicht ich sie es zu mit auf für ein eine war wir auch aber kein",
+    'fr': "le la les et est pas je il elle de des du un une pour avec que qui sur ne mais",
+    'es': "el la los las y es no de que en un una por para con pero se lo del",
+    'it': "il lo la gli le e è non di che un una per con sono ma della del",
+    'pt': "o a os as e é não de que um uma para com por mas do da",
+    'nl': "de het een en is niet ik je dat van voor met maar zijn wij ook",
+    'sv': "och det är att inte jag en ett som på för med men var vi",
+    'da': "og det er at ikke jeg en et som på for med men var vi",
+    'fi': "ja on ei se että oli olen mutta kanssa tämä myös",
+    'et': "ja on ei see et oli olen aga koos ka",
+    'pl': "i jest nie to że w na się z do ale jak jestem",
+    'cs': "a je není to že v na se s do ale jsem jsou",
+    'sk': "a je nie to že v na sa s do ale som sú",
+    'sl': "in je ni to da v na se s z ampak sem so",
+    'hr': "i je nije to da u na se s sa ali sam su",
+    'hu': "a az és van nem hogy egy is de volt vagyok",
+    'ro': "și este nu că în pe cu un o dar sunt am",
+    'tr': "ve bir bu değil ile için da de ama ben var",
+    'lv': "un ir nav ka es ar uz par bet bija",
+    'lt': "ir yra ne kad aš su į bet buvo",
+    'id': "dan yang tidak ini itu di ke dengan untuk tapi saya ada",
+    'vi': "và là không có của một cho với nhưng tôi được",
+    'ca': "el la els les i és no de que en un una per amb però",
+    'ru': "и в не на что я с он она это но как был есть",
+    'uk': "і в не на що я з він вона це але як був є",
+    'bg': "и в не на че аз с той тя това но как беше е",
+}
+STOPWORDS = {language: set(words.split()) for language, words in STOPWORDS.items()}
+CYRILLIC_LANGUAGES = ('ru', 'uk', 'bg')
+
+# Minimum number of function-word hits before a Latin-script guess is trusted
+MIN_STOPWORD_HITS = 1
+
+# Function-word hits, and lead over the next language, before a text is left untranslated as already in the target
+MIN_TARGET_HITS = 2
+MIN_TARGET_MARGIN = 2
+
+
+# Function to identify a text by its script, or else score it against the function words of each candidate language
+def _language_scores(text):
+    """
+    Returns (language, None) when the script decides, (None, scores) for
+    Latin- and Cyrillic-script texts and (None, None) for texts without words.
+    """
+    for language, pattern in SCRIPT_RANGES:
+        if pattern.search(text):
+            return language, None
+
+    words = [word.lower() for word in WORD_PATTERN.findall(text)]
+    if not words:
+        return None, None
+
+    if CYRILLIC_PATTERN.search(text):
+        if re.search(r'[іїєґ]', text, re.IGNORECASE):
+            return 'uk', None
+        candidates = CYRILLIC_LANGUAGES
+    else:
+        candidates = [language for language in STOPWORDS if language not in CYRILLIC_LANGUAGES]
+    return None, {language: sum(word in STOPWORDS[language] for word in words) for language in candidates}
+
+
+# Function to identify the language of a single text locally
+def detect_language(text):
+    if not isinstance(text, str) or not text.strip():
+        return None
+
+    language, scores = _language_scores(text)
+    if scores is None:
+        return language
+
+    best = max(scores, key=scores.get)
+    if scores[best] < MIN_STOPWORD_HITS or list(scores.values()).count(scores[best]) > 1:
+        # Cyrillic text is most likely Russian; an unclear Latin-script text stays undetected
+        return 'ru' if CYRILLIC_PATTERN.search(text) else None
+    return best
+
+
+# Function to decide whether a text is clearly in a language, strictly enough to skip translating it
+def clearly_in_language(text, language):
+    if not isinstance(text, str) or not text.strip():
+        return False
+
+    detected, scores = _language_scores(text)
+    if scores is None:
+        return same_language(detected, language)
+
+    hits = next((score for candidate, score in scores.items() if same_language(candidate, language)), 0)
+    runner_up = max((score for candidate, score in scores.items() if not same_language(candidate, language)), default=0)
+    return hits >= MIN_TARGET_HITS and hits - runner_up >= MIN_TARGET_MARGIN
+
+
+# Function to compare language codes by their primary subtag, e.g. 'zh-CN' and 'zh'
+def same_language(first, second):
+    return bool(first and second) and first.split('-')[0].lower() == second.split('-')[0].lower()
+
+
+# Function to tag texts by language and group the ones that need translating
+def group_by_language(texts, target_language, fallback_language=None):
+    """
+    Returns (groups, already_in_target): groups maps a source language to the
+    positions of the texts detected in it (undetected texts go to
+    `fallback_language`, which may be None for server-side detection), and
+    already_in_target lists the positions that need no translation. A text
+    detected in the target language without a clear signal is translated
+    from `fallback_language` rather than skipped.
+    """
+    groups = {}
+    already_in_target = []
+    for i, text in enumerate(texts):
+        if not text:
+            continue
+        language = detect_language(text)
+        if same_language(language, target_language):
+            if clearly_in_language(text, target_language):
+                already_in_target.append(i)
+            else:
+                groups.setdefault(fallback_language, []).append(i)
+        else:
+            groups.setdefault(language or fallback_language, []).append(i)
+    return groups, already_in_target
@@ -0,0 +1,184 @@
+"""
+Process-wide instrumentation of the translation pipeline.
+
+Stages record their latency in histograms and the API layer counts requests,
+characters, retries, cache hits and the estimated cost per model. The
+registry can be rendered as JSON or in the Prometheus text exposition format.
+"""
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float('inf'))
+
+# List price per million characters sent, in USD, by the model names of batching.py; used for the cost estimate
+COST_PER_MILLION_CHARACTERS = {
+    'v2/nmt': 20.0,
+    'general/nmt': 20.0,
+    'general/translation-llm': 20.0,
+}
+
+METRIC_PREFIX = 'translation_'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # Estimate a quantile as the upper bound of the bucket it falls in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= q * self.count:
+                return bound
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters and histograms, each identified by a name and a set
+    of labels, e.g. ('api_requests', {'model': 'v2/nmt'}).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(value)
+
+    @contextmanager
+    def timed(self, stage, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage, **labels)
+
+    # Record one API request; only requests that succeeded add to the estimated cost
+    def record_request(self, model, texts, seconds, failed=False):
+        characters = sum(len(text) for text in texts)
+        self.increment('api_requests', model=model)
+        self.increment('api_segments', len(texts), model=model)
+        self.increment('api_characters', characters, model=model)
+        if failed:
+            # Failed attempts are not billed; a retry is counted again when it is sent
+            self.increment('api_request_failures', model=model)
+        else:
+            self.increment('estimated_cost_usd', characters * COST_PER_MILLION_CHARACTERS.get(model, 0.0) / 1e6, model=model)
+        self.observe('api_request_seconds', seconds, model=model)
+
+    def counter_total(self, name):
+        with self._lock:
+            return sum(value for (counter_name, _), value in self.counters.items() if counter_name == name)
+
+    def stage_summary(self):
+        """
+        Returns one row per stage and labels: calls, total, mean and
+        approximate p95 seconds.
+        """
+        with self._lock:
+            rows = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                rows.append({
+                    'metric': name,
+                    **dict(labels),
+                    'calls': histogram.count,
+                    'total_seconds': round(histogram.sum, 3),
+                    'mean_seconds': round(histogram.sum / histogram.count, 4) if histogram.count else None,
+                    'p95_seconds': histogram.quantile(0.95),
+                })
+            return rows
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'started': self.started,
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                'histograms': [
+                    {
+                        'name': name,
+                        'labels': dict(labels),
+                        'count': histogram.count,
+                        'sum': histogram.sum,
+                        'buckets': {str(bound): count for bound, count in zip(histogram.buckets, histogram.counts)},
+                    }
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self):
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                metric = f'{METRIC_PREFIX}{name}_total'
+                lines.append(f'# TYPE {metric} counter')
+                for (counter_name, labels), value in sorted(self.counters.items()):
+                    if counter_name == name:
+                        lines.append(f'{metric}{_format_labels(labels)} {value}')
+
+            for name in sorted({name for name, _ in self.histograms}):
+                metric = f'{METRIC_PREFIX}{name}'
+                lines.append(f'# TYPE {metric} histogram')
+                for (histogram_name, labels), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f'{metric}_bucket{_format_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{metric}_sum{_format_labels(labels)} {histogram.sum}')
+                    lines.append(f'{metric}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Function to render a label set in the Prometheus text format
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+_registry = MetricsRegistry()
+
+
+# Function to get the process-wide metrics registry
+def get_metrics():
+    return _registry
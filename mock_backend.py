@@ -0,0 +1,146 @@
+"""
+Offline stand-ins for the Google Cloud Translation clients.
+
+MockTranslateClient mimics translate_v2.Client.translate and
+MockTranslationServiceClient mimics translate_v3.TranslationServiceClient
+.translate_text closely enough for the batching code. Both simulate request
+latency, transient failures and the per-request limits, and count what would
+have been billed. No network access or credentials are needed.
+"""
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from batching import V2_MAX_SEGMENTS, V2_MAX_CHARS, V3_MAX_SEGMENTS, V3_MAX_CHARS
+from language_id import detect_language
+
+# Simulated seconds per request and per character, and the share of requests that fail transiently
+DEFAULT_MOCK_LATENCY = float(os.environ.get('TRANSLATION_MOCK_LATENCY', 0.05))
+DEFAULT_MOCK_CHAR_LATENCY = float(os.environ.get('TRANSLATION_MOCK_CHAR_LATENCY', 0.0))
+DEFAULT_MOCK_ERROR_RATE = float(os.environ.get('TRANSLATION_MOCK_ERROR_RATE', 0.0))
+
+# Statuses of the simulated transient failures
+MOCK_ERROR_CODES = (429, 503)
+
+
+class MockApiError(Exception):
+    """
+    Error raised by the mock clients; like google.api_core exceptions it
+    carries the HTTP status as `code`.
+    """
+
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class MockStats:
+    """
+    Thread-safe counters of the requests the mock clients received.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.failed_calls = 0
+            self.segments = 0
+            self.characters = 0
+
+    def record(self, texts, failed):
+        with self._lock:
+            self.calls += 1
+            self.failed_calls += failed
+            self.segments += len(texts)
+            self.characters += sum(len(text) for text in texts)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'failed_calls': self.failed_calls,
+                'segments': self.segments,
+                'characters': self.characters,
+            }
+
+
+# Function to produce the deterministic stand-in translation of a text
+def mock_translate(text, target_language):
+    return f'[{target_language}] {text}'
+
+
+class _MockClient:
+    def __init__(self, latency=DEFAULT_MOCK_LATENCY, char_latency=DEFAULT_MOCK_CHAR_LATENCY,
+                 error_rate=DEFAULT_MOCK_ERROR_RATE, max_segments=None, max_chars=None, seed=None, stats=None):
+        self.latency = latency
+        self.char_latency = char_latency
+        self.error_rate = error_rate
+        self.max_segments = max_segments or self.default_max_segments
+        self.max_chars = max_chars or self.default_max_chars
+        self.stats = stats or MockStats()
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def _translate(self, texts, target_language):
+        characters = sum(len(text) for text in texts)
+        time.sleep(self.latency + characters * self.char_latency)
+
+        if len(texts) > self.max_segments or characters > self.max_chars:
+            self.stats.record(texts, failed=True)
+            raise MockApiError(400, f"Request of {len(texts)} segments / {characters} characters exceeds the limits")
+        with self._random_lock:
+            failure_code = self._random.choice(MOCK_ERROR_CODES) if self._random.random() < self.error_rate else None
+        self.stats.record(texts, failed=failure_code is not None)
+        if failure_code is not None:
+            raise MockApiError(failure_code, "Simulated transient failure")
+        return [mock_translate(text, target_language) for text in texts]
+
+
+class MockTranslateClient(_MockClient):
+    """
+    Stand-in for google.cloud.translate_v2.Client.
+    """
+    default_max_segments = V2_MAX_SEGMENTS
+    default_max_chars = V2_MAX_CHARS
+
+    def translate(self, values, target_language=None, source_language=None, **kwargs):
+        single = isinstance(values, str)
+        texts = [values] if single else list(values)
+        results = [
+            {'translatedText': translated_text, 'input': text}
+            for text, translated_text in zip(texts, self._translate(texts, target_language or 'en'))
+        ]
+        return results[0] if single else results
+
+    def detect_language(self, values):
+        single = isinstance(values, str)
+        texts = [values] if single else list(values)
+        results = [{'language': detect_language(text) or 'und', 'confidence': 1.0, 'input': text} for text in texts]
+        return results[0] if single else results
+
+
+class MockTranslationServiceClient(_MockClient):
+    """
+    Stand-in for google.cloud.translate_v3.TranslationServiceClient.
+    """
+    default_max_segments = V3_MAX_SEGMENTS
+    default_max_chars = V3_MAX_CHARS
+
+    def translate_text(self, request=None, **kwargs):
+        request = request or kwargs
+        translations = self._translate(list(request['contents']), request['target_language_code'])
+        return SimpleNamespace(
+            translations=[SimpleNamespace(translated_text=translated_text) for translated_text in translations]
+        )
+
+    def detect_language(self, request=None, **kwargs):
+        request = request or kwargs
+        language = detect_language(request['content'])
+        return SimpleNamespace(
+            languages=[SimpleNamespace(language_code=language, confidence=1.0)] if language else []
+        )
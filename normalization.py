@@ -0,0 +1,95 @@
+"""
+Normalization of source texts before they are sent for translation.
+
+Usernames, hyperlinks and runs of whitespace are removed by post-processing
+anyway, so dropping them beforehand only saves billed characters. Emoji at
+the end of a text are masked: they are cut off before translation and put
+back afterwards. Near-identical texts then share one cache entry.
+"""
+import re
+import threading
+import unicodedata
+
+from postprocessing import (
+    DEFAULT_STEPS, NON_ASCII_PATTERN, REMOVAL_PATTERNS, STEP_HYPERLINKS, STEP_SPACES, STEP_USERNAMES,
+    WHITESPACE_PATTERN,
+)
+
+# Trailing run of emoji, symbols and the whitespace between them
+TRAILING_EMOJI_PATTERN = re.compile(
+    r'(?:\s*[←-⯿☀-➿〰〽\U0001f000-\U0001faff][️‍\U0001f3fb-\U0001f3ff]*)+\s*$'
+)
+
+
+class NormalizationReport:
+    """
+    Running totals of the characters a job would have sent without
+    normalization and the characters it actually sent.
+    """
+
+    def __init__(self):
+        self.texts = 0
+        self.characters_before = 0
+        self.characters_after = 0
+        self._lock = threading.Lock()
+
+    def add(self, texts, normalized_texts):
+        with self._lock:
+            self.texts += len(texts)
+            self.characters_before += sum(len(text) for text in texts)
+            self.characters_after += sum(len(text) for text in normalized_texts)
+
+    @property
+    def characters_saved(self):
+        return self.characters_before - self.characters_after
+
+    def summary(self):
+        percent = 100 * self.characters_saved / self.characters_before if self.characters_before else 0
+        return (f"Normalization saved {self.characters_saved} of {self.characters_before} characters "
+                f"({percent:.1f}%) across {self.texts} texts")
+
+
+# Function to normalize one text before translation, returning it and the masked suffix to restore
+def normalize_for_translation(text, steps=DEFAULT_STEPS):
+    text = unicodedata.normalize('NFC', text)
+
+    suffix = ''
+    if NON_ASCII_PATTERN.search(text):
+        match = TRAILING_EMOJI_PATTERN.search(text)
+        if match:
+            text, suffix = text[:match.start()], match.group().strip()
+
+    removal_pattern = REMOVAL_PATTERNS.get((STEP_USERNAMES in steps, STEP_HYPERLINKS in steps))
+    if removal_pattern is not None:
+        text = removal_pattern.sub('', text)
+
+    if STEP_SPACES in steps:
+        text = WHITESPACE_PATTERN.sub(' ', text).strip()
+    return text, suffix
+
+
+# Function to normalize a list of texts, returning the texts to send and the suffixes to restore
+def normalize_texts(texts, steps=DEFAULT_STEPS, report=None):
+    normalized_texts = []
+    suffixes = []
+    for text in texts:
+        if isinstance(text, str) and text:
+            text, suffix = normalize_for_translation(text, steps)
+        else:
+            suffix = ''
+        normalized_texts.append(text)
+        suffixes.append(suffix)
+
+    if report is not None:
+        sent = [(text, normalized) for text, normalized in zip(texts, normalized_texts) if isinstance(text, str)]
+        report.add([text for text, _ in sent], [normalized for _, normalized in sent])
+    return normalized_texts, suffixes
+
+
+# Function to put the masked suffixes back onto the translations
+def restore_texts(translations, suffixes):
+    return [
+        translated_text if not suffix or translated_text is None
+        else f'{translated_text} {suffix}' if translated_text else suffix
+        for translated_text, suffix in zip(translations, suffixes)
+    ]
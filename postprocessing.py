@@ -0,0 +1,80 @@
+"""
+Post-processing applied to translated texts.
+
+The steps run over a whole batch at once through pandas' vectorized string
+methods, with every pattern compiled once at import and the username and
+hyperlink removal fused into a single pass. Each step can be switched off.
+"""
+import re
+
+import emoji
+import pandas as pd
+
+from metrics import get_metrics
+
+# Post-processing steps, in the order they run
+STEP_EMOTICONS = 'emoticons'
+STEP_USERNAMES = 'usernames'
+STEP_HYPERLINKS = 'hyperlinks'
+STEP_SPACES = 'spaces'
+STEP_QUOTES = 'quotes'
+STEP_SPECIAL_CHARACTERS = 'special-characters'
+ALL_STEPS = (STEP_EMOTICONS, STEP_USERNAMES, STEP_HYPERLINKS, STEP_SPACES, STEP_QUOTES, STEP_SPECIAL_CHARACTERS)
+DEFAULT_STEPS = ALL_STEPS[:-1]
+
+# emoji.demojize only ever rewrites non-ASCII characters, so pure ASCII texts skip it
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+USERNAME_PATTERN = r'@\w+'
+HYPERLINK_PATTERN = r'http\S+|www\S+|https\S+'
+REMOVAL_PATTERNS = {
+    (True, False): re.compile(USERNAME_PATTERN),
+    (False, True): re.compile(HYPERLINK_PATTERN),
+    (True, True): re.compile(f'{USERNAME_PATTERN}|{HYPERLINK_PATTERN}'),
+}
+WHITESPACE_PATTERN = re.compile(r'\s+')
+QUOTES_TABLE = str.maketrans({'“': '"', '”': '"'})
+SPECIAL_CHARACTERS_PATTERN = re.compile(r'[^a-zA-Z0-9\s.,!?\'"()]+')
+
+
+# Function to pick the post-processing steps for the apps' "remove special characters" switch
+def steps_for(remove_special=False, disabled=()):
+    steps = ALL_STEPS if remove_special else DEFAULT_STEPS
+    return tuple(step for step in steps if step not in disabled)
+
+
+# Function to post-process a Series of translated texts in one vectorized pass per step
+def post_process_series(series, steps=DEFAULT_STEPS):
+    series = series.astype(object)
+
+    if STEP_EMOTICONS in steps:
+        has_emoji = series.str.contains(NON_ASCII_PATTERN)
+        if has_emoji.any():
+            series = series.where(~has_emoji, series[has_emoji].map(emoji.demojize))
+
+    removal_pattern = REMOVAL_PATTERNS.get((STEP_USERNAMES in steps, STEP_HYPERLINKS in steps))
+    if removal_pattern is not None:
+        series = series.str.replace(removal_pattern, '', regex=True)
+
+    if STEP_SPACES in steps:
+        series = series.str.replace(WHITESPACE_PATTERN, ' ', regex=True).str.strip()
+
+    if STEP_QUOTES in steps:
+        series = series.str.translate(QUOTES_TABLE)
+
+    if STEP_SPECIAL_CHARACTERS in steps:
+        series = series.str.replace(SPECIAL_CHARACTERS_PATTERN, '', regex=True)
+
+    return series
+
+
+# Function to post-process a list of translated texts, leaving empty and missing entries untouched
+def post_process_texts(texts, steps=DEFAULT_STEPS):
+    texts = list(texts)
+    positions = [i for i, text in enumerate(texts) if isinstance(text, str) and text]
+    if not positions or not steps:
+        return texts
+    with get_metrics().timed('postprocess'):
+        processed = post_process_series(pd.Series([texts[i] for i in positions], dtype=object), steps)
+    for i, text in zip(positions, processed.tolist()):
+        texts[i] = text
+    return texts
@@ -0,0 +1,171 @@
+"""
+Process-wide, quota-aware rate limiting of the Google Cloud Translation APIs.
+
+All sessions and jobs of a server process draw from one token bucket per
+quota, limited both in requests and in characters per minute. Waiting
+requests are served round-robin by job, so a large job cannot starve a small
+one. The rate backs off multiplicatively on every burst of 429 responses and
+creeps back up while requests succeed.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from metrics import get_metrics
+
+# Project quotas per minute; set these to the quotas of your Google Cloud project
+DEFAULT_REQUESTS_PER_MINUTE = float(os.environ.get('TRANSLATION_REQUESTS_PER_MINUTE', 600))
+DEFAULT_CHARACTERS_PER_MINUTE = float(os.environ.get('TRANSLATION_CHARACTERS_PER_MINUTE', 6000000))
+
+# Adaptation: halve the rate on quota errors, at most once per cooldown, and win back a little per success
+BACKOFF_FACTOR = 0.5
+RECOVERY_STEP = 0.01
+MIN_RATE_FACTOR = 0.05
+THROTTLE_COOLDOWN = 5.0
+
+# HTTP status of quota errors
+QUOTA_EXCEEDED_STATUS = 429
+
+
+class AdaptiveRateLimiter:
+    """
+    Token buckets of requests and characters, refilled continuously at
+    `rate_factor` times the quotas. A request may take more characters than
+    are left as long as the bucket is not empty, so texts larger than a
+    minute's quota still go through; the debt delays the following requests.
+    """
+
+    def __init__(self, name, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 characters_per_minute=DEFAULT_CHARACTERS_PER_MINUTE):
+        self.name = name
+        self.requests_per_minute = requests_per_minute
+        self.characters_per_minute = characters_per_minute
+        self.rate_factor = 1.0
+        self._request_tokens = requests_per_minute
+        self._character_tokens = characters_per_minute
+        self._updated = time.monotonic()
+        self._last_throttled = 0.0
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._order = deque()
+
+    def configure(self, requests_per_minute, characters_per_minute):
+        with self._condition:
+            self.requests_per_minute = requests_per_minute
+            self.characters_per_minute = characters_per_minute
+            self.rate_factor = 1.0
+            self._request_tokens = requests_per_minute
+            self._character_tokens = characters_per_minute
+            self._condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._request_tokens = min(
+            self.requests_per_minute, self._request_tokens + elapsed * self.rate_factor * self.requests_per_minute / 60
+        )
+        self._character_tokens = min(
+            self.characters_per_minute,
+            self._character_tokens + elapsed * self.rate_factor * self.characters_per_minute / 60,
+        )
+
+    # Seconds until both buckets allow the next request
+    def _time_until_available(self):
+        waits = [0.0]
+        if self._request_tokens < 1:
+            waits.append((1 - self._request_tokens) * 60 / (self.rate_factor * self.requests_per_minute))
+        if self._character_tokens <= 0:
+            waits.append((1 - self._character_tokens) * 60 / (self.rate_factor * self.characters_per_minute))
+        return max(waits)
+
+    def acquire(self, characters, job=None):
+        """
+        Blocks until the request may be sent. Requests of different jobs take
+        turns; those of one job go out in the order they arrived.
+        """
+        ticket = object()
+        start = time.monotonic()
+        with self._condition:
+            if job not in self._queues:
+                self._queues[job] = deque()
+                self._order.append(job)
+            self._queues[job].append(ticket)
+
+            while True:
+                self._refill()
+                my_turn = self._queues[self._order[0]][0] is ticket
+                wait = self._time_until_available()
+                if my_turn and wait <= 0:
+                    break
+                self._condition.wait(timeout=wait if my_turn else None)
+
+            self._request_tokens -= 1
+            self._character_tokens -= characters
+            self._order.popleft()
+            self._queues[job].popleft()
+            if self._queues[job]:
+                self._order.append(job)
+            else:
+                del self._queues[job]
+            self._condition.notify_all()
+        waited = time.monotonic() - start
+        _thread_waits.seconds = thread_wait_seconds() + waited
+        get_metrics().observe('rate_limiter_wait_seconds', waited, quota=self.name)
+
+    def on_throttled(self):
+        with self._condition:
+            now = time.monotonic()
+            if now - self._last_throttled < THROTTLE_COOLDOWN:
+                # The other requests of the same burst were sent before the rate came down
+                return
+            self._last_throttled = now
+            self._refill()
+            self.rate_factor = max(MIN_RATE_FACTOR, self.rate_factor * BACKOFF_FACTOR)
+            # Drop the burst allowance so the lower rate takes effect at once
+            self._request_tokens = min(self._request_tokens, 0)
+            self._character_tokens = min(self._character_tokens, 0)
+        get_metrics().increment('rate_limiter_throttled', quota=self.name)
+
+    def on_success(self):
+        with self._condition:
+            if self.rate_factor < 1 and time.monotonic() - self._last_throttled >= THROTTLE_COOLDOWN:
+                self._refill()
+                self.rate_factor = min(1.0, self.rate_factor + RECOVERY_STEP)
+
+    @contextmanager
+    def limit(self, texts, job=None):
+        """
+        Waits for capacity for one request of `texts` and adapts the rate to
+        how the request went.
+        """
+        self.acquire(sum(len(text) for text in texts), job)
+        try:
+            yield
+        except Exception as e:
+            if getattr(e, 'code', None) == QUOTA_EXCEEDED_STATUS:
+                self.on_throttled()
+            raise
+        self.on_success()
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+# Seconds each thread has spent waiting in any limiter, so request timings can leave the wait out
+_thread_waits = threading.local()
+
+
+# Function to get the seconds the calling thread has waited for rate limiters so far
+def thread_wait_seconds():
+    return getattr(_thread_waits, 'seconds', 0.0)
+
+
+# Function to get the process-wide rate limiter of a quota, e.g. 'v2' or 'v3'
+def get_rate_limiter(name):
+    with _limiters_lock:
+        if name not in _limiters:
+            _limiters[name] = AdaptiveRateLimiter(name)
+        return _limiters[name]
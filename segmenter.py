@@ -0,0 +1,106 @@
+import re
+
+# Upper bound for a single segment sent to the API; well below the per-request limits
+DEFAULT_MAX_SEGMENT_CHARS = 5000
+
+# Sentence ends: Latin and CJK terminal punctuation followed by whitespace, or a CJK terminal on its own
+SENTENCE_BOUNDARY_PATTERN = re.compile(r'(?<=[.!?])\s+|(?<=[。！？])\s*')
+
+# Line ends after which a wrapped PDF line starts a new paragraph: sentence-final punctuation, possibly quoted
+PARAGRAPH_END_PATTERN = re.compile(r'[.!?:。！？][\'"’”)\]]*$')
+
+
+# Function to join the visually wrapped lines of extracted PDF text back into paragraphs
+def join_wrapped_lines(text):
+    """
+    PDF text extraction breaks lines where the page layout wrapped them, often
+    mid-sentence. Lines are joined until a blank line or a line ending in
+    sentence-final punctuation; blank lines are kept as paragraph breaks.
+    """
+    paragraphs = []
+    current = []
+    for line in text.split('\n'):
+        line = line.strip()
+        if not line:
+            if current:
+                paragraphs.append(' '.join(current))
+                current = []
+            paragraphs.append('')
+            continue
+        current.append(line)
+        if PARAGRAPH_END_PATTERN.search(line):
+            paragraphs.append(' '.join(current))
+            current = []
+    if current:
+        paragraphs.append(' '.join(current))
+    return '\n'.join(paragraphs)
+
+
+# Function to split text that has no sentence boundaries into pieces of at most `max_chars`
+def _split_hard(text, max_chars):
+    pieces = []
+    while len(text) > max_chars:
+        # Prefer to cut at the last whitespace before the limit
+        cut = text.rfind(' ', 0, max_chars)
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(text[:cut].strip())
+        text = text[cut:].strip()
+    if text:
+        pieces.append(text)
+    return pieces
+
+
+# Function to pack the sentences of a paragraph into chunks of at most `max_chars`
+def split_paragraph(paragraph, max_chars=DEFAULT_MAX_SEGMENT_CHARS):
+    if len(paragraph) <= max_chars:
+        return [paragraph] if paragraph.strip() else []
+
+    chunks = []
+    current = ''
+    for sentence in SENTENCE_BOUNDARY_PATTERN.split(paragraph):
+        if not sentence:
+            continue
+        for piece in _split_hard(sentence, max_chars):
+            if current and len(current) + 1 + len(piece) > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# Function to split extracted document text into size-bounded segments
+def segment_text(text, max_chars=DEFAULT_MAX_SEGMENT_CHARS):
+    """
+    Splits `text` at line breaks (paragraphs, slides and pages are separated by
+    newlines in the extracted text) and long paragraphs at sentence boundaries.
+    Returns the number of paragraphs and a list of (paragraph index, chunk).
+    """
+    paragraphs = text.split('\n')
+    segments = []
+    for index, paragraph in enumerate(paragraphs):
+        for chunk in split_paragraph(paragraph, max_chars):
+            segments.append((index, chunk))
+    return len(paragraphs), segments
+
+
+# Function to put translated segments back together in document order
+def reassemble(paragraph_count, segments, translations):
+    paragraphs = [[] for _ in range(paragraph_count)]
+    for (index, _), translated_text in zip(segments, translations):
+        paragraphs[index].append(translated_text)
+    return '\n'.join(' '.join(parts) for parts in paragraphs)
+
+
+# Function to translate a long text segment by segment, keeping its paragraph structure
+def translate_long_text(text, translate_texts, max_chars=DEFAULT_MAX_SEGMENT_CHARS):
+    """
+    `translate_texts` takes a list of segments and returns their translations
+    in order; it is expected to batch and parallelize the API calls.
+    """
+    paragraph_count, segments = segment_text(text, max_chars)
+    translations = translate_texts([chunk for _, chunk in segments]) if segments else []
+    return reassemble(paragraph_count, segments, translations)
@@ -0,0 +1,229 @@
+"""
+Headless batch translation of xlsx/csv/docx/pdf/pptx files.
+
+Usage:
+    python translate_cli.py exports/ --output-dir translated/ --source-language de
+    python translate_cli.py report.xlsx --backend v3-llm --source-language fr
+    python translate_cli.py verbatims.xlsx --backend local --detect-locally
+    python translate_cli.py drop/ regional.zip --archive translated.zip --source-language de
+    python translate_cli.py verbatims.xlsx --target-language de --target-language es --target-language fr
+    python translate_cli.py january.xlsx --previous-input december.xlsx --previous-output translated_december.xlsx
+    python translate_cli.py exports/ --output-dir translated/ --source-language de --retry-failed
+    python translate_cli.py drop/ --archive translated.zip --source-language de --retry-failed
+"""
+import argparse
+import io
+import logging
+import os
+import sys
+
+from translation_engine import (
+    BACKEND_MODELS, BACKEND_V2, SUPPORTED_EXTENSIONS, get_backend, job_settings, retry_failed_file, translate_file,
+)
+from batch_upload import batch_summary, expand_inputs, inputs_hash, retry_failed_archive, translate_inputs
+from checkpoint import DEFAULT_CHECKPOINT_DIR, open_checkpoint
+from dispatcher import DEFAULT_MAX_WORKERS
+from failure_log import FailureLog, failure_log_path
+from metrics import get_metrics
+from translation_memory import load_translation_memory
+from postprocessing import ALL_STEPS, steps_for
+
+logger = logging.getLogger('translate_cli')
+
+
+# Function to expand the given files and directories into the files to translate
+def collect_input_files(paths, extensions=SUPPORTED_EXTENSIONS):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in sorted(names):
+                    if name.endswith(extensions) and not name.startswith(('translated_', '~$')):
+                        files.append(os.path.join(root, name))
+        else:
+            files.append(path)
+    return files
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Translate xlsx/csv/docx/pdf/pptx files without the Streamlit UI.")
+    parser.add_argument('inputs', nargs='+', help="Files or directories to translate")
+    parser.add_argument('--output-dir', help="Directory for the translated files (default: next to each input)")
+    parser.add_argument('--archive',
+                        help="Translate all inputs, including .zip archives, as one job with cross-file dedup and "
+                             "batching, and write the results into this ZIP file")
+    parser.add_argument('--source-language', help="Source language code, e.g. 'de' (default: auto-detect; required for v3-llm and local)")
+    parser.add_argument('--target-language', action='append',
+                        help="Target language code (default: en); repeat it to add a column per language to "
+                             "spreadsheets in one pass")
+    parser.add_argument('--backend', choices=sorted(BACKEND_MODELS), default=BACKEND_V2, help="Translation backend: Google v2, v3 NMT, v3 Translation LLM or a local CPU model (default: v2)")
+    parser.add_argument('--include-column', action='append', default=[], help="Column to always translate (repeatable)")
+    parser.add_argument('--exclude-column', action='append', default=[], help="Column to never translate (repeatable)")
+    parser.add_argument('--detect-locally', action='store_true',
+                        help="Identify each cell's language offline, skip cells already in the target language and "
+                             "use --source-language only as the fallback")
+    parser.add_argument('--normalize', action='store_true',
+                        help="Drop usernames, links, extra whitespace and trailing emoji before sending texts, "
+                             "to save billed characters")
+    parser.add_argument('--remove-special-characters', action='store_true', help="Strip non-alphanumeric characters from translations")
+    parser.add_argument('--skip-post-processing', action='append', default=[], choices=ALL_STEPS,
+                        help="Post-processing step to leave out (repeatable)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_MAX_WORKERS, help="Concurrent API requests")
+    parser.add_argument('--checkpoint-dir', default=DEFAULT_CHECKPOINT_DIR, help="Where unfinished jobs keep their progress")
+    parser.add_argument('--metrics-json', help="Write timing, API usage and cost metrics of the run to this JSON file")
+    parser.add_argument('--metrics-prometheus', help="Write the metrics of the run in the Prometheus text format")
+    parser.add_argument('--previous-output',
+                        help="Translated workbook of an earlier run; texts it already translated are reused instead "
+                             "of being sent again")
+    parser.add_argument('--previous-input',
+                        help="Input workbook of that earlier run, to align it with --previous-output cell by cell")
+    parser.add_argument('--restart', action='store_true', help="Ignore existing checkpoints and translate from scratch")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="Only translate again the cells recorded in the failure log of each earlier output")
+    args = parser.parse_args(argv)
+    args.target_language = args.target_language or ['en']
+    if args.archive and len(args.target_language) > 1:
+        parser.error("--archive takes a single --target-language")
+    if args.previous_input and not args.previous_output:
+        parser.error("--previous-input needs --previous-output")
+    if args.retry_failed and (len(args.target_language) > 1 or args.previous_output):
+        parser.error("--retry-failed cannot be combined with --previous-output or several --target-language")
+    if get_backend(args.backend).requires_source_language and not (args.source_language or args.detect_locally):
+        parser.error(f"--source-language or --detect-locally is required for the {args.backend} backend")
+    return args
+
+
+# Function to translate all inputs through one shared queue into a single archive
+def translate_archive(args):
+    inputs = expand_inputs(collect_input_files(args.inputs, SUPPORTED_EXTENSIONS + ('.zip',)))
+    settings = job_settings(
+        args.source_language, args.target_language[0], args.backend, args.include_column, args.exclude_column,
+        args.remove_special_characters, args.detect_locally,
+    )
+    checkpoint = open_checkpoint(inputs_hash(inputs), settings, args.checkpoint_dir, not args.restart)
+    memory = None
+    if args.previous_output:
+        memory = load_translation_memory(args.previous_output, args.previous_input, args.target_language[0])
+    failures = FailureLog()
+    counts = translate_inputs(
+        inputs,
+        args.archive,
+        source_language=args.source_language,
+        target_language=args.target_language[0],
+        backend=args.backend,
+        include=args.include_column,
+        exclude=args.exclude_column,
+        remove_special=args.remove_special_characters,
+        post_processing=steps_for(args.remove_special_characters, args.skip_post_processing),
+        detect_locally=args.detect_locally,
+        normalize=args.normalize,
+        max_workers=args.workers,
+        checkpoint=checkpoint,
+        memory=memory,
+        failures=failures,
+    )
+    checkpoint.remove()
+    failures.save(failure_log_path(args.archive))
+    logger.info("Translated %s -> %s", batch_summary(counts), args.archive)
+    if failures:
+        logger.warning("%s: %s, see %s", args.archive, failures.summary(), failure_log_path(args.archive))
+
+
+# Function to translate again only the failed cells recorded next to an archive written by translate_archive
+def retry_archive(args):
+    log_path = failure_log_path(args.archive)
+    failures = FailureLog.load(log_path)
+    if not failures:
+        logger.info("%s: no failed cells to retry", args.archive)
+        return
+    with open(args.archive, 'rb') as archive_file:
+        source = io.BytesIO(archive_file.read())
+    remaining = retry_failed_archive(
+        source,
+        args.archive,
+        failures,
+        source_language=args.source_language,
+        backend=args.backend,
+        remove_special=args.remove_special_characters,
+        post_processing=steps_for(args.remove_special_characters, args.skip_post_processing),
+        detect_locally=args.detect_locally,
+        normalize=args.normalize,
+        max_workers=args.workers,
+    )
+    remaining.save(log_path)
+    logger.info("%s: retried %d failed cells, %s", args.archive, len(failures), remaining.summary())
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    failed = 0
+    if args.archive:
+        try:
+            if args.retry_failed:
+                retry_archive(args)
+            else:
+                translate_archive(args)
+        except Exception:
+            logger.exception("Failed to translate the archive %s", args.archive)
+            failed += 1
+    elif args.retry_failed:
+        for path in collect_input_files(args.inputs):
+            try:
+                retry_failed_file(
+                    path,
+                    output_dir=args.output_dir,
+                    source_language=args.source_language,
+                    backend=args.backend,
+                    remove_special=args.remove_special_characters,
+                    post_processing=steps_for(args.remove_special_characters, args.skip_post_processing),
+                    detect_locally=args.detect_locally,
+                    normalize=args.normalize,
+                    max_workers=args.workers,
+                )
+            except Exception:
+                logger.exception("Failed to retry the failed cells of %s", path)
+                failed += 1
+    else:
+        for path in collect_input_files(args.inputs):
+            try:
+                translate_file(
+                    path,
+                    output_dir=args.output_dir,
+                    source_language=args.source_language,
+                    target_language=args.target_language,
+                    backend=args.backend,
+                    include=args.include_column,
+                    exclude=args.exclude_column,
+                    remove_special=args.remove_special_characters,
+                    post_processing=steps_for(args.remove_special_characters, args.skip_post_processing),
+                    detect_locally=args.detect_locally,
+                    normalize=args.normalize,
+                    max_workers=args.workers,
+                    checkpoint_dir=args.checkpoint_dir,
+                    resume=not args.restart,
+                    previous_output=args.previous_output,
+                    previous_input=args.previous_input,
+                )
+            except Exception:
+                logger.exception("Failed to translate %s", path)
+                failed += 1
+
+    metrics = get_metrics()
+    logger.info(
+        "%d API requests, %d characters sent, %d retries, estimated cost $%.2f",
+        metrics.counter_total('api_requests'), metrics.counter_total('api_characters'),
+        metrics.counter_total('api_retries'), metrics.counter_total('estimated_cost_usd'),
+    )
+    if args.metrics_json:
+        with open(args.metrics_json, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(metrics.to_json())
+    if args.metrics_prometheus:
+        with open(args.metrics_prometheus, 'w', encoding='utf-8') as metrics_file:
+            metrics_file.write(metrics.to_prometheus())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
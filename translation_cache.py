@@ -0,0 +1,209 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+from metrics import get_metrics
+
+# Location and size of the on-disk translation memory
+DEFAULT_CACHE_PATH = os.environ.get(
+    'TRANSLATION_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'translation', 'translations.sqlite3'),
+)
+DEFAULT_MAX_ENTRIES = 500000
+
+# SQLite limits the number of bound parameters per statement
+_QUERY_CHUNK_SIZE = 500
+
+
+# Function to build the cache key for a source text
+def normalize_text(text):
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text)).strip()
+
+
+class TranslationCache:
+    """
+    SQLite-backed translation memory keyed by (normalized source text,
+    source language, target language, model). Least recently used entries
+    are evicted once the cache holds more than `max_entries` translations.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS translations (
+                source_text TEXT NOT NULL,
+                source_language TEXT NOT NULL,
+                target_language TEXT NOT NULL,
+                model TEXT NOT NULL,
+                translated_text TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, source_language, target_language, source_text)
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_translations_last_used ON translations (last_used)")
+        self._conn.commit()
+
+    def get_many(self, texts, source_language, target_language, model):
+        """
+        Looks up `texts` and returns a dict mapping each text that was found to
+        its cached translation. Updates the hit/miss counters and the LRU order.
+        """
+        normalized = {text: normalize_text(text) for text in texts if text}
+        key_list = list(set(normalized.values()))
+        found = {}
+        with self._lock:
+            for start in range(0, len(key_list), _QUERY_CHUNK_SIZE):
+                chunk = key_list[start:start + _QUERY_CHUNK_SIZE]
+                rows = self._conn.execute(
+                    f"""
+                    SELECT source_text, translated_text FROM translations
+                    WHERE model = ? AND source_language = ? AND target_language = ?
+                    AND source_text IN ({','.join('?' * len(chunk))})
+                    """,
+                    [model, source_language or 'auto', target_language, *chunk],
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    """
+                    UPDATE translations SET last_used = ?
+                    WHERE model = ? AND source_language = ? AND target_language = ? AND source_text = ?
+                    """,
+                    [(now, model, source_language or 'auto', target_language, key) for key in found],
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(key_list) - len(found)
+
+        return {text: found[key] for text, key in normalized.items() if key in found}
+
+    def put_many(self, pairs, source_language, target_language, model):
+        """
+        Stores (source text, translated text) pairs and evicts the least
+        recently used entries if the cache grew past `max_entries`.
+        """
+        now = time.time()
+        rows = [
+            (normalize_text(text), source_language or 'auto', target_language, model, translated_text, now)
+            for text, translated_text in pairs
+            if text
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany(
+                """
+                INSERT OR REPLACE INTO translations
+                (source_text, source_language, target_language, model, translated_text, last_used)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                """
+                DELETE FROM translations WHERE rowid IN (
+                    SELECT rowid FROM translations ORDER BY last_used LIMIT ?
+                )
+                """,
+                (excess,),
+            )
+
+    def invalidate(self, model=None):
+        """
+        Removes every cached translation produced by `model`, or the whole
+        cache when no model is given. Returns the number of removed entries.
+        """
+        with self._lock:
+            if model is None:
+                cursor = self._conn.execute("DELETE FROM translations")
+            else:
+                cursor = self._conn.execute("DELETE FROM translations WHERE model = ?", (model,))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self):
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM translations").fetchone()
+        return {'entries': entries, 'hits': self.hits, 'misses': self.misses}
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+# Function to get the process-wide cache for a path, so counters survive Streamlit reruns
+def get_translation_cache(path=DEFAULT_CACHE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = TranslationCache(path, max_entries)
+        return _caches[path]
+
+
+# Function to translate texts, sending only cache misses to `translate_texts`
+def translate_with_cache(texts, translate_texts, cache, source_language, target_language, model):
+    """
+    Answers `texts` from `cache` where possible and passes each distinct miss
+    once to `translate_texts`, which must return (translations, errors) like
+    batching.translate_in_batches. Successful translations are written back
+    to the cache. Returns (translations, errors) in the order of `texts`.
+    """
+    cached = cache.get_many(texts, source_language, target_language, model)
+
+    misses = []
+    miss_positions = {}
+    for text in texts:
+        if text and text not in cached:
+            key = normalize_text(text)
+            if key not in miss_positions:
+                miss_positions[key] = len(misses)
+                misses.append(text)
+
+    metrics = get_metrics()
+    metrics.increment('cache_hits', len(cached), model=model)
+    metrics.increment('cache_misses', len(misses), model=model)
+
+    miss_translations, miss_errors = translate_texts(misses) if misses else ([], {})
+    cache.put_many(
+        [(text, translated_text) for i, (text, translated_text) in enumerate(zip(misses, miss_translations)) if i not in miss_errors],
+        source_language,
+        target_language,
+        model,
+    )
+
+    translations = []
+    errors = {}
+    for i, text in enumerate(texts):
+        if not text:
+            translations.append(text)
+        elif text in cached:
+            translations.append(cached[text])
+        else:
+            position = miss_positions[normalize_text(text)]
+            translations.append(miss_translations[position])
+            if position in miss_errors:
+                errors[i] = miss_errors[position]
+    return translations, errors
@@ -0,0 +1,712 @@
+"""
+Importable translation engine shared by the Streamlit apps and the batch CLI.
+
+Importing this module has no side effects: the Google Cloud clients and local
+models of the backends (see backends.py) are created on first use, so a run
+whose work is fully answered by the translation cache never touches the
+network.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from backends import (
+    BACKEND_LOCAL, BACKEND_MODELS, BACKEND_V2, BACKEND_V3_LLM, BACKEND_V3_NMT, PROJECT_ID, REGION,
+    get_backend, get_translate_client, get_translate_client_v3, set_clients,
+)
+from batching import translate_in_batches
+from cell_filters import select_text_columns
+from checkpoint import DEFAULT_CHECKPOINT_DIR, file_hash, open_checkpoint
+from csv_streaming import fill_csv_cells, read_csv, translate_csv_streaming
+from dispatcher import DEFAULT_MAX_WORKERS
+from document_extraction import DOCUMENT_EXTENSIONS, iter_document_segments
+from excel_streaming import fill_workbook_cells, translate_workbook_streaming
+from failure_log import FailureLog, failure_log_path
+from language_id import group_by_language
+from metrics import get_metrics
+from normalization import NormalizationReport, normalize_texts, restore_texts
+from postprocessing import post_process_texts, steps_for
+from rate_limiter import thread_wait_seconds
+from segmenter import split_paragraph, translate_long_text
+from translation_cache import get_translation_cache, translate_with_cache
+from translation_memory import load_translation_memory
+from translation_plan import build_translation_plan, apply_translation_plan
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.csv') + DOCUMENT_EXTENSIONS
+
+# Distinct values translated between two progress reports of a sheet translation
+PROGRESS_SLICE_SIZE = 2000
+
+# Seconds between two cancel checks while several target languages are translated
+CANCEL_POLL_SECONDS = 1
+
+# Layouts of a workbook translated into several target languages
+LAYOUT_COLUMNS = 'columns'
+LAYOUT_SHEETS = 'sheets'
+
+# Longest sheet name Excel accepts
+MAX_SHEET_NAME_LENGTH = 31
+
+# Characters of document text collected before a window of segments is sent for translation
+DOCUMENT_WINDOW_CHARS = 50000
+
+
+# Function to wrap a batch call so every API request is counted and timed, without its wait in the rate limiter
+def _instrumented_request(model, translate_batch):
+    def request(batch):
+        waited = thread_wait_seconds()
+        start = time.perf_counter()
+
+        def seconds():
+            return time.perf_counter() - start - (thread_wait_seconds() - waited)
+
+        try:
+            translations = translate_batch(batch)
+        except Exception:
+            get_metrics().record_request(model, batch, seconds(), failed=True)
+            raise
+        get_metrics().record_request(model, batch, seconds())
+        return translations
+    return request
+
+
+# Function to send the cache misses of one call to the selected backend
+def _translate_misses(texts, source_language, target_language, backend, project_id, region, max_workers, job,
+                      on_batch_done=None):
+    translation_backend = get_backend(backend, project_id, region)
+    return translate_in_batches(
+        texts,
+        _instrumented_request(
+            translation_backend.model,
+            lambda batch: translation_backend.translate_batch(batch, source_language, target_language, job),
+        ),
+        translation_backend.max_segments,
+        translation_backend.max_chars,
+        max_workers=min(max_workers, translation_backend.max_workers),
+        on_batch_done=on_batch_done,
+    )
+
+
+# Function to answer misses from a job checkpoint and record every finished batch in it
+def _translate_misses_with_checkpoint(texts, checkpoint, *args):
+    if checkpoint is None:
+        return _translate_misses(texts, *args)
+
+    done = checkpoint.get_many(texts)
+    remaining = [text for text in texts if text not in done]
+    remaining_translations, remaining_errors = _translate_misses(remaining, *args, on_batch_done=checkpoint.record)
+    positions = {text: i for i, text in enumerate(remaining)}
+
+    translations = []
+    errors = {}
+    for i, text in enumerate(texts):
+        if text in done:
+            translations.append(done[text])
+        else:
+            translations.append(remaining_translations[positions[text]])
+            if positions[text] in remaining_errors:
+                errors[i] = remaining_errors[positions[text]]
+    return translations, errors
+
+
+# Function to translate a list of texts with caching, batching, concurrency and post-processing
+def translate_texts(texts, source_language=None, target_language='en', backend=BACKEND_V2,
+                    remove_special=False, cache=None, checkpoint=None, project_id=PROJECT_ID, region=REGION,
+                    max_workers=DEFAULT_MAX_WORKERS, detect_locally=False, post_processing=None,
+                    normalize=False, normalization_report=None, job=None, memory=None):
+    """
+    Returns (translations, errors) in the order of `texts`. Failed cells are
+    None in translations and map to their exception in errors. With a
+    `checkpoint`, texts it already holds are not sent again and every batch
+    is recorded in it as soon as it completes. With `detect_locally`, each
+    text's language is identified offline first: texts already in the target
+    language are only post-processed, the rest are translated in one group per
+    detected language, with `source_language` as the fallback for texts whose
+    language is unclear. `post_processing` lists the post-processing steps to
+    run (default: the standard steps, plus special-character removal with
+    `remove_special`). With `normalize`, usernames, hyperlinks, extra
+    whitespace and trailing emoji are taken out before the texts are sent, and
+    the characters this saves are added to `normalization_report`. Backends
+    that need a source language raise ValueError without one; with
+    `detect_locally`, only the texts whose language stays unclear fail.
+    Requests are rate limited per quota and shared fairly between jobs; calls
+    with the same `job` count as one job (default: each call is its own).
+    Texts a `memory` (see translation_memory.py) knows are answered from it
+    as they are, and kept out of the cache.
+    """
+    if job is None:
+        job = object()
+
+    if memory is not None:
+        known = memory.get_many(texts)
+        if known:
+            rest = [i for i, text in enumerate(texts) if text not in known]
+            rest_translations, rest_errors = translate_texts(
+                [texts[i] for i in rest], source_language, target_language, backend, remove_special, cache,
+                checkpoint, project_id, region, max_workers, detect_locally, post_processing, normalize,
+                normalization_report, job,
+            )
+            translations = [known.get(text) for text in texts]
+            errors = {}
+            for j, i in enumerate(rest):
+                translations[i] = rest_translations[j]
+                if j in rest_errors:
+                    errors[i] = rest_errors[j]
+            return translations, errors
+    requires_source_language = get_backend(backend, project_id, region).requires_source_language
+    if post_processing is None:
+        post_processing = steps_for(remove_special)
+
+    if detect_locally:
+        with get_metrics().timed('language_id'):
+            groups, already_in_target = group_by_language(texts, target_language, source_language)
+        logger.info(
+            "Local language ID: %d texts already in %s, groups %s",
+            len(already_in_target), target_language,
+            {language or 'auto': len(positions) for language, positions in groups.items()},
+        )
+        translations = list(texts)
+        errors = {}
+        untranslated = post_process_texts([texts[i] for i in already_in_target], post_processing)
+        for i, translated_text in zip(already_in_target, untranslated):
+            translations[i] = translated_text
+        for language, positions in groups.items():
+            if language is None and requires_source_language:
+                for i in positions:
+                    translations[i] = None
+                    errors[i] = ValueError(f"Could not identify the source language for the {backend} backend.")
+                continue
+            group_translations, group_errors = translate_texts(
+                [texts[i] for i in positions], language, target_language, backend, remove_special,
+                cache, checkpoint, project_id, region, max_workers, post_processing=post_processing,
+                normalize=normalize, normalization_report=normalization_report, job=job,
+            )
+            for j, i in enumerate(positions):
+                translations[i] = group_translations[j]
+                if j in group_errors:
+                    errors[i] = group_errors[j]
+        return translations, errors
+
+    if requires_source_language and not source_language:
+        raise ValueError(f"Source language must be explicitly selected for the {backend} backend.")
+
+    suffixes = None
+    if normalize:
+        with get_metrics().timed('normalize'):
+            texts, suffixes = normalize_texts(texts, post_processing, normalization_report)
+
+    with get_metrics().timed('translate', backend=backend):
+        translations, errors = translate_with_cache(
+            texts,
+            lambda misses: _translate_misses_with_checkpoint(
+                misses, checkpoint, source_language, target_language, backend, project_id, region, max_workers, job
+            ),
+            cache or get_translation_cache(),
+            source_language,
+            target_language,
+            BACKEND_MODELS[backend],
+        )
+    if suffixes is not None:
+        translations = restore_texts(translations, suffixes)
+    translations = post_process_texts(
+        [None if i in errors else translated_text for i, translated_text in enumerate(translations)], post_processing
+    )
+    return translations, errors
+
+
+# Function to put error messages into the cells that failed
+def with_error_strings(translations, errors, error_prefix='Error'):
+    return [
+        f"{error_prefix}: {str(errors[i])}" if i in errors else translated_text
+        for i, translated_text in enumerate(translations)
+    ]
+
+
+# Function to fill in the cells that failed: left empty when a failure log records them, else an error message
+def _cell_values(translations, errors, error_prefix, failures):
+    return list(translations) if failures is not None else with_error_strings(translations, errors, error_prefix)
+
+
+# Function to translate the free-text cells of a set of sheets in place
+def translate_sheets(sheets, source_language=None, target_language='en', backend=BACKEND_V2,
+                     include=(), exclude=(), error_prefix='Error', on_progress=None,
+                     progress_slice=PROGRESS_SLICE_SIZE, failures=None, row_offset=0, **options):
+    """
+    Translates every distinct text value across `sheets` (sheet name ->
+    DataFrame) once and broadcasts the results back. Returns the plan. With
+    `on_progress`, the values are translated `progress_slice` at a time, the
+    sheets are updated after every slice and `on_progress(done, total)` is
+    called; it may raise to stop, leaving the remaining cells untranslated.
+    With a `failures` log (see failure_log.py), failed cells are left empty
+    and recorded there, their rows shifted by `row_offset`; otherwise they
+    hold the error message.
+    """
+    plan = build_translation_plan(sheets, include=include, exclude=exclude)
+    uniques = list(plan.uniques)
+    if on_progress is None:
+        translations, errors = translate_texts(uniques, source_language, target_language, backend, **options)
+        apply_translation_plan(plan, sheets, _cell_values(translations, errors, error_prefix, failures))
+        if failures is not None:
+            failures.add_plan_failures(plan, errors, target_language, row_offset=row_offset)
+        return plan
+
+    translated = list(uniques)
+    all_errors = {}
+    on_progress(0, len(uniques))
+    for start in range(0, len(uniques), progress_slice):
+        stop = min(start + progress_slice, len(uniques))
+        translations, errors = translate_texts(
+            uniques[start:stop], source_language, target_language, backend, **options
+        )
+        translated[start:stop] = _cell_values(translations, errors, error_prefix, failures)
+        all_errors.update((start + i, error) for i, error in errors.items())
+        apply_translation_plan(plan, sheets, translated)
+        on_progress(stop, len(uniques))
+    if failures is not None:
+        failures.add_plan_failures(plan, all_errors, target_language, row_offset=row_offset)
+    return plan
+
+
+# Function to translate a list of texts into several target languages concurrently
+def translate_texts_multi(texts, source_language=None, target_languages=('en',), backend=BACKEND_V2,
+                          checkpoints=None, on_target_done=None, memories=None, check_cancelled=None,
+                          progress_slice=PROGRESS_SLICE_SIZE, **options):
+    """
+    Returns {target language: (translations, errors)}. Every target is
+    translated from the same texts at the same time; all of them count as one
+    job for the rate limiter. `checkpoints` optionally maps target languages
+    to their job checkpoints and `memories` to translation memories, and
+    `on_target_done(target)` is called as each target finishes. Either of it
+    and `check_cancelled()`, called every CANCEL_POLL_SECONDS, may raise to
+    stop: the targets still running then stop after their current slice of
+    `progress_slice` texts.
+    """
+    options.setdefault('job', object())
+    checkpoints = checkpoints or {}
+    memories = memories or {}
+    stop = threading.Event()
+
+    # Function to translate the texts into one target a slice at a time, so a stop takes effect between slices
+    def translate_target(target):
+        translations = []
+        errors = {}
+        for start in range(0, len(texts), progress_slice):
+            if stop.is_set():
+                return None
+            slice_translations, slice_errors = translate_texts(
+                texts[start:start + progress_slice], source_language, target, backend,
+                checkpoint=checkpoints.get(target), memory=memories.get(target), **options
+            )
+            translations.extend(slice_translations)
+            errors.update((start + i, error) for i, error in slice_errors.items())
+        return translations, errors
+
+    results = {}
+    executor = ThreadPoolExecutor(max_workers=max(len(target_languages), 1))
+    try:
+        futures = {executor.submit(translate_target, target): target for target in target_languages}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=CANCEL_POLL_SECONDS, return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures[future]] = future.result()
+                if on_target_done is not None:
+                    on_target_done(futures[future])
+            if check_cancelled is not None:
+                check_cancelled()
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        # Do not wait for targets still running after a stop; they end after their current slice
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {target: results[target] for target in target_languages}
+
+
+# Function to name the copies of the sheets in every target language, unique within Excel's sheet name limit
+def language_sheet_names(sheet_names, target_languages):
+    """
+    Returns {(sheet name, target language): copy name}. A name cut short that
+    is already taken, by a sheet or another copy, gets a number after the
+    language; Excel compares sheet names without case.
+    """
+    taken = {str(sheet_name).lower() for sheet_name in sheet_names}
+    names = {}
+    for target in target_languages:
+        for sheet_name in sheet_names:
+            number = 1
+            suffix = f' ({target})'
+            name = f'{str(sheet_name)[:MAX_SHEET_NAME_LENGTH - len(suffix)]}{suffix}'
+            while name.lower() in taken:
+                number += 1
+                suffix = f' ({target}) {number}'
+                name = f'{str(sheet_name)[:MAX_SHEET_NAME_LENGTH - len(suffix)]}{suffix}'
+            taken.add(name.lower())
+            names[(sheet_name, target)] = name
+    return names
+
+
+# Function to translate the free-text cells of a set of sheets into several target languages in one pass
+def translate_sheets_multi(sheets, source_language=None, target_languages=('en',), backend=BACKEND_V2,
+                           include=(), exclude=(), error_prefix='Error', layout=LAYOUT_COLUMNS,
+                           language_columns=None, failures=None, row_offset=0, **options):
+    """
+    Plans the distinct values of `sheets` once and translates them into every
+    target language concurrently. With the columns layout, a column
+    '<column> (<language>)' is inserted after every free-text column of the
+    sheets in place; `language_columns` (sheet name -> columns) fixes these
+    columns, e.g. so every chunk of a streamed sheet gets the same ones. With
+    the sheets layout, a translated copy '<sheet> (<language>)' of every sheet
+    follows the originals, named by language_sheet_names. Returns the sheets to write and the plan. Failed
+    cells are handled as in translate_sheets, at their place in the output.
+    """
+    plan = build_translation_plan(sheets, columns=language_columns, include=include, exclude=exclude)
+    results = translate_texts_multi(list(plan.uniques), source_language, target_languages, backend, **options)
+    translated = {
+        target: np.asarray(_cell_values(translations, errors, error_prefix, failures), dtype=object)
+        for target, (translations, errors) in results.items()
+    }
+    copy_names = language_sheet_names(list(sheets), target_languages) if layout == LAYOUT_SHEETS else {}
+    if failures is not None:
+        for target, (_, errors) in results.items():
+            if layout == LAYOUT_SHEETS:
+                failures.add_plan_failures(
+                    plan, errors, target, sheet_name_for=lambda sheet_name: copy_names[(sheet_name, target)],
+                    row_offset=row_offset,
+                )
+            else:
+                failures.add_plan_failures(
+                    plan, errors, target, column_name_for=lambda column: f'{column} ({target})', row_offset=row_offset,
+                )
+
+    if layout == LAYOUT_SHEETS:
+        output = dict(sheets)
+        for target in target_languages:
+            target_sheets = {sheet_name: df.copy() for sheet_name, df in sheets.items()}
+            apply_translation_plan(plan, target_sheets, translated[target])
+            for sheet_name, df in target_sheets.items():
+                output[copy_names[(sheet_name, target)]] = df
+        return output, plan
+
+    slots = {(sheet_name, column): (mask, start, stop) for sheet_name, column, mask, start, stop in plan.slots}
+    for sheet_name, df in sheets.items():
+        if language_columns is not None:
+            columns = language_columns.get(sheet_name, [])
+        else:
+            columns = [column for column, _ in select_text_columns(df, include, exclude)]
+        for column in columns:
+            original = df[column].to_numpy(dtype=object)
+            location = df.columns.get_loc(column) + 1
+            for i, target in enumerate(target_languages):
+                values = original.copy()
+                if (sheet_name, column) in slots:
+                    mask, start, stop = slots[(sheet_name, column)]
+                    values[mask] = translated[target][plan.codes[start:stop]]
+                df.insert(location + i, f'{column} ({target})', values, allow_duplicates=True)
+    return sheets, plan
+
+
+# Function to translate the texts of failed cells again, in batches per target language
+def _retranslate_failures(failures, source_language, backend, **options):
+    """
+    Returns a list of (failure, translation) for the cells that translate
+    this time and a FailureLog of those that failed again.
+    """
+    filled = []
+    remaining = FailureLog()
+    by_target = {}
+    for failure in failures:
+        by_target.setdefault(failure.target_language, []).append(failure)
+
+    for target, target_failures in by_target.items():
+        texts = list(dict.fromkeys(failure.text for failure in target_failures))
+        translations, errors = translate_texts(texts, source_language, target, backend, **options)
+        positions = {text: i for i, text in enumerate(texts)}
+        for failure in target_failures:
+            i = positions[failure.text]
+            if i in errors:
+                remaining.add(failure._replace(error_class=type(errors[i]).__name__, message=str(errors[i])))
+            else:
+                filled.append((failure, translations[i]))
+    return filled, remaining
+
+
+# Function to translate the failed cells of a set of sheets in memory again
+def retry_failed_cells(sheets, failures, source_language=None, backend=BACKEND_V2, **options):
+    """
+    Fills in the cells recorded in `failures` that translate this time and
+    returns a FailureLog of those that failed again.
+    """
+    filled, remaining = _retranslate_failures(failures, source_language, backend, **options)
+    for failure, translation in filled:
+        df = sheets[failure.sheet]
+        column = [str(name) for name in df.columns].index(str(failure.column))
+        if df.dtypes.iloc[column] != object:
+            # A column of failed cells only may hold empty floats
+            df[df.columns[column]] = df.iloc[:, column].astype(object)
+        df.iloc[failure.row, column] = translation
+    return remaining
+
+
+# Function to write the translations of retried cells into a written output, leaving every other cell as it is
+def _fill_output(source, destination, filled, csv=False):
+    with get_metrics().timed('write', file_type='csv' if csv else 'xlsx'):
+        if csv:
+            fill_csv_cells(source, destination, {(failure.column, failure.row): text for failure, text in filled})
+        else:
+            fill_workbook_cells(
+                source, destination, {(failure.sheet, failure.column, failure.row): text for failure, text in filled}
+            )
+
+
+# Function to write sheets to a path or binary file object, as CSV (a single sheet) or as a workbook
+def write_sheets(sheets, destination, csv=False):
+    with get_metrics().timed('write', file_type='csv' if csv else 'xlsx'):
+        if csv:
+            next(iter(sheets.values())).to_csv(destination, index=False, encoding='utf-8')
+        else:
+            with pd.ExcelWriter(destination, engine='openpyxl') as writer:
+                for sheet_name, data in sheets.items():
+                    data.to_excel(writer, index=False, sheet_name=sheet_name)
+
+
+# Function to translate again the failed cells of a spreadsheet output held in memory
+def retry_failed_output(file_name, content, failures, source_language=None, backend=BACKEND_V2, **options):
+    """
+    `content` is the xlsx or csv output `file_name` as bytes. Returns the
+    output as bytes with the cells that translate this time filled in, and a
+    FailureLog of the cells that failed again.
+    """
+    filled, remaining = _retranslate_failures(failures, source_language, backend, **options)
+    output_buffer = io.BytesIO()
+    _fill_output(io.BytesIO(content), output_buffer, filled, csv=file_name.endswith('.csv'))
+    return output_buffer.getvalue(), remaining
+
+
+# Function to translate a long document text in parallel, sentence-bounded segments
+def translate_document(text, source_language=None, target_language='en', backend=BACKEND_V2,
+                       error_prefix='Error', **options):
+    def translate_segments(segments):
+        translations, errors = translate_texts(segments, source_language, target_language, backend, **options)
+        return with_error_strings(translations, errors, error_prefix)
+
+    return translate_long_text(text, translate_segments)
+
+
+# Function to translate a stream of document segments window by window, yielding them in order as they are done
+def translate_document_segments(segments, source_language=None, target_language='en', backend=BACKEND_V2,
+                                error_prefix='Error', window_chars=DOCUMENT_WINDOW_CHARS, **options):
+    """
+    Consumes `segments` (see document_extraction.py) lazily and yields
+    (segment, translated text) pairs, so the first pages are translated while
+    later ones are still being extracted. Long lines are split at sentence
+    boundaries for the API and joined again.
+    """
+    def translate_window(window):
+        chunks = [split_paragraph(segment.text) for segment in window]
+        texts = [chunk for segment_chunks in chunks for chunk in segment_chunks]
+        translations, errors = (
+            translate_texts(texts, source_language, target_language, backend, **options) if texts else ([], {})
+        )
+        translations = iter(with_error_strings(translations, errors, error_prefix))
+        for segment, segment_chunks in zip(window, chunks):
+            yield segment, ' '.join(next(translations) for _ in segment_chunks)
+
+    window = []
+    window_size = 0
+    for segment in segments:
+        window.append(segment)
+        window_size += len(segment.text)
+        if window_size >= window_chars:
+            yield from translate_window(window)
+            window = []
+            window_size = 0
+    if window:
+        yield from translate_window(window)
+
+
+# Function to extract text from various file types
+def extract_text_from_file(file):
+    """
+    Accepts a path or a file-like object with a `name`. Returns a dict of
+    DataFrames for spreadsheets, a string for documents and None otherwise.
+    """
+    segments = iter_document_segments(file)
+    if segments is not None:
+        # Pages and slides are parsed and timed unit by unit as the segments are consumed
+        return '\n'.join(segment.text for segment in segments)
+
+    name = file if isinstance(file, str) else file.name
+    with get_metrics().timed('extract', file_type=os.path.splitext(name)[1].lstrip('.').lower()):
+        if name.endswith('.xlsx'):
+            return pd.read_excel(file, sheet_name=None)  # Read all sheets into a dict
+        elif name.endswith('.csv'):
+            return {'Sheet1': read_csv(file)}
+        else:
+            return None
+
+
+# Function to describe the settings that make two translation jobs interchangeable
+def job_settings(source_language, target_language, backend, include=(), exclude=(), remove_special=False,
+                 detect_locally=False):
+    return {
+        'source_language': source_language,
+        'target_language': target_language,
+        'backend': backend,
+        'model': BACKEND_MODELS[backend],
+        'include': sorted(map(str, include)),
+        'exclude': sorted(map(str, exclude)),
+        'remove_special': remove_special,
+        'detect_locally': detect_locally,
+    }
+
+
+# Function to build the output path for a translated file
+def output_path_for(path, output_dir=None):
+    directory, name = os.path.split(path)
+    stem, extension = os.path.splitext(name)
+    if extension in DOCUMENT_EXTENSIONS:
+        name = f'{stem}.txt'
+    return os.path.join(output_dir or directory, f'translated_{name}')
+
+
+# Function to translate one file on disk unattended and write the result next to it or into `output_dir`
+def translate_file(path, output_dir=None, source_language=None, target_language='en', backend=BACKEND_V2,
+                   include=(), exclude=(), checkpoint_dir=DEFAULT_CHECKPOINT_DIR, resume=True,
+                   previous_output=None, previous_input=None, **options):
+    """
+    Completed batches are checkpointed under `checkpoint_dir`, keyed by the
+    file content and job settings; running the same job again after a crash
+    only sends the texts that were not finished. The checkpoint is removed
+    once the output has been written. With `normalize`, the characters saved
+    are logged when the file is done. `target_language` may be a list: the
+    file is then parsed once and spreadsheets get a column per target
+    language after every free-text column. With `previous_output`, the
+    translated workbook of an earlier run (aligned with `previous_input` if
+    given, see translation_memory.py), texts it already translated are not
+    sent again and how many were reused is logged. Failed spreadsheet cells
+    are left empty and recorded in a failure log next to the output (see
+    failure_log.py), which retry_failed_file works through later; documents
+    keep the error message in place of a failed segment.
+    """
+    target_languages = [target_language] if isinstance(target_language, str) else list(target_language)
+    if len(target_languages) > 1 and not path.endswith(('.xlsx', '.csv')):
+        raise ValueError(f"Several target languages are only supported for spreadsheets: {path}")
+    output_path = output_path_for(path, output_dir)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    input_hash = file_hash(path)
+    checkpoints = {
+        target: open_checkpoint(
+            input_hash,
+            job_settings(
+                source_language, target, backend, include, exclude,
+                options.get('remove_special', False), options.get('detect_locally', False),
+            ),
+            checkpoint_dir,
+            resume,
+        )
+        for target in target_languages
+    }
+    if options.get('normalize'):
+        options.setdefault('normalization_report', NormalizationReport())
+
+    # Translations of the previous run answer the texts that did not change; cell alignment applies to the first target
+    memories = {}
+    if previous_output is not None:
+        for i, target in enumerate(target_languages):
+            memories[target] = load_translation_memory(previous_output, previous_input if i == 0 else None, target)
+
+    # The translated columns of a streamed sheet are fixed by its first chunk
+    language_columns = {}
+    failures = FailureLog()
+    # Data rows of each sheet already translated, to place the failures of later chunks
+    sheet_rows = {}
+
+    # Function to translate one chunk of a sheet in place, or into one new column per target language
+    def translate_sheet_chunk(sheet_name, chunk):
+        row_offset = sheet_rows.get(sheet_name, 0)
+        sheet_rows[sheet_name] = row_offset + len(chunk)
+        if len(target_languages) == 1:
+            plan = translate_sheets(
+                {sheet_name: chunk}, source_language, target_languages[0], backend, include=include,
+                exclude=exclude, failures=failures, row_offset=row_offset,
+                checkpoint=checkpoints[target_languages[0]], memory=memories.get(target_languages[0]), **options
+            )
+        else:
+            if sheet_name not in language_columns:
+                language_columns[sheet_name] = [column for column, _ in select_text_columns(chunk, include, exclude)]
+            _, plan = translate_sheets_multi(
+                {sheet_name: chunk}, source_language, target_languages, backend, include=include, exclude=exclude,
+                language_columns=language_columns, failures=failures, row_offset=row_offset,
+                checkpoints=checkpoints, memories=memories, **options
+            )
+        for memory in memories.values():
+            memory.track(plan.uniques)
+        return chunk
+
+    if path.endswith('.xlsx'):
+        with open(path, 'rb') as source:
+            translate_workbook_streaming(source, output_path, None, translate_sheet_chunk)
+    elif path.endswith('.csv'):
+        translate_csv_streaming(path, output_path, lambda chunk: translate_sheet_chunk('Sheet1', chunk))
+    else:
+        segments = iter_document_segments(path)
+        if segments is None:
+            raise ValueError(f"Unsupported file type: {path}")
+        # Lines are written as soon as their window is translated, in document order
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            translated_segments = translate_document_segments(
+                segments, source_language, target_languages[0], backend,
+                checkpoint=checkpoints[target_languages[0]], **options
+            )
+            for i, (_, translated_text) in enumerate(translated_segments):
+                with get_metrics().timed('write', file_type='txt'):
+                    output_file.write(f'\n{translated_text}' if i else translated_text)
+
+    for checkpoint in checkpoints.values():
+        checkpoint.remove()
+    failures.save(failure_log_path(output_path))
+    logger.info("Translated %s -> %s", path, output_path)
+    if failures:
+        logger.warning("%s: %s, see %s", path, failures.summary(), failure_log_path(output_path))
+    if options.get('normalization_report') is not None:
+        logger.info("%s: %s", path, options['normalization_report'].summary())
+    for target, memory in memories.items():
+        logger.info("%s (%s): %s", path, target, memory.summary())
+    return output_path
+
+
+# Function to translate again only the cells recorded in the failure log of an earlier translate_file run
+def retry_failed_file(path, output_dir=None, source_language=None, backend=BACKEND_V2, **options):
+    """
+    Reads the output of `path` and its failure log, re-sends just the failed
+    cells and rewrites the output. The log then keeps the cells that failed
+    again, or is removed. Returns that FailureLog.
+    """
+    output_path = output_path_for(path, output_dir)
+    log_path = failure_log_path(output_path)
+    failures = FailureLog.load(log_path)
+    if not failures:
+        logger.info("%s: no failed cells to retry", path)
+        return failures
+    if not output_path.endswith(('.xlsx', '.csv')):
+        raise ValueError(f"Failed cells can only be retried for spreadsheets: {path}")
+
+    filled, remaining = _retranslate_failures(failures, source_language, backend, **options)
+    # The output is rewritten next to itself and then replaced, so an interrupted retry leaves it intact
+    retry_path = f'{output_path}.retry'
+    _fill_output(output_path, retry_path, filled, csv=output_path.endswith('.csv'))
+    os.replace(retry_path, output_path)
+    remaining.save(log_path)
+    logger.info("%s: retried %d failed cells, %s", path, len(failures), remaining.summary())
+    return remaining
@@ -0,0 +1,150 @@
+"""
+Translation memory imported from the output of an earlier run.
+
+Recurring exports mostly repeat the rows of the previous period. The
+(source, translation) pairs of a previous run are taken either from its
+translated workbook aligned cell by cell with its input workbook, or, by
+source text, from translated columns next to their source columns. These
+pairs answer the texts they know before the translation cache is consulted,
+so only new or changed texts are sent for translation. They are never written
+into the shared cache: a previous output may come from anywhere and must not
+decide the translations of later runs.
+"""
+import logging
+import os
+import threading
+
+import pandas as pd
+
+from cell_filters import is_translatable
+from csv_streaming import read_csv
+
+logger = logging.getLogger(__name__)
+
+# Cells of a previous output that hold an error message instead of a translation
+ERROR_PREFIXES = ('Error:', 'Translation Error:')
+
+# Source and translation columns written side by side, with the language of the translation
+# e.g. Simple_Translator.py translates the 'Verbatim' column into English
+TRANSLATION_COLUMN_PAIRS = (('Verbatim', 'Translation', 'en'),)
+
+
+# Function to read every sheet of a workbook or CSV file, given as a path or file-like object with a `name`
+def read_sheets(file):
+    name = file if isinstance(file, str) else file.name
+    if name.endswith('.csv'):
+        return {'Sheet1': read_csv(file)}
+    return pd.read_excel(file, sheet_name=None)
+
+
+# Function to decide whether a pair of cells can be reused as a translation
+def _usable_pair(source, translation):
+    return (
+        is_translatable(source) and isinstance(translation, str) and translation.strip() != ''
+        and not translation.startswith(ERROR_PREFIXES)
+    )
+
+
+# Function to pair the cells of an input workbook with the cells of its translated output by sheet, column and row
+def aligned_pairs(source_sheets, translated_sheets):
+    """
+    Cells that came out unchanged are left out: they were not translated,
+    or were already in the target language and cost little to send again.
+    """
+    pairs = {}
+    for sheet_name, source_df in source_sheets.items():
+        translated_df = translated_sheets.get(sheet_name)
+        if translated_df is None:
+            continue
+        rows = min(len(source_df), len(translated_df))
+        for column in source_df.columns:
+            if column not in translated_df.columns:
+                continue
+            sources = source_df[column].to_numpy(dtype=object)[:rows]
+            translations = translated_df[column].to_numpy(dtype=object)[:rows]
+            for source, translation in zip(sources, translations):
+                if source != translation and _usable_pair(source, translation):
+                    pairs[str(source)] = translation
+    return pairs
+
+
+# Function to pair translated columns with their source columns in the same sheet, row by row
+def column_pairs(sheets, target_language):
+    """
+    Recognizes '<column> (<target language>)' columns written for several
+    target languages, and the TRANSLATION_COLUMN_PAIRS conventions that
+    translate into `target_language`.
+    """
+    pairs = {}
+    for df in sheets.values():
+        column_names = {str(column): column for column in df.columns}
+        candidates = [(column, f'{column} ({target_language})') for column in column_names]
+        candidates.extend(
+            (source_column, translation_column)
+            for source_column, translation_column, language in TRANSLATION_COLUMN_PAIRS
+            if language == target_language
+        )
+        for source_column, translation_column in candidates:
+            if source_column not in column_names or translation_column not in column_names:
+                continue
+            sources = df[column_names[source_column]].to_numpy(dtype=object)
+            translations = df[column_names[translation_column]].to_numpy(dtype=object)
+            for source, translation in zip(sources, translations):
+                if _usable_pair(source, translation):
+                    pairs[str(source)] = translation
+    return pairs
+
+
+class TranslationMemory:
+    """
+    Translations of an earlier run, keyed by source text, and a tally of how
+    many of the distinct texts of the new run it covered.
+    """
+
+    def __init__(self, pairs=None):
+        self.pairs = dict(pairs or {})
+        self.reused = 0
+        self.new = 0
+        # Texts already counted, so a text repeated across the chunks of a streamed file counts once
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.pairs)
+
+    # Function to look up the texts this memory knows, as {text: translation}
+    def get_many(self, texts):
+        return {text: self.pairs[text] for text in texts if isinstance(text, str) and text in self.pairs}
+
+    # Function to count which distinct texts of the new run were reused and which were new or changed
+    def track(self, texts):
+        with self._lock:
+            texts = set(texts) - self._seen
+            self._seen.update(texts)
+            reused = sum(1 for text in texts if text in self.pairs)
+            self.reused += reused
+            self.new += len(texts) - reused
+
+    def summary(self):
+        total = self.reused + self.new
+        share = self.reused / total if total else 0.0
+        return (
+            f"{self.reused} of {total} distinct texts reused from the previous translation ({share:.0%}), "
+            f"{self.new} new or changed"
+        )
+
+
+# Function to build a translation memory from a previous translated output and, optionally, its input
+def load_translation_memory(previous_output, previous_input=None, target_language='en'):
+    """
+    With `previous_input`, the two workbooks are aligned by sheet, column and
+    row. Translated columns next to their sources in `previous_output` are
+    always picked up by source text.
+    """
+    translated_sheets = read_sheets(previous_output)
+    pairs = column_pairs(translated_sheets, target_language)
+    if previous_input is not None:
+        pairs.update(aligned_pairs(read_sheets(previous_input), translated_sheets))
+    name = previous_output if isinstance(previous_output, str) else previous_output.name
+    logger.info("Loaded %d translations from %s", len(pairs), os.path.basename(name))
+    return TranslationMemory(pairs)
@@ -0,0 +1,82 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from cell_filters import select_text_columns, translatable_mask
+
+logger = logging.getLogger(__name__)
+
+
+class TranslationPlan:
+    """
+    The distinct strings of a set of sheets and columns. `uniques` holds each
+    string once, `codes` points every translated cell at its entry in `uniques`,
+    and `slots` records which (sheet, column, cell mask) owns which range of
+    `codes`. Cells outside the masks are passed through untouched.
+    """
+
+    def __init__(self, uniques, codes, slots, skipped_cells=0):
+        self.uniques = uniques
+        self.codes = codes
+        self.slots = slots
+        self.skipped_cells = skipped_cells
+
+    @property
+    def total_cells(self):
+        return len(self.codes)
+
+    @property
+    def dedup_ratio(self):
+        return self.total_cells / len(self.uniques) if len(self.uniques) else 1.0
+
+    def summary(self):
+        return (
+            f"{self.total_cells} text cells, {len(self.uniques)} distinct values to translate "
+            f"(dedup ratio {self.dedup_ratio:.1f}x), {self.skipped_cells} non-text cells skipped"
+        )
+
+
+# Function to collect the distinct strings of the selected sheets and columns before any API traffic
+def build_translation_plan(sheets, columns=None, include=(), exclude=()):
+    """
+    `sheets` maps sheet names to DataFrames; `columns` optionally maps sheet
+    names to the columns to consider (all columns by default). Only free-text
+    cells are planned; `include` and `exclude` name columns to always or never
+    translate, overriding the automatic detection.
+    """
+    pieces = []
+    slots = []
+    offset = 0
+    skipped_cells = 0
+    for sheet_name, df in sheets.items():
+        candidates = df[list(columns[sheet_name])] if columns and sheet_name in columns else df
+        selected = dict(select_text_columns(candidates, include, exclude))
+        for column in df.columns:
+            if column not in selected:
+                skipped_cells += len(df)
+                continue
+            mask = translatable_mask(df[column], force=selected[column])
+            skipped_cells += len(mask) - int(mask.sum())
+            if not mask.any():
+                continue
+            values = df[column][mask].astype(str).to_numpy(dtype=object)
+            slots.append((sheet_name, column, mask, offset, offset + len(values)))
+            pieces.append(values)
+            offset += len(values)
+
+    all_values = np.concatenate(pieces) if pieces else np.array([], dtype=object)
+    codes, uniques = pd.factorize(all_values)
+    plan = TranslationPlan(uniques, codes, slots, skipped_cells)
+    logger.info("Translation plan: %s", plan.summary())
+    return plan
+
+
+# Function to broadcast the translations of the distinct strings back into the sheets
+def apply_translation_plan(plan, sheets, translated_uniques):
+    translated = np.asarray(translated_uniques, dtype=object)[plan.codes]
+    for sheet_name, column, mask, start, stop in plan.slots:
+        values = sheets[sheet_name][column].to_numpy(dtype=object, copy=True)
+        values[mask] = translated[start:stop]
+        sheets[sheet_name][column] = values
+    return sheets
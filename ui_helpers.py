@@ -0,0 +1,223 @@
+import hashlib
+import time
+
+import pandas as pd
+import streamlit as st
+
+from checkpoint import open_checkpoint
+from failure_log import failure_log_path
+from job_registry import JOB_CANCELLED, JOB_FAILED, get_job_registry
+from metrics import get_metrics
+from translation_engine import extract_text_from_file
+
+# Number of translated results kept per browser session
+MAX_SESSION_RESULTS = 5
+
+# Seconds between refreshes of the page while background jobs are running
+JOB_POLL_SECONDS = 2
+
+# Rows of a sheet and lines of a text shown per preview page
+PREVIEW_PAGE_ROWS = 50
+PREVIEW_PAGE_LINES = 200
+
+
+# Function to fingerprint an uploaded file by content, so reruns and re-uploads of the same file share results
+def uploaded_file_hash(uploaded_file):
+    return hashlib.sha256(uploaded_file.getvalue()).hexdigest()
+
+
+# Function to parse an uploaded file once per content hash instead of on every rerun
+# The parsed sheets are shared, not copied on every rerun: callers only read them and copy what they translate
+@st.cache_resource(show_spinner=False, max_entries=8)
+def cached_extract_text_from_file(file_hash, _uploaded_file):
+    _uploaded_file.seek(0)
+    return extract_text_from_file(_uploaded_file)
+
+
+# Function to compute the shape and per-column statistics of a sheet once per preview key
+def _column_stats(df, key):
+    stats = st.session_state.setdefault('preview_stats', {})
+    if key not in stats:
+        non_empty = df.count()
+        stats[key] = pd.DataFrame({
+            'column': [str(column) for column in df.columns],
+            'type': [str(dtype) for dtype in df.dtypes],
+            'non-empty': non_empty.to_numpy(),
+            'empty': (len(df) - non_empty).to_numpy(),
+            'distinct': df.nunique(dropna=True).to_numpy(),
+        })
+        while len(stats) > MAX_SESSION_RESULTS * 4:
+            stats.pop(next(iter(stats)))
+    return stats[key]
+
+
+# Function to preview a sheet one page at a time with its shape and column statistics
+def render_sheet_preview(df, key, page_rows=PREVIEW_PAGE_ROWS):
+    """
+    Only the rows of the visible page are converted and sent to the browser.
+    `key` identifies the sheet, e.g. file hash and sheet name, and must be
+    unique on the page.
+    """
+    pages = max(1, -(-len(df) // page_rows))
+    st.caption(f"{len(df)} rows × {len(df.columns)} columns")
+    if st.toggle("Column statistics", key=f'{key}_stats'):
+        st.dataframe(_column_stats(df, key), hide_index=True)
+    page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f'{key}_page') if pages > 1 else 1
+    start = (page - 1) * page_rows
+    # Converting only the page to text keeps mixed-type columns displayable without copying the sheet
+    st.dataframe(df.iloc[start:start + page_rows].astype(str))
+
+
+# Function to preview a long text one page of lines at a time
+def render_text_preview(label, text, key, page_lines=PREVIEW_PAGE_LINES):
+    lines = text.split('\n')
+    pages = max(1, -(-len(lines) // page_lines))
+    st.caption(f"{len(lines)} lines, {len(text)} characters")
+    page = st.number_input(f"Page (of {pages})", 1, pages, 1, key=f'{key}_page') if pages > 1 else 1
+    start = (page - 1) * page_lines
+    st.text_area(label, '\n'.join(lines[start:start + page_lines]), height=300, disabled=True)
+
+
+# Function to look up a translated result of this session
+def get_result(key):
+    return st.session_state.setdefault('translation_results', {}).get(key)
+
+
+# Function to remember a translated result so reruns and downloads cost no API calls
+def store_result(key, value):
+    results = st.session_state.setdefault('translation_results', {})
+    results.pop(key, None)
+    results[key] = value
+    while len(results) > MAX_SESSION_RESULTS:
+        results.pop(next(iter(results)))
+
+
+# Function to open the checkpoint of a translation job and tell the user when it resumes
+def open_job_checkpoint(file_hash, settings):
+    checkpoint = open_checkpoint(file_hash, settings)
+    if checkpoint.completed:
+        st.info(f"Resuming an interrupted translation: {len(checkpoint.completed)} texts were already translated.")
+    return checkpoint
+
+
+# Function to reserve a sidebar panel for the pipeline metrics
+def metrics_panel():
+    with st.sidebar.expander("Performance metrics"):
+        return st.empty()
+
+
+# Function to show the timing, API usage and cost metrics of this server process in a panel
+def render_metrics(panel):
+    metrics = get_metrics()
+    with panel.container():
+        st.caption(
+            f"{metrics.counter_total('api_requests')} API requests, "
+            f"{metrics.counter_total('api_characters')} characters sent, "
+            f"{metrics.counter_total('api_retries')} retries, "
+            f"cache {metrics.counter_total('cache_hits')} hits / {metrics.counter_total('cache_misses')} misses, "
+            f"estimated cost ${metrics.counter_total('estimated_cost_usd'):.2f}"
+        )
+        stages = metrics.stage_summary()
+        if stages:
+            st.dataframe(pd.DataFrame(stages), hide_index=True)
+
+
+# Function to offer the metrics for download in the formats our dashboards read
+def metrics_downloads():
+    metrics = get_metrics()
+    with st.sidebar:
+        st.download_button(
+            "Download metrics (JSON)", metrics.to_json(), file_name='translation_metrics.json', mime='application/json'
+        )
+        st.download_button(
+            "Download metrics (Prometheus)", metrics.to_prometheus(), file_name='translation_metrics.prom', mime='text/plain'
+        )
+
+
+# Function to start a background job once per result key of this session; a failed or cancelled job can be resubmitted
+def submit_job(result_key, name, run, total=0):
+    registry = get_job_registry()
+    job_ids = st.session_state.setdefault('translation_jobs', {})
+    job = registry.get(job_ids.get(result_key))
+    if job is None or job.status in (JOB_FAILED, JOB_CANCELLED):
+        job = registry.submit(name, run, total)
+        job_ids[result_key] = job.id
+    return job
+
+
+# Function to list the jobs started by this browser session, newest first; other sessions' jobs stay private
+def session_jobs():
+    registry = get_job_registry()
+    job_ids = set(st.session_state.setdefault('translation_jobs', {}).values())
+    return [job for job in registry.jobs() if job.id in job_ids]
+
+
+# Function to show the background jobs of this session with progress, previews, downloads and cancel buttons
+def render_jobs():
+    registry = get_job_registry()
+    jobs = session_jobs()
+    if not jobs:
+        return
+    st.subheader("Translation jobs")
+    for job in jobs:
+        with st.expander(job.name, expanded=not job.finished_state):
+            st.progress(job.progress, text=job.describe())
+            if job.summary:
+                st.info(job.summary)
+            if isinstance(job.preview, str):
+                st.text(job.preview)
+            elif isinstance(job.preview, dict):
+                for sheet_name, df in job.preview.items():
+                    st.caption(str(sheet_name))
+                    st.dataframe(df)
+
+            if not job.finished_state:
+                cancel_column, partial_column = st.columns(2)
+                if cancel_column.button("Cancel", key=f'cancel_job_{job.id}'):
+                    job.cancel()
+                if partial_column.button("Prepare partial download", key=f'partial_job_{job.id}'):
+                    job.request_partial()
+            elif st.button("Remove", key=f'remove_job_{job.id}'):
+                registry.remove(job.id)
+                continue
+
+            output = job.result or job.partial_result
+            if output is not None:
+                file_name, data, mime = output
+                st.download_button(
+                    label="Download Translated File" if job.result else "Download Partial Output",
+                    data=data,
+                    file_name=file_name if job.result else f'partial_{file_name}',
+                    mime=mime,
+                    key=f'download_job_{job.id}',
+                )
+
+            if job.failures:
+                retry = render_failures(
+                    job.failures, job.result[0] if job.result else job.name, f'job_{job.id}',
+                    can_retry=bool(job.result and job.retry),
+                )
+                if retry:
+                    retry_job = registry.submit(f'{job.name} (retry)', job.retry, total=len(job.failures))
+                    st.session_state['translation_jobs'][('retry', job.id)] = retry_job.id
+
+
+# Function to show the failed cells of a result with a download of their log; returns True when a retry is asked for
+def render_failures(failures, file_name, key, can_retry=True):
+    st.warning(failures.summary())
+    log_column, retry_column = st.columns(2)
+    log_column.download_button(
+        label="Download Failure Log",
+        data=failures.to_jsonl().encode('utf-8'),
+        file_name=failure_log_path(file_name),
+        mime='application/jsonl',
+        key=f'failures_{key}',
+    )
+    return can_retry and retry_column.button("Retry failed cells", key=f'retry_{key}')
+
+
+# Function to rerun the page after a short wait while this session's jobs are running, so their progress stays current
+def poll_jobs():
+    if any(not job.finished_state for job in session_jobs()):
+        time.sleep(JOB_POLL_SECONDS)
+        st.rerun()